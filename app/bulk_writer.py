@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import threading
+import time
+
+from app.db import engine as default_engine
+from app.log import get_logger
+from app.metrics import WRITE_BEHIND_DROPPED, timed
+
+log = get_logger("bulk_writer")
+
+# column order of the tuples handed to WriteBehindWriter.add()
+COPY_COLUMNS = {
+    "match_events": ["match_id", "ts", "minute", "event_type", "team", "player", "payload"],
+    "player_events": ["match_id", "ts", "minute", "player", "team", "stat_type", "value", "payload"],
+    "predictions": [
+        "match_id", "ts", "model_version", "p_home_win", "p_draw", "p_away_win", "features", "explanation"
+    ],
+}
+
+class WriteBehindWriter:
+    '''
+    buffers rows in memory and writes them with PostgreSQL COPY ... FROM STDIN
+    (psycopg 3) from a background thread, whenever flush_rows are buffered or
+    flush_interval_sec has passed. memory is bounded by max_rows: add() blocks
+    until the flusher catches up (backpressure) and raises TimeoutError if it
+    can't within the timeout. close() flushes whatever is left. A batch that
+    still fails after max_retries is dropped and counted in rows_dropped and
+    the write_behind_rows_dropped_total metric.
+    JSON columns must be passed already serialized (json.dumps).
+    '''
+    def __init__(self, engine = default_engine, flush_rows: int = 5000, flush_interval_sec: float = 0.5,
+                 max_rows: int = 50000, max_retries: int = 3):
+        self.engine = engine
+        self.flush_rows = flush_rows
+        self.flush_interval_sec = flush_interval_sec
+        self.max_rows = max_rows
+        self.max_retries = max_retries
+
+        self._buf: dict[str, list[tuple]] = {}
+        self._n = 0  # rows buffered + rows in the flush currently running
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flush_requested = False
+        self._thread = threading.Thread(target = self._run, name = "write-behind", daemon = True)
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.flushes = 0
+
+    def start(self) -> "WriteBehindWriter":
+        self._thread.start()
+        return self
+
+    def add(self, table: str, row: tuple, timeout: float | None = 30.0) -> None:
+        self.add_many(table, [row], timeout)
+
+    def add_many(self, table: str, rows: list[tuple], timeout: float | None = 30.0) -> None:
+        if not rows:
+            return
+        if table not in COPY_COLUMNS:
+            raise ValueError(f"no COPY layout for table {table}")
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("writer is closed")
+            if not self._cond.wait_for(lambda: self._n + len(rows) <= self.max_rows or self._n == 0, timeout):
+                raise TimeoutError(f"write-behind buffer full ({self._n} rows)")
+            self._buf.setdefault(table, []).extend(rows)
+            self._n += len(rows)
+            if self._n >= self.flush_rows:
+                self._cond.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        # wake the flusher and wait until everything buffered so far is written.
+        # True only if every row ever added made it to the DB: False on timeout or once any batch was dropped
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            done = self._cond.wait_for(lambda: self._n == 0, timeout)
+            return done and self.rows_dropped == 0
+
+    def close(self, timeout: float = 10.0) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or self._flush_requested or self._n >= self.flush_rows,
+                    self.flush_interval_sec,
+                )
+                # this write covers everything buffered so far, including what flush() waits for
+                self._flush_requested = False
+                batches, self._buf = self._buf, {}
+                n = sum(len(rows) for rows in batches.values())
+                closed = self._closed
+
+            if n:
+                self._write(batches, n)
+                with self._cond:
+                    self._n -= n
+                    self._cond.notify_all()
+            if closed and n == 0:
+                return
+
+    def _write(self, batches: dict[str, list[tuple]], n: int):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                with timed("db_copy", items = n):
+                    self._copy(batches)
+                self.rows_written += n
+                self.flushes += 1
+                return
+            except Exception:
+                log.exception(f"COPY of {n} rows failed (attempt {attempt}/{self.max_retries})")
+                time.sleep(min(2.0, 0.1 * 2 ** attempt))
+        self.rows_dropped += n
+        for table, rows in batches.items():
+            WRITE_BEHIND_DROPPED.labels(table).inc(len(rows))
+        log.error(f"dropping {n} rows after {self.max_retries} failed COPY attempts")
+
+    def _copy(self, batches: dict[str, list[tuple]]):
+        conn = self.engine.raw_connection()
+        try:
+            cur = conn.driver_connection.cursor()
+            for table, rows in batches.items():
+                cols = ", ".join(COPY_COLUMNS[table])
+                with cur.copy(f"COPY {table} ({cols}) FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
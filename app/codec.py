@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+import json
+import struct
+
+try:
+    import orjson
+except ImportError:  # plain json fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Kafka header naming the codec of a message value. messages without it are json.
+CODEC_HEADER = "x-codec"
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, value: dict) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(value)
+        return json.dumps(value).encode("utf-8")
+
+    def decode(self, payload: bytes) -> dict:
+        if orjson is not None:
+            return orjson.loads(payload)
+        return json.loads(payload.decode("utf-8"))
+
+# Schema v1 of the binary codec. Known map keys are sent as their index in FIELDS_V1
+# and known string values as a 2-byte ext (code 1) indexing STRINGS_V1; anything
+# else goes through as plain msgpack. Both tables are append-only within a version;
+# reordering or removing entries needs a new version (and a new codec name).
+FIELDS_V1 = (
+    "match_id", "ts", "minute", "event_type", "team_side", "team", "player", "payload",
+    "home_team", "away_team", "competition", "stat_type", "value", "xg",
+    "model_version", "probs", "HOME_WIN", "DRAW", "AWAY_WIN", "features",
+    "explanation", "explanation_status", "rag_citations", "doc_id", "doc_type", "meta",
+    "goal_diff", "xg_diff", "shot_diff", "corner_diff", "foul_diff",
+    "home_xg", "away_xg", "home_shots", "away_shots", "uncertainty",
+)
+STRINGS_V1 = (
+    "home", "away", "UEFA",
+    "kickoff", "shot", "goal", "foul", "corner",
+    "xg", "pass", "tackle",
+    "pending", "ready", "historical_match",
+    "Real Madrid", "Barcelona", "Man City", "Arsenal", "Bayern",
+    "PSG", "Inter", "Milan", "Atletico", "Dortmund",
+    "Striker A", "Winger B", "Mid C", "Def D", "GK E", "Striker F", "Winger G", "Mid H",
+)
+
+_EXT_STRING = 1
+_EXT_UTC_TS = 2  # "ts" values in UTC isoformat, as int64 microseconds since the epoch
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+class MsgpackCodec:
+    def __init__(self, version: int = 1, fields: tuple = FIELDS_V1, strings: tuple = STRINGS_V1):
+        if msgpack is None:
+            raise RuntimeError("the msgpack codec needs the msgpack package")
+        self.name = f"msgpack-v{version}"
+        self.fields = fields
+        self.field_ids = {f: i for i, f in enumerate(fields)}
+        self.strings = strings
+        # prebuilt ext objects, so interning a string is one dict lookup
+        self.string_exts = {s: msgpack.ExtType(_EXT_STRING, struct.pack(">H", i)) for i, s in enumerate(strings)}
+
+    def _pack_value(self, v):
+        if isinstance(v, str):
+            return self.string_exts.get(v, v)
+        if isinstance(v, dict):
+            return self._pack_map(v)
+        if isinstance(v, list):
+            return [self._pack_value(x) for x in v]
+        return v
+
+    def _pack_map(self, d: dict) -> dict:
+        out = {}
+        for k, v in d.items():
+            if k == "ts" and isinstance(v, str) and v.endswith("+00:00"):
+                micros = (datetime.fromisoformat(v) - _EPOCH) // _MICROSECOND
+                v = msgpack.ExtType(_EXT_UTC_TS, micros.to_bytes(8, "big", signed=True))
+            else:
+                v = self._pack_value(v)
+            out[self.field_ids.get(k, k)] = v
+        return out
+
+    def _ext_hook(self, code: int, data: bytes):
+        if code == _EXT_STRING:
+            return self.strings[int.from_bytes(data, "big")]
+        if code == _EXT_UTC_TS:
+            return (_EPOCH + timedelta(microseconds=int.from_bytes(data, "big", signed=True))).isoformat()
+        return msgpack.ExtType(code, data)
+
+    def _unpack_map(self, pairs) -> dict:
+        fields = self.fields
+        return {fields[k] if isinstance(k, int) else k: v for k, v in pairs}
+
+    def encode(self, value: dict) -> bytes:
+        return msgpack.packb(self._pack_map(value), use_bin_type=True)
+
+    def decode(self, payload: bytes) -> dict:
+        return msgpack.unpackb(
+            payload, raw=False, strict_map_key=False,
+            ext_hook=self._ext_hook, object_pairs_hook=self._unpack_map,
+        )
+
+_codecs: dict[str, object] = {"json": JsonCodec()}
+
+def get_codec(name: str):
+    codec = _codecs.get(name)
+    if codec is None:
+        if name == "msgpack-v1":
+            codec = MsgpackCodec(1, FIELDS_V1, STRINGS_V1)
+        else:
+            raise ValueError(f"unknown codec {name!r}")
+        _codecs[name] = codec
+    return codec
+
+def codec_name_from_headers(headers) -> str:
+    for k, v in headers or ():
+        if k == CODEC_HEADER and v is not None:
+            return v.decode("ascii") if isinstance(v, bytes) else v
+    return "json"
@@ -11,6 +11,8 @@ class Settings(BaseModel):
     topic_player_events: str = os.getenv("TOPIC_PLAYER_EVENTS", "player_events")
     topic_predictions: str = os.getenv("TOPIC_PREDICTIONS", "match_predictions")
     consumer_group: str = os.getenv("CONSUMER_GROUP", "fantasy_ai_group")
+    # value codec for produced messages: json | msgpack-v1 (consumers read both)
+    kafka_codec: str = os.getenv("KAFKA_CODEC", "json")
 
     # Postgres
     pg_host: str = os.getenv("PG_HOST", "localhost")
@@ -29,8 +31,68 @@ class Settings(BaseModel):
 
 
     rag_top_k: int = int(os.getenv("RAG_TOP_K", "5"))
+    rag_index_backend: str = os.getenv("RAG_INDEX_BACKEND", "sparse")  # sparse | dense
+    rag_index_refresh_sec: float = float(os.getenv("RAG_INDEX_REFRESH_SEC", "30"))
+
+    # Explanations (async = LLM calls run on a background pool, off the ingest path)
+    explain_async: bool = os.getenv("EXPLAIN_ASYNC", "1") == "1"
+    explain_workers: int = int(os.getenv("EXPLAIN_WORKERS", "4"))
+    explain_queue_size: int = int(os.getenv("EXPLAIN_QUEUE_SIZE", "256"))
+
+    # Explanation cache (quantized match situation + retrieved docs -> explanation)
+    explain_cache_enabled: bool = os.getenv("EXPLAIN_CACHE_ENABLED", "1") == "1"
+    explain_cache_ttl_sec: int = int(os.getenv("EXPLAIN_CACHE_TTL_SEC", "900"))
+    explain_cache_max_entries: int = int(os.getenv("EXPLAIN_CACHE_MAX_ENTRIES", "2048"))
+    explain_cache_minute_bucket: int = int(os.getenv("EXPLAIN_CACHE_MINUTE_BUCKET", "5"))
+    explain_cache_xg_step: float = float(os.getenv("EXPLAIN_CACHE_XG_STEP", "0.5"))
+    explain_cache_prob_step: float = float(os.getenv("EXPLAIN_CACHE_PROB_STEP", "0.05"))
+
+    # Partition-parallel workers (scripts/consumer_supervisor.py)
+    consumer_workers: int = int(os.getenv("CONSUMER_WORKERS", "3"))
+    state_flush_ms: int = int(os.getenv("STATE_FLUSH_MS", "1000"))
+
+    # Event persistence: orm = insert in the consume transaction, copy = write-behind COPY
+    event_writer: str = os.getenv("EVENT_WRITER", "orm")
+    write_behind_flush_rows: int = int(os.getenv("WRITE_BEHIND_FLUSH_ROWS", "5000"))
+    write_behind_flush_ms: int = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "500"))
+    write_behind_max_rows: int = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "50000"))
+
+    # Prometheus metrics listener in the consumer (workers use METRICS_PORT + worker_id); 0 = off
+    metrics_port: int = int(os.getenv("METRICS_PORT", "9450"))
+
+    # Live prediction push (WebSocket/SSE) from the API's predictions consumer
+    live_stream_enabled: bool = os.getenv("LIVE_STREAM_ENABLED", "1") == "1"
+    live_stream_queue_size: int = int(os.getenv("LIVE_STREAM_QUEUE_SIZE", "64"))
+    live_stream_heartbeat_sec: float = float(os.getenv("LIVE_STREAM_HEARTBEAT_SEC", "15"))
+
+    # In-process near-cache of latest predictions in the API, fed by the live stream
+    near_cache_enabled: bool = os.getenv("NEAR_CACHE_ENABLED", "1") == "1"
+    near_cache_ttl_sec: float = float(os.getenv("NEAR_CACHE_TTL_SEC", "30"))
+    near_cache_max_entries: int = int(os.getenv("NEAR_CACHE_MAX_ENTRIES", "5000"))
+    near_cache_max_mb: float = float(os.getenv("NEAR_CACHE_MAX_MB", "64"))
+
+    # Daily partitions of match_events / player_events / predictions (scripts/partition_maintenance.py)
+    partition_days_ahead: int = int(os.getenv("PARTITION_DAYS_AHEAD", "7"))
+    # 0 = keep forever. Dropped events are gone for backfill_predictions / export_training_set
+    retention_days: int = int(os.getenv("RETENTION_DAYS", "0"))
+    archive_dir: str = os.getenv("ARCHIVE_DIR", "archive")  # empty = drop without exporting
+    predictions_downsample_after_days: int = int(os.getenv("PREDICTIONS_DOWNSAMPLE_AFTER_DAYS", "0"))  # 0 = off
+    predictions_downsample_sec: int = int(os.getenv("PREDICTIONS_DOWNSAMPLE_SEC", "60"))
+
+    # On-demand sampling profiler (SIGUSR2 on the consumer, POST /admin/profile on the API)
+    profile_dir: str = os.getenv("PROFILE_DIR", "profiles")
+    profile_seconds: float = float(os.getenv("PROFILE_SECONDS", "30"))
+    profile_interval_ms: float = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    # admin endpoints are disabled while this is empty
+    admin_token: str = os.getenv("ADMIN_TOKEN", "")
 
     # Prediction cadence
     predict_every_n_events: int = int(os.getenv("PREDICT_EVERY_N_EVENTS", "25"))
 
+    # Consumer batching (batch size 1 = legacy one-event-at-a-time loop)
+    consumer_batch_size: int = int(os.getenv("CONSUMER_BATCH_SIZE", "200"))
+    consumer_batch_max_wait_ms: int = int(os.getenv("CONSUMER_BATCH_MAX_WAIT_MS", "50"))
+    # events are held this long to restore per-match timestamp order across the two topics
+    reorder_window_ms: int = int(os.getenv("REORDER_WINDOW_MS", "50"))
+
 settings = Settings()
@@ -0,0 +1,76 @@
+'''
+training data on disk as a directory of Parquet chunks (part-00000.parquet, ...)
+with the FEATURE_COLUMNS plus an int "label" column. Chunks are written and read
+one at a time, so dataset size is bounded by disk, not memory. Written by
+scripts/train_xgb.py (synthetic) and scripts/export_training_set.py (from
+Postgres); read back as an xgboost.DataIter for QuantileDMatrix / external
+memory training.
+'''
+from __future__ import annotations
+import glob
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xgboost as xgb
+
+from app.features import FEATURE_COLUMNS
+
+LABEL_COLUMN = "label"
+
+def chunk_path(out_dir: str, i: int) -> str:
+    return os.path.join(out_dir, f"part-{i:05d}.parquet")
+
+def write_chunk(path: str, X: np.ndarray, y: np.ndarray, extra: dict | None = None,
+                metadata: dict[str, str] | None = None) -> None:
+    # extra: more columns stored alongside (e.g. match_id, ts), ignored by read_chunk.
+    # metadata: key/values kept in the file's schema, written atomically with the rows
+    cols = {c: X[:, j] for j, c in enumerate(FEATURE_COLUMNS)}
+    cols[LABEL_COLUMN] = y.astype(np.int32)
+    cols.update(extra or {})
+    tmp = path + ".tmp"
+    pq.write_table(pa.table(cols, metadata = metadata), tmp, compression = "zstd")
+    os.replace(tmp, path)
+
+def chunk_metadata(path: str) -> dict[str, str]:
+    meta = pq.read_schema(path).metadata or {}
+    return {k.decode(): v.decode() for k, v in meta.items()}
+
+def chunk_paths(data_dir: str) -> list[str]:
+    paths = sorted(glob.glob(os.path.join(data_dir, "part-*.parquet")))
+    if not paths:
+        raise FileNotFoundError(f"no part-*.parquet files in {data_dir}")
+    return paths
+
+def read_chunk(path: str) -> tuple[np.ndarray, np.ndarray]:
+    t = pq.read_table(path, columns = FEATURE_COLUMNS + [LABEL_COLUMN])
+    X = np.column_stack([t.column(c).to_numpy() for c in FEATURE_COLUMNS]).astype(np.float32)
+    y = t.column(LABEL_COLUMN).to_numpy().astype(np.int32)
+    return X, y
+
+def chunk_rows(paths: list[str]) -> int:
+    # from the Parquet footers, without reading the data
+    return sum(pq.ParquetFile(p).metadata.num_rows for p in paths)
+
+class ChunkIter(xgb.DataIter):
+    '''
+    feeds the Parquet chunks to XGBoost one at a time. With QuantileDMatrix the
+    data is sketched and stored quantized (~1 byte per value) in memory; with
+    cache_prefix set, XGBoost pages it to disk instead (external memory).
+    '''
+    def __init__(self, paths: list[str], cache_prefix: str | None = None):
+        self.paths = paths
+        self._i = 0
+        super().__init__(cache_prefix = cache_prefix)
+
+    def next(self, input_data) -> bool:
+        if self._i == len(self.paths):
+            return False
+        X, y = read_chunk(self.paths[self._i])
+        input_data(data = X, label = y)
+        self._i += 1
+        return True
+
+    def reset(self) -> None:
+        self._i = 0
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+# Local, no-download, fixed-dim embeddings
+# (HashingVectorizer is fast and doesn't need fit() / training.)
+VECTOR_DIM = 768
+_vectorizer = HashingVectorizer(
+    n_features=VECTOR_DIM,
+    alternate_sign=False,
+    norm="l2",
+    ngram_range=(1, 2),
+)
+
+def embed_text(text: str) -> list[float]:
+    v = _vectorizer.transform([text]).toarray().astype(np.float32)[0]
+    return v.tolist()
+
+def embed_texts_sparse(texts: list[str]) -> sparse.csr_matrix:
+    # (n_texts, VECTOR_DIM); only a few dozen buckets per row are non-zero
+    m = _vectorizer.transform(texts).astype(np.float32)
+    m.sort_indices()
+    return m
+
+def embed_text_sparse(text: str) -> tuple[list[int], list[float]]:
+    # (bucket indices, values) -- the storage format of RagDoc.embedding_idx / embedding_val
+    m = embed_texts_sparse([text])
+    return m.indices.tolist(), m.data.tolist()
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import threading
+import time
+
+from app.config import settings
+from app.redis_cache import r
+
+def situation_key(state: dict, probs: dict, doc_ids: list[int]) -> str:
+    '''
+    quantized match situation + retrieved docs. snapshots that land in the same
+    buckets get the same explanation. team names stay in the key because the
+    LLM text refers to them.
+    '''
+    minute_bucket = int(state.get("minute", 0)) // settings.explain_cache_minute_bucket
+    xg_step = settings.explain_cache_xg_step
+    xg_diff = round((float(state.get("home_xg", 0.0)) - float(state.get("away_xg", 0.0))) / xg_step) * xg_step
+    p_step = settings.explain_cache_prob_step
+    p = "/".join(str(round(probs[c] / p_step)) for c in ("HOME_WIN", "DRAW", "AWAY_WIN"))
+    return (
+        f"expl:v1:{state.get('home_team', '')}|{state.get('away_team', '')}"
+        f":m{minute_bucket}:{int(state.get('home_goals', 0))}-{int(state.get('away_goals', 0))}"
+        f":xg{xg_diff:+.2f}:p{p}:d{','.join(str(i) for i in doc_ids)}"
+    )
+
+class ExplanationCache:
+    '''
+    two-level cache for LLM explanations: an in-process LRU in front of Redis.
+    entries expire after ttl_sec in both levels; the local level also evicts the
+    least recently used entry past max_entries.
+    '''
+    def __init__(self, max_entries: int = 2048, ttl_sec: int = 900, redis_client = r):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.redis = redis_client
+        self._local: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    def _get_local(self, key: str) -> str | None:
+        with self._lock:
+            item = self._local.get(key)
+            if item is None:
+                return None
+            expires_at, text = item
+            if expires_at < time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return text
+
+    def _set_local(self, key: str, text: str, ttl_sec: float) -> None:
+        with self._lock:
+            self._local[key] = (time.time() + ttl_sec, text)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last = False)
+
+    def get(self, key: str) -> str | None:
+        text = self._get_local(key)
+        if text is not None:
+            self.hits_local += 1
+            return text
+
+        pipe = self.redis.pipeline(transaction = False)
+        pipe.get(key)
+        pipe.ttl(key)
+        text, ttl = pipe.execute()
+        if text is not None:
+            self.hits_redis += 1
+            self._set_local(key, text, ttl if ttl and ttl > 0 else self.ttl_sec)
+            return text
+
+        self.misses += 1
+        return None
+
+    def set(self, key: str, text: str) -> None:
+        self._set_local(key, text, self.ttl_sec)
+        self.redis.set(key, text, ex = self.ttl_sec)
+
+    def stats(self) -> dict:
+        hits = self.hits_local + self.hits_redis
+        total = hits + self.misses
+        return {
+            "hits_local": self.hits_local,
+            "hits_redis": self.hits_redis,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "local_entries": len(self._local),
+        }
+
+explanation_cache = ExplanationCache(settings.explain_cache_max_entries, settings.explain_cache_ttl_sec)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import queue
+import threading
+
+from app.config import settings
+from app.db import SessionLocal
+from app.kafka_io import send_json
+from app.log import get_logger
+from app.metrics import EXPLANATIONS, timed
+from app.models import Prediction
+from app.rag_explain import explain_prediction
+from app.redis_cache import set_latest_prediction_if_ts
+
+log = get_logger("explain_worker")
+
+@dataclass
+class ExplainJob:
+    prediction_id: int
+    prompt: str
+    probs: dict
+    out: dict  # the payload already published for this prediction
+    situation: dict | None = None  # match state, enables the explanation cache
+
+class ExplanationWorker:
+    '''
+    bounded pool of threads that produce LLM explanations off the ingest path.
+    the prediction is published first with explanation=None; once the LLM answers,
+    the explanation is written onto the existing Prediction row and the payload is
+    re-published to the predictions topic with explanation_status="ready".
+    submit() never blocks: when the queue is full the job is dropped.
+    '''
+    def __init__(self, prod, n_workers: int = 2, queue_size: int = 256):
+        self.prod = prod
+        self.q: queue.Queue = queue.Queue(maxsize = queue_size)
+        self.threads = [
+            threading.Thread(target = self._run, name = f"explain-{i}", daemon = True)
+            for i in range(n_workers)
+        ]
+        self.done = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self) -> "ExplanationWorker":
+        for t in self.threads:
+            t.start()
+        return self
+
+    def submit(self, job: ExplainJob) -> bool:
+        try:
+            self.q.put_nowait(job)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            EXPLANATIONS.labels("dropped").inc()
+            return False
+
+    def close(self, timeout: float = 5.0) -> None:
+        for _ in self.threads:
+            try:
+                self.q.put(None, timeout = timeout)
+            except queue.Full:
+                break
+        for t in self.threads:
+            t.join(timeout)
+
+    def _run(self):
+        while True:
+            job = self.q.get()
+            if job is None:
+                return
+            try:
+                self._handle(job)
+                self.done += 1
+                EXPLANATIONS.labels("done").inc()
+            except Exception:
+                self.failed += 1
+                EXPLANATIONS.labels("failed").inc()
+                log.exception(f"explanation failed for prediction_id={job.prediction_id}")
+
+    def _handle(self, job: ExplainJob):
+        db = SessionLocal()
+        try:
+            explanation, citations = explain_prediction(
+                db, job.prompt, job.probs, k = settings.rag_top_k, situation = job.situation
+            )
+            with timed("db_update"):
+                (
+                    db.query(Prediction)
+                    .filter(Prediction.id == job.prediction_id)
+                    .update({Prediction.explanation: explanation}, synchronize_session = False)
+                )
+                db.commit()
+        finally:
+            db.close()
+
+        out = dict(job.out, explanation = explanation, rag_citations = citations, explanation_status = "ready")
+
+        # don't clobber a newer prediction that landed while the LLM was thinking (checked and set in one step)
+        set_latest_prediction_if_ts(out["match_id"], out)
+        with timed("kafka_publish"):
+            send_json(self.prod, settings.topic_predictions, out, key = out["match_id"])
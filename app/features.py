@@ -1,6 +1,13 @@
 from __future__ import annotations 
 from dataclasses import dataclass
 import math 
+import numpy as np
+
+# column order the model was trained with
+FEATURE_COLUMNS = [
+    "minute","goal_diff","xg_diff","shot_diff","corner_diff","foul_diff",
+    "home_xg","away_xg","home_shots","away_shots","uncertainty"
+]
 
 @dataclass 
 class LiveFeatures: 
@@ -57,4 +64,50 @@ def to_model_row(f: LiveFeatures) -> dict:
         "home_shots": f.home_shots,
         "away_shots": f.away_shots,
         "uncertainty": uncertainty,
-    }
\ No newline at end of file
+    }
+
+# columns to_model_row() returns as ints; the others are floats
+INT_FEATURE_COLUMNS = {"minute", "goal_diff", "shot_diff", "corner_diff", "foul_diff", "home_shots", "away_shots"}
+
+def row_from_matrix(x) -> dict:
+    # one rows_to_matrix() / features_from_state_arrays() row back into a to_model_row() dict, same types
+    return {c: int(v) if c in INT_FEATURE_COLUMNS else float(v) for c, v in zip(FEATURE_COLUMNS, x)}
+
+def rows_to_matrix(rows: list[dict]) -> np.ndarray:
+    # stack to_model_row() outputs into one (n, len(FEATURE_COLUMNS)) float32 array
+    return np.array([[r[c] for c in FEATURE_COLUMNS] for r in rows], dtype=np.float32).reshape(-1, len(FEATURE_COLUMNS))
+
+# state fields build_features_from_state reads, for the array form below
+STATE_FIELDS = [
+    "minute","home_goals","away_goals","home_shots","away_shots","home_xg","away_xg",
+    "home_corners","away_corners","home_fouls","away_fouls"
+]
+
+def features_from_state_arrays(s: dict[str, np.ndarray]) -> np.ndarray:
+    '''
+    to_model_row() over many states at once: each value of `s` is an array with
+    one entry per state (missing fields count as 0). returns the same
+    (n, len(FEATURE_COLUMNS)) float32 matrix rows_to_matrix() would.
+    '''
+    n = len(next(iter(s.values()))) if s else 0
+    col = {f: np.asarray(s[f], dtype=np.float64) if f in s else np.zeros(n) for f in STATE_FIELDS}
+    # build_features_from_state truncates the counters to int
+    for f in STATE_FIELDS:
+        if f not in ("home_xg", "away_xg"):
+            col[f] = np.trunc(col[f])
+
+    time_norm = np.clip(col["minute"], 0, 95) / 95.0
+    out = {
+        "minute": col["minute"],
+        "goal_diff": col["home_goals"] - col["away_goals"],
+        "xg_diff": col["home_xg"] - col["away_xg"],
+        "shot_diff": col["home_shots"] - col["away_shots"],
+        "corner_diff": col["home_corners"] - col["away_corners"],
+        "foul_diff": col["home_fouls"] - col["away_fouls"],
+        "home_xg": col["home_xg"],
+        "away_xg": col["away_xg"],
+        "home_shots": col["home_shots"],
+        "away_shots": col["away_shots"],
+        "uncertainty": np.exp(-2.0 * time_norm),
+    }
+    return np.column_stack([out[c] for c in FEATURE_COLUMNS]).astype(np.float32).reshape(-1, len(FEATURE_COLUMNS))
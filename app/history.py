@@ -0,0 +1,111 @@
+'''
+replaying stored match history. Streams match_events + player_events for a set
+of matches out of Postgres and rebuilds the live consumer's state at each
+snapshot point with the same fold functions (app/state.py) and features
+(features.features_from_state_arrays). Used by scripts/backfill_predictions.py
+and scripts/export_training_set.py.
+
+The matches to replay go in a temp table replay_matches (id, home_team,
+away_team, seq); events come back grouped per match in seq order.
+
+player_events.minute only exists since it was added for this replay; older
+player events come back without a minute and fold like a live event that had
+none (the match minute carries over), so state rebuilt for those matches can
+lag the live consumer's minute slightly.
+'''
+from __future__ import annotations
+import json
+from typing import Iterator
+
+import numpy as np
+from sqlalchemy import text
+
+from app.features import STATE_FIELDS, features_from_state_arrays
+from app.state import update_state_with_match_event, update_state_with_player_event
+
+# select_sql: SELECT id, home_team, away_team, <sort key> AS seq_key FROM matches m ...
+REPLAY_MATCHES_SQL = """
+CREATE TEMP TABLE replay_matches AS
+SELECT id, home_team, away_team, ROW_NUMBER() OVER (ORDER BY seq_key, id) AS seq
+FROM ({select_sql}) s
+"""
+
+# one row per event, both tables interleaved in (match, ts) order
+EVENTS_SQL = """
+SELECT r.seq, ev.match_id, r.home_team, r.away_team, ev.ts, ev.kind, ev.id, ev.minute,
+       ev.type, ev.team, ev.value, ev.payload
+FROM (
+    SELECT e.match_id, e.ts, 0 AS kind, e.id, e.minute, e.event_type AS type, e.team,
+           NULL::double precision AS value, e.payload::text AS payload
+    FROM match_events e
+    WHERE e.match_id IN (SELECT id FROM replay_matches)
+    UNION ALL
+    SELECT p.match_id, p.ts, 1 AS kind, p.id, p.minute, p.stat_type, p.team,
+           p.value, p.payload::text
+    FROM player_events p
+    WHERE p.match_id IN (SELECT id FROM replay_matches)
+) ev
+JOIN replay_matches r ON r.id = ev.match_id
+ORDER BY r.seq, ev.ts, ev.kind, ev.id
+"""
+
+def create_replay_matches(conn, select_sql: str, params: dict) -> list[tuple]:
+    # fills replay_matches from select_sql; returns its rows (id, home_team, away_team, seq) in seq order
+    conn.execute(text("DROP TABLE IF EXISTS replay_matches"))
+    conn.execute(text(REPLAY_MATCHES_SQL.format(select_sql = select_sql)), params)
+    return conn.execute(text("SELECT id, home_team, away_team, seq FROM replay_matches ORDER BY seq")).all()
+
+def event_dict(row, home: str, away: str) -> tuple[str, dict]:
+    # the DB keeps the team name; the fold functions want the side
+    side = "home" if row.team == home else "away" if row.team == away else None
+    payload = json.loads(row.payload) if row.payload else {}
+    if row.kind == 0:
+        ev = {"event_type": row.type, "team_side": side, "payload": payload}
+        if row.minute is not None:
+            ev["minute"] = row.minute
+        return "match", ev
+    ev = {"stat_type": row.type, "team_side": side, "value": row.value or 0.0, "payload": payload}
+    if row.minute is not None:
+        ev["minute"] = row.minute
+    return "player", ev
+
+def iter_match_events(conn, fetch_rows: int = 20_000) -> Iterator[tuple[str, list[tuple[str, dict]], list]]:
+    '''
+    streams EVENTS_SQL with a server-side cursor; yields (match_id, events, ts
+    list) per match that has events, in replay_matches.seq order. Only one
+    match's events are held at a time.
+    '''
+    result = conn.execution_options(stream_results = True, yield_per = fetch_rows).execute(text(EVENTS_SQL))
+    cur, events, ts_list = None, [], []
+    for row in result:
+        if row.match_id != cur:
+            if cur is not None:
+                yield cur, events, ts_list
+            cur, events, ts_list = row.match_id, [], []
+        events.append(event_dict(row, row.home_team, row.away_team))
+        ts_list.append(row.ts)
+    if cur is not None:
+        yield cur, events, ts_list
+
+def snapshot_points(events: list[tuple[str, dict]], every: int) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    fold a match's events one by one into per-event deltas, accumulate them into
+    the state after every event, and keep the states where n_events hits a
+    multiple of `every` (where the live consumer predicts). returns (event
+    indices, feature matrix).
+    '''
+    n = len(events)
+    idx = np.arange(every - 1, n, every)
+    if len(idx) == 0:
+        return idx, np.empty((0, 0), dtype = np.float32)
+
+    deltas = {f: np.zeros(n) for f in STATE_FIELDS}
+    for i, (kind, ev) in enumerate(events):
+        d = update_state_with_match_event({}, ev) if kind == "match" else update_state_with_player_event({}, ev)
+        for f, v in d.items():
+            if f in deltas:
+                deltas[f][i] = v
+
+    states = {f: np.cumsum(deltas[f])[idx] for f in STATE_FIELDS if f != "minute"}
+    states["minute"] = np.maximum.accumulate(deltas["minute"])[idx]
+    return idx, features_from_state_arrays(states)
@@ -1,6 +1,12 @@
-import json
-from confluent_kafka import Producer, Consumer, KafkaException
+import os
+import uuid
+from confluent_kafka import Producer, Consumer, KafkaException, Message
+from app.codec import CODEC_HEADER, codec_name_from_headers, get_codec
 from app.config import settings
+from app.log import get_logger
+from app.metrics import UNDECODABLE, timed
+
+log = get_logger("kafka_io")
 
 def make_producer() -> Producer:
     conf = {
@@ -9,27 +15,85 @@ def make_producer() -> Producer:
         "linger.ms": 5,
         "batch.num.messages": 1000,
         "enable.idempotence": False,  # can turn on later
+        # same key -> same partition, compatible with the Java clients' default
+        "partitioner": "murmur2_random",
     }
     return Producer(conf)
 
-def make_consumer(topic: str) -> Consumer:
+def make_consumer(topic: str | list[str], on_assign=None, on_revoke=None, auto_commit: bool = True) -> Consumer:
+    # auto_commit=False: the caller commits, once what it consumed is durable
     conf = {
         "bootstrap.servers": settings.kafka_bootstrap_servers,
         "group.id": settings.consumer_group,
         "auto.offset.reset": "latest",
-        "enable.auto.commit": True,
+        "enable.auto.commit": auto_commit,
         # low-latency polling
         "fetch.wait.max.ms": 25,
         "max.poll.interval.ms": 300000,
+        # range co-assigns partition N of every subscribed topic to the same member,
+        # so with match_id-keyed topics one consumer sees all events of a match
+        "partition.assignment.strategy": "range",
     }
     c = Consumer(conf)
+    topics = [topic] if isinstance(topic, str) else list(topic)
+    callbacks = {}
+    if on_assign is not None:
+        callbacks["on_assign"] = on_assign
+    if on_revoke is not None:
+        callbacks["on_revoke"] = on_revoke
+    c.subscribe(topics, **callbacks)
+    return c
+
+def make_lag_consumer() -> Consumer:
+    # same group.id as the pipeline consumers but never subscribes, so it can read the
+    # group's committed offsets without joining the group (and triggering a rebalance)
+    return Consumer({
+        "bootstrap.servers": settings.kafka_bootstrap_servers,
+        "group.id": settings.consumer_group,
+        "enable.auto.commit": False,
+    })
+
+def make_broadcast_consumer(topic: str) -> Consumer:
+    # a group per process: every instance receives every message, from "now" on,
+    # and nothing is committed (a restart resumes at the live edge)
+    c = Consumer({
+        "bootstrap.servers": settings.kafka_bootstrap_servers,
+        "group.id": f"{settings.consumer_group}-stream-{os.getpid()}-{uuid.uuid4().hex[:8]}",
+        "auto.offset.reset": "latest",
+        "enable.auto.commit": False,
+        "fetch.wait.max.ms": 25,
+    })
     c.subscribe([topic])
     return c
 
-def send_json(producer: Producer, topic: str, value: dict) -> None:
-    payload = json.dumps(value).encode("utf-8")
-    producer.produce(topic, payload)
-    producer.poll(0)  # serve delivery callbacks
+def send_json(producer: Producer, topic: str, value: dict, key: str | None = None, codec: str | None = None,
+              poll: bool = True) -> None:
+    # key by match_id so every event of a match goes to the same partition, in order.
+    # the codec is named in a header so consumers can decode mixed-version topics.
+    c = get_codec(codec or settings.kafka_codec)
+    producer.produce(
+        topic,
+        c.encode(value),
+        key=key.encode("utf-8") if key is not None else None,
+        headers=[(CODEC_HEADER, c.name.encode("ascii"))],
+    )
+    if poll:
+        producer.poll(0)  # serve delivery callbacks; high-rate callers poll every N sends instead
+
+def decode_message(msg: Message) -> dict:
+    return get_codec(codec_name_from_headers(msg.headers())).decode(msg.value())
+
+def decode_or_skip(msg: Message) -> dict | None:
+    # one bad message (unknown x-codec, corrupt value) is logged and skipped instead of killing the consumer
+    try:
+        return decode_message(msg)
+    except Exception as e:
+        UNDECODABLE.labels(msg.topic()).inc()
+        log.error(
+            f"skipping undecodable message {msg.topic()}[{msg.partition()}]@{msg.offset()} "
+            f"codec={codec_name_from_headers(msg.headers())!r}: {e!r}"
+        )
+        return None
 
 def poll_json(consumer: Consumer, timeout: float = 0.05) -> dict | None:
     msg = consumer.poll(timeout)
@@ -39,4 +103,37 @@ def poll_json(consumer: Consumer, timeout: float = 0.05) -> dict | None:
         # Ignore benign errors; raise the rest if you want strictness
         # raise KafkaException(msg.error())
         return None
-    return json.loads(msg.value().decode("utf-8"))
+    return decode_or_skip(msg)
+
+def poll_message(consumer: Consumer, timeout: float = 0.05) -> tuple[str, int, dict] | None:
+    # like poll_json, but keeps (topic, partition) for consumers subscribed to several topics
+    msg = consumer.poll(timeout)
+    if msg is None or msg.error():
+        return None
+    with timed("decode"):
+        ev = decode_or_skip(msg)
+    return None if ev is None else (msg.topic(), msg.partition(), ev)
+
+def consume_messages(consumer: Consumer, num_messages: int = 200, timeout: float = 0.05) -> list[tuple[str, int, dict]]:
+    # like consume_json, but keeps (topic, partition) for consumers subscribed to several topics
+    out = []
+    msgs = consumer.consume(num_messages=num_messages, timeout=timeout)
+    with timed("decode", items=len(msgs)):
+        for msg in msgs:
+            if msg.error():
+                continue
+            ev = decode_or_skip(msg)
+            if ev is not None:
+                out.append((msg.topic(), msg.partition(), ev))
+    return out
+
+def consume_json(consumer: Consumer, num_messages: int = 200, timeout: float = 0.05) -> list[dict]:
+    # returns as soon as num_messages are available or timeout expires
+    out = []
+    for msg in consumer.consume(num_messages=num_messages, timeout=timeout):
+        if msg.error():
+            continue
+        ev = decode_or_skip(msg)
+        if ev is not None:
+            out.append(ev)
+    return out
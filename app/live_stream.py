@@ -0,0 +1,134 @@
+from __future__ import annotations
+import asyncio
+from collections import deque
+import threading
+
+from app.config import settings
+from app.kafka_io import consume_json, make_broadcast_consumer
+from app.log import get_logger
+
+log = get_logger("live_stream")
+
+class Subscription:
+    '''
+    one connected client. Holds at most `maxsize` pending updates; when the client
+    falls behind, the oldest update is dropped (a newer prediction for the same
+    match supersedes it anyway) so a slow reader never holds memory or blocks
+    the fan-out. Only touched from the event loop.
+    '''
+    def __init__(self, match_ids: set[str], maxsize: int):
+        self.match_ids = match_ids
+        self.q: deque = deque(maxlen = maxsize)
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def put(self, pred: dict):
+        if len(self.q) == self.q.maxlen:
+            self.dropped += 1
+        self.q.append(pred)
+        self._ready.set()
+
+    async def get(self, timeout: float | None = None) -> dict | None:
+        # next update, or None if nothing arrived within timeout
+        if not self.q:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.q.popleft()
+
+class PredictionHub:
+    '''
+    per-match registry of subscriptions; publish() fans a prediction out to every
+    client watching its match. Lives on the event loop; the Kafka thread hands
+    batches over with call_soon_threadsafe.
+    '''
+    def __init__(self, queue_size: int = 64):
+        self.queue_size = queue_size
+        self.by_match: dict[str, set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, match_ids: list[str]) -> Subscription:
+        sub = Subscription(set(match_ids), self.queue_size)
+        for m in sub.match_ids:
+            self.by_match.setdefault(m, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        for m in sub.match_ids:
+            subs = self.by_match.get(m)
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                del self.by_match[m]
+
+    def publish(self, preds: list[dict]):
+        for pred in preds:
+            self.published += 1
+            for sub in self.by_match.get(pred.get("match_id"), ()):
+                sub.put(pred)
+                self.delivered += 1
+
+    def stats(self) -> dict:
+        subs = {s for group in self.by_match.values() for s in group}
+        return {
+            "matches": len(self.by_match),
+            "subscribers": len(subs),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": sum(s.dropped for s in subs),
+        }
+
+class PredictionStream:
+    '''
+    the API process's single consumer of the predictions topic. Runs on a daemon
+    thread and passes each decoded batch to every listener (called on that
+    thread). Uses a group of its own, so every API instance sees every prediction.
+    '''
+    def __init__(self, topic: str | None = None):
+        self.topic = topic or settings.topic_predictions
+        self.listeners: list = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add_listener(self, fn) -> None:
+        self.listeners.append(fn)
+
+    def start(self) -> "PredictionStream":
+        self._thread = threading.Thread(target = self._run, name = "prediction-stream", daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        c = make_broadcast_consumer(self.topic)
+        try:
+            while not self._stop.is_set():
+                try:
+                    preds = consume_json(c, 500, 0.5)
+                except Exception:
+                    log.exception("predictions consume failed")
+                    self._stop.wait(1.0)
+                    continue
+                if not preds:
+                    continue
+                for fn in self.listeners:
+                    try:
+                        fn(preds)
+                    except Exception:
+                        log.exception("prediction listener failed")
+        finally:
+            c.close()
+
+def hub_listener(hub: PredictionHub, loop: asyncio.AbstractEventLoop):
+    # stream thread -> event loop hand-off for the hub
+    def listener(preds: list[dict]):
+        loop.call_soon_threadsafe(hub.publish, preds)
+    return listener
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from contextlib import contextmanager
+import time
+
+from confluent_kafka import Consumer, TopicPartition
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+
+# 100us .. 10s: covers a Redis round trip at the bottom and an LLM call at the top
+_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Time spent per pipeline stage (per call; batched stages observe once per batch)",
+    ["stage"],
+    buckets = _BUCKETS,
+)
+STAGE_ITEMS = Counter(
+    "pipeline_stage_items_total",
+    "Items (events, rows, predictions) handled per pipeline stage",
+    ["stage"],
+)
+EVENTS_CONSUMED = Counter("consumer_events_total", "Events consumed", ["topic"])
+PREDICTIONS = Counter("consumer_predictions_total", "Predictions published")
+EXPLANATIONS = Counter("explanations_total", "Explanation jobs by outcome", ["outcome"])
+UNDECODABLE = Counter(
+    "consumer_undecodable_messages_total",
+    "Messages skipped because their value could not be decoded (unknown codec, corrupt payload)",
+    ["topic"],
+)
+WRITE_BEHIND_DROPPED = Counter(
+    "write_behind_rows_dropped_total",
+    "Rows the write-behind writer gave up on after max_retries failed COPYs",
+    ["table"],
+)
+CONSUMER_LAG = Gauge(
+    "consumer_lag_messages",
+    "High watermark minus committed/current offset per partition",
+    ["topic", "partition"],
+)
+
+@contextmanager
+def timed(stage: str, items: int = 1):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - t0)
+        if items:
+            STAGE_ITEMS.labels(stage).inc(items)
+
+def observe(stage: str, seconds: float, items: int = 1):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    if items:
+        STAGE_ITEMS.labels(stage).inc(items)
+
+def start_metrics_server(port: int) -> bool:
+    # port <= 0 disables the listener
+    if port <= 0:
+        return False
+    start_http_server(port)
+    return True
+
+def render_latest() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def update_consumer_lag(consumer: Consumer) -> None:
+    '''
+    lag of the partitions this consumer owns, from its fetch position and the
+    high watermark librdkafka caches from fetch responses (no broker round trip).
+    '''
+    parts = consumer.assignment()
+    if not parts:
+        return
+    for tp in consumer.position(parts):
+        _, hi = consumer.get_watermark_offsets(tp, cached = True)
+        if hi < 0 or tp.offset < 0:
+            continue  # nothing fetched yet
+        CONSUMER_LAG.labels(tp.topic, str(tp.partition)).set(max(0, hi - tp.offset))
+
+def update_group_lag(consumer: Consumer, topics: list[str], timeout: float = 2.0) -> None:
+    '''
+    lag of the whole consumer group as seen from outside (api_server): committed
+    offsets vs. high watermarks for every partition. `consumer` must be created
+    with the group's group.id but must not subscribe, so it never joins the group.
+    '''
+    md = consumer.list_topics(timeout = timeout)
+    parts = [
+        TopicPartition(t, p)
+        for t in topics if t in md.topics
+        for p in md.topics[t].partitions
+    ]
+    if not parts:
+        return
+    for tp in consumer.committed(parts, timeout = timeout):
+        _, hi = consumer.get_watermark_offsets(tp, timeout = timeout)
+        if hi < 0 or tp.offset < 0:
+            continue  # no committed offset yet
+        CONSUMER_LAG.labels(tp.topic, str(tp.partition)).set(max(0, hi - tp.offset))
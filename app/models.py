@@ -13,6 +13,7 @@ class Match(Base):
     status = Column(String, nullable = False, default = "scheduled") #status is scheduled, live, or finished 
     final_home_goals = Column(Integer, nullable = True)
     final_away_goals = Column(Integer, nullable = True)
+    finished_at = Column(DateTime(timezone = True), nullable = True, index = True) #when the final score was set; export_training_set stamps it if the writer did not
     created_at = Column(DateTime(timezone = True), server_default = func.now())
 
 class MatchEvent(Base):
@@ -34,6 +35,7 @@ class PlayerEvent(Base):
     id = Column(Integer, primary_key = True, autoincrement = True)
     match_id = Column(String, index = True, nullable = False)
     ts = Column(DateTime(timezone = True), nullable = False)
+    minute = Column(Integer, nullable = True) #the live state fold uses it; history replay needs it too
     player = Column(String, nullable = False)
     team = Column(String, nullable = True)
     stat_type = Column(String, nullable = False) #xg, pass, tackle, shot, etc
@@ -44,7 +46,7 @@ class PlayerEvent(Base):
 class Prediction(Base):
     __tablename__ = "predictions"
     id = Column(Integer, primary_key = True, autoincrement = True)
-    match_id = Column(String, index = True, nullable = False)
+    match_id = Column(String, nullable = False) #covered by ix_predictions_match_ts_id
     ts = Column(DateTime(timezone = True), nullable = False)
     model_version = Column(String, nullable = False)
     p_home_win = Column(Float, nullable = False)
@@ -53,10 +55,16 @@ class Prediction(Base):
     features = Column(JSON, nullable = False, default = {})
     explanation = Column(Text, nullable = True)
 
+# latest / history lookups walk one match's rows newest-first; id breaks ts ties for keyset pagination
+Index("ix_predictions_match_ts_id", Prediction.match_id, Prediction.ts.desc(), Prediction.id.desc())
+
 class RagDoc(Base):
     '''
     this is a vector store without using pgvector 
-    store embeddings as a float and do cosine in python at the time of the query
+    embeddings are sparse hashed n-gram vectors, stored as parallel arrays of
+    bucket indices + values (embedding_idx / embedding_val). older rows may only
+    have the dense `embedding` array. app/rag_store keeps them in memory and
+    does the cosine at query time
 
     '''
     __tablename__ = "rag_docs"
@@ -66,4 +74,6 @@ class RagDoc(Base):
     text = Column(Text, nullable = False)
     meta = Column(JSON, nullable = False, default = {})
     embedding = Column(ARRAY(Float), nullable = True) #length depends on the model (above)
+    embedding_idx = Column(ARRAY(Integer), nullable = True) #non-zero buckets, ascending
+    embedding_val = Column(ARRAY(Float), nullable = True) #values for embedding_idx
     created_at = Column(DateTime(timezone = True), server_default=func.now())
@@ -0,0 +1,96 @@
+from __future__ import annotations
+from collections import OrderedDict
+import json
+import threading
+import time
+
+class NearCache:
+    '''
+    in-process cache of latest predictions (match_id -> payload) for the API
+    server, in front of Redis. Entries are replaced by the predictions stream as
+    soon as a newer prediction is published, so the TTL only bounds staleness
+    while the stream is down. Past max_entries or max_bytes (approximate, from
+    the payload's JSON size) the least recently used entries are evicted.
+    A payload never replaces a cached one with a newer ts.
+    '''
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 64 * 1024 * 1024, ttl_sec: float = 30.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_sec = ttl_sec
+        # match_id -> (expires_at, ts, size, payload)
+        self._entries: OrderedDict[str, tuple[float, str, int, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.updates = 0
+
+    def get(self, match_id: str) -> dict | None:
+        with self._lock:
+            item = self._entries.get(match_id)
+            if item is not None and item[0] < time.time():
+                self._remove(match_id)
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(match_id)
+            self.hits += 1
+            return item[3]
+
+    def get_many(self, match_ids: list[str]) -> dict[str, dict]:
+        out = {}
+        for m in match_ids:
+            pred = self.get(m)
+            if pred is not None:
+                out[m] = pred
+        return out
+
+    def put(self, pred: dict) -> bool:
+        # False if an equal-or-newer prediction is already cached
+        match_id = pred.get("match_id")
+        if not match_id:
+            return False
+        ts = pred.get("ts") or ""
+        size = len(json.dumps(pred))
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.get(match_id)
+            # same ts = the re-published prediction with its explanation attached, keep that one
+            if old is not None and old[1] > ts:
+                return False
+            if old is not None:
+                self._remove(match_id)
+            self._entries[match_id] = (time.time() + self.ttl_sec, ts, size, pred)
+            self.bytes += size
+            self.updates += 1
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def put_many(self, preds: list[dict]) -> None:
+        for pred in preds:
+            self.put(pred)
+
+    def _remove(self, match_id: str) -> None:
+        _, _, size, _ = self._entries.pop(match_id)
+        self.bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "evictions": self.evictions,
+            "updates": self.updates,
+        }
@@ -0,0 +1,337 @@
+'''
+daily range partitioning of the append-only tables (match_events, player_events,
+predictions) on ts, plus the retention side: export a partition to Parquet,
+then drop it. Postgres only; the ORM models stay unpartitioned so the rest of
+the code (and SQLite in scripts/bench_pipeline.py) doesn't notice.
+
+Partitioned tables need the partition key in every unique constraint, so the
+primary key on Postgres is (id, ts) while the models keep id alone; ids still
+come from one sequence per table.
+
+Partitions are named <table>_pYYYYMMDD and cover [day, day + 1) in UTC. Each
+table also gets a <table>_default partition so an event with an unexpected ts
+is stored instead of failing the whole consumer batch.
+'''
+from __future__ import annotations
+from datetime import date, datetime, time, timedelta, timezone
+import json
+import os
+import re
+
+from sqlalchemy import JSON, DateTime, Float, Integer, MetaData, PrimaryKeyConstraint, String, Text, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.log import get_logger
+from app.models import Match, MatchEvent, PlayerEvent, Prediction
+
+log = get_logger("partitions")
+
+PARTITIONED_TABLES = {
+    "match_events": MatchEvent.__table__,
+    "player_events": PlayerEvent.__table__,
+    "predictions": Prediction.__table__,
+}
+
+_LOWER_RE = re.compile(r"FROM \('([^']+)'\)")
+_UPPER_RE = re.compile(r"TO \('([^']+)'\)")
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo = timezone.utc)
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+# ---------------------------------------------------------------- DDL
+
+def partitioned_ddl(table_name: str) -> list[str]:
+    '''
+    CREATE TABLE ... PARTITION BY RANGE (ts) + its indexes, rendered from the ORM
+    table so the columns can't drift from app/models.py.
+    '''
+    md = MetaData()
+    Match.__table__.to_metadata(md)  # foreign key target of match_events
+    t = PARTITIONED_TABLES[table_name].to_metadata(md)
+    t.c.ts.primary_key = True
+    t.primary_key = PrimaryKeyConstraint(t.c.id, t.c.ts)
+    t.c.id.autoincrement = True  # still SERIAL with a composite key
+    t.dialect_options["postgresql"]["partition_by"] = "RANGE (ts)"
+
+    dialect = postgresql.dialect()
+    stmts = [str(CreateTable(t).compile(dialect = dialect))]
+    stmts += [str(CreateIndex(ix).compile(dialect = dialect)) for ix in sorted(t.indexes, key = lambda ix: ix.name)]
+    return stmts
+
+def table_kind(conn: Connection, table_name: str) -> str | None:
+    # "partitioned", "plain", or None when the table doesn't exist
+    kind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:t)"), {"t": table_name}
+    ).scalar()
+    if kind is None:
+        return None
+    return "partitioned" if kind == "p" else "plain"
+
+def create_partitioned_table(conn: Connection, table_name: str) -> None:
+    for stmt in partitioned_ddl(table_name):
+        conn.execute(text(stmt))
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table_name}_default PARTITION OF {table_name} DEFAULT"))
+    log.info(f"created partitioned table {table_name}")
+
+def migrate_to_partitioned(conn: Connection, table_name: str, first_day: date) -> None:
+    '''
+    turn an existing unpartitioned table into a partitioned one without copying
+    rows: the old heap is renamed and attached as <table>_legacy covering
+    everything before first_day, and the new table's id sequence continues
+    after the old ids. Retention later archives and drops it like any other
+    partition once first_day is past the retention window.
+    Takes an ACCESS EXCLUSIVE lock on the table for the duration; run it with
+    the consumers stopped.
+    '''
+    legacy = f"{table_name}_legacy"
+    conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {legacy}"))
+    # index and sequence names are schema-wide; move the old ones out of the way
+    for (ix,) in conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :t"), {"t": legacy}):
+        conn.execute(text(f'ALTER INDEX "{ix}" RENAME TO "{ix}_legacy"'))
+    conn.execute(text(f"ALTER SEQUENCE IF EXISTS {table_name}_id_seq RENAME TO {table_name}_id_seq_legacy"))
+
+    create_partitioned_table(conn, table_name)
+
+    bound = _day_start(first_day).isoformat()
+    # a validated CHECK matching the bound lets ATTACH skip its own full scan
+    conn.execute(text(
+        f"ALTER TABLE {legacy} ADD CONSTRAINT {legacy}_ts_bound CHECK (ts IS NOT NULL AND ts < '{bound}') NOT VALID"
+    ))
+    conn.execute(text(f"ALTER TABLE {legacy} VALIDATE CONSTRAINT {legacy}_ts_bound"))
+    conn.execute(text(f"ALTER TABLE {table_name} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ('{bound}')"))
+    conn.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT {legacy}_ts_bound"))
+
+    conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{table_name}', 'id'), "
+        f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {legacy}), false)"
+    ))
+    conn.execute(text(f"DROP SEQUENCE IF EXISTS {table_name}_id_seq_legacy CASCADE"))
+    log.info(f"migrated {table_name} to daily partitions (old rows in {legacy})")
+
+def ensure_partitioned_tables(engine: Engine, migrate: bool = False) -> list[str]:
+    # returns the tables still left unpartitioned (existing heaps when migrate=False)
+    left = []
+    with engine.begin() as conn:
+        for name in PARTITIONED_TABLES:
+            kind = table_kind(conn, name)
+            if kind is None:
+                create_partitioned_table(conn, name)
+            elif kind == "plain":
+                if migrate:
+                    migrate_to_partitioned(conn, name, utc_today())
+                else:
+                    left.append(name)
+    return left
+
+def create_partition(conn: Connection, table_name: str, day: date) -> int:
+    '''
+    create <table>_pYYYYMMDD for day. Rows for that day already in the default
+    partition (maintenance lapsed for longer than the days ahead) would make
+    the CREATE fail, so they are moved into the new partition in the same
+    transaction. Returns the number of rows moved.
+    '''
+    part = partition_name(table_name, day)
+    lo, hi = _day_start(day).isoformat(), _day_start(day + timedelta(days = 1)).isoformat()
+    in_range = f"ts >= '{lo}' AND ts < '{hi}'"
+
+    moved = 0
+    if conn.execute(text(f"SELECT 1 FROM {table_name}_default WHERE {in_range} LIMIT 1")).first():
+        conn.execute(text(f"CREATE TEMP TABLE _moving (LIKE {table_name}) ON COMMIT DROP"))
+        moved = conn.execute(text(
+            f"WITH d AS (DELETE FROM {table_name}_default WHERE {in_range} RETURNING *) "
+            f"INSERT INTO _moving SELECT * FROM d"
+        )).rowcount
+    conn.execute(text(f"CREATE TABLE {part} PARTITION OF {table_name} FOR VALUES FROM ('{lo}') TO ('{hi}')"))
+    if moved:
+        conn.execute(text(f"INSERT INTO {table_name} SELECT * FROM _moving"))
+        log.info(f"moved {moved} rows from {table_name}_default into {part}")
+    return moved
+
+def ensure_partitions(engine: Engine, days_ahead: int = 7, days_back: int = 1) -> list[str]:
+    '''
+    create the daily partitions from today - days_back through today + days_ahead
+    that don't exist yet. Cheap and idempotent; run it at least daily. Each
+    partition is created in its own transaction, so one failure is logged and
+    doesn't hold back the others.
+    '''
+    created = []
+    today = utc_today()
+    with engine.connect() as conn:
+        missing = []
+        for name in PARTITIONED_TABLES:
+            if table_kind(conn, name) != "partitioned":
+                continue
+            ranges = [(lo, hi) for _, lo, hi in list_partitions(conn, name) if hi is not None]
+            for offset in range(-days_back, days_ahead + 1):
+                day = today + timedelta(days = offset)
+                start, end = _day_start(day), _day_start(day + timedelta(days = 1))
+                # already covered (by this day's partition, or by a migrated _legacy one)
+                if not any((lo is None or lo < end) and start < hi for lo, hi in ranges):
+                    missing.append((name, day))
+
+    for name, day in missing:
+        part = partition_name(name, day)
+        try:
+            with engine.begin() as conn:
+                create_partition(conn, name, day)
+            created.append(part)
+        except Exception as e:
+            log.error(f"could not create {part}: {e}")
+    if created:
+        log.info(f"created partitions: {', '.join(created)}")
+    return created
+
+# ---------------------------------------------------------------- retention
+
+def list_partitions(conn: Connection, table_name: str) -> list[tuple[str, datetime | None, datetime | None]]:
+    # (partition, lower bound, exclusive upper bound); lower is None for MINVALUE, both for the default partition
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t) ORDER BY c.relname"
+    ), {"t": table_name}).all()
+    out = []
+    for part, bound in rows:
+        lo, hi = _LOWER_RE.search(bound or ""), _UPPER_RE.search(bound or "")
+        out.append((
+            part,
+            datetime.fromisoformat(lo.group(1)) if lo else None,
+            datetime.fromisoformat(hi.group(1)) if hi else None,
+        ))
+    return out
+
+def _arrow_schema(table_name: str):
+    import pyarrow as pa
+
+    fields = []
+    for col in PARTITIONED_TABLES[table_name].columns:
+        if isinstance(col.type, Integer):
+            typ = pa.int64()
+        elif isinstance(col.type, Float):
+            typ = pa.float64()
+        elif isinstance(col.type, DateTime):
+            typ = pa.timestamp("us", tz = "UTC")
+        elif isinstance(col.type, (String, Text, JSON)):
+            typ = pa.string()  # JSON columns are kept as their JSON text
+        else:
+            raise TypeError(f"no Parquet type for {table_name}.{col.name}: {col.type!r}")
+        fields.append(pa.field(col.name, typ))
+    return pa.schema(fields)
+
+def archive_partition(engine: Engine, table_name: str, part: str, out_dir: str, chunk_rows: int = 50_000) -> tuple[str, int]:
+    '''
+    stream one partition into <out_dir>/<table>/<part>.parquet (zstd), through a
+    server-side cursor so memory stays at one chunk. Returns (path, rows).
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(table_name)
+    json_cols = {c.name for c in PARTITIONED_TABLES[table_name].columns if isinstance(c.type, JSON)}
+    names = schema.names
+
+    os.makedirs(os.path.join(out_dir, table_name), exist_ok = True)
+    path = os.path.join(out_dir, table_name, f"{part}.parquet")
+    tmp = path + ".tmp"
+
+    # the model's columns under the partition's name, so values come back typed
+    t = PARTITIONED_TABLES[table_name].to_metadata(MetaData(), name = part)
+    rows = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results = True, max_row_buffer = chunk_rows).execute(
+            select(*[t.c[n] for n in names]).order_by(t.c.ts, t.c.id)
+        )
+        with pq.ParquetWriter(tmp, schema, compression = "zstd") as writer:
+            for chunk in result.partitions(chunk_rows):
+                cols = {n: [r[i] for r in chunk] for i, n in enumerate(names)}
+                for n in json_cols:
+                    cols[n] = [None if v is None else json.dumps(v) for v in cols[n]]
+                writer.write_batch(pa.RecordBatch.from_pydict(cols, schema = schema))
+                rows += len(chunk)
+
+    if pq.ParquetFile(tmp).metadata.num_rows != rows:
+        raise RuntimeError(f"row count mismatch writing {tmp}")
+    os.replace(tmp, path)
+    return path, rows
+
+def drop_partition(engine: Engine, table_name: str, part: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {part}"))
+        conn.execute(text(f"DROP TABLE {part}"))
+
+def downsample_predictions(engine: Engine, part: str, every_sec: int) -> int:
+    '''
+    keep only the newest prediction per match per every_sec window of ts in one
+    predictions partition. The partition is marked with a table comment so
+    later runs skip it. Returns the number of rows deleted.
+    '''
+    marker = f"downsampled:{every_sec}"
+    with engine.begin() as conn:
+        if conn.execute(text("SELECT obj_description(to_regclass(:p), 'pg_class')"), {"p": part}).scalar() == marker:
+            return 0
+        deleted = conn.execute(text(
+            f"DELETE FROM {part} p USING ("
+            f"  SELECT id, ts, row_number() OVER ("
+            f"    PARTITION BY match_id, floor(extract(epoch FROM ts) / :every)"
+            f"    ORDER BY ts DESC, id DESC) AS rn"
+            f"  FROM {part}"
+            f") d WHERE p.id = d.id AND p.ts = d.ts AND d.rn > 1"
+        ), {"every": every_sec}).rowcount
+        conn.execute(text(f"COMMENT ON TABLE {part} IS '{marker}'"))
+    return deleted
+
+def apply_retention(
+    engine: Engine,
+    retain_days: int,
+    archive_dir: str | None,
+    downsample_after_days: int = 0,
+    downsample_every_sec: int = 60,
+    dry_run: bool = False,
+) -> dict:
+    '''
+    partitions entirely older than retain_days are archived to Parquet (unless
+    archive_dir is None) and dropped; predictions partitions older than
+    downsample_after_days are thinned to one row per match per
+    downsample_every_sec first. retain_days / downsample_after_days <= 0 disable
+    that step. The default partition is never touched.
+    '''
+    now = datetime.now(timezone.utc)
+    report = {"archived": [], "dropped": [], "downsampled": []}
+
+    with engine.connect() as conn:
+        parts = {name: list_partitions(conn, name) for name in PARTITIONED_TABLES if table_kind(conn, name) == "partitioned"}
+
+    for name, plist in parts.items():
+        for part, _, upper in plist:
+            if upper is None:
+                continue
+            age_days = (now - upper).total_seconds() / 86400.0
+
+            if retain_days > 0 and age_days >= retain_days:
+                if dry_run:
+                    report["dropped"].append(part)
+                    continue
+                if archive_dir:
+                    path, rows = archive_partition(engine, name, part, archive_dir)
+                    report["archived"].append({"partition": part, "path": path, "rows": rows})
+                    log.info(f"archived {part}: {rows} rows -> {path}")
+                drop_partition(engine, name, part)
+                report["dropped"].append(part)
+                log.info(f"dropped {part}")
+            elif name == "predictions" and downsample_after_days > 0 and age_days >= downsample_after_days:
+                if dry_run:
+                    report["downsampled"].append({"partition": part, "deleted": None})
+                    continue
+                deleted = downsample_predictions(engine, part, downsample_every_sec)
+                if deleted:
+                    report["downsampled"].append({"partition": part, "deleted": deleted})
+                    log.info(f"downsampled {part}: deleted {deleted} rows")
+    return report
@@ -0,0 +1,131 @@
+from __future__ import annotations
+from collections import Counter
+import os
+import signal
+import sys
+import threading
+import time
+
+from app.config import settings
+from app.log import get_logger
+
+log = get_logger("profiler")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    else:
+        path = os.path.basename(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    '''
+    wall-clock sampling profiler over every thread of the process: a background
+    thread snapshots sys._current_frames() every `interval_sec` and counts the
+    stacks. Nothing is hooked into the profiled code, so it can be attached to a
+    running process for a few seconds at a cost of roughly one stack walk per
+    thread per sample. Output is the collapsed-stack format read by flamegraph.pl
+    and speedscope ("thread;outer;...;inner count" per line).
+    '''
+    def __init__(self, interval_sec: float = 0.005, exclude: set[int] | None = None):
+        self.interval_sec = interval_sec
+        self.exclude = set(exclude or ())
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target = self._run, name = "sampling-profiler", daemon = True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        skip = self.exclude | {threading.get_ident()}
+        while not self._stop.wait(self.interval_sec):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in skip:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+def profile_for(seconds: float, interval_sec: float | None = None) -> SamplingProfiler:
+    # blocks the calling thread (left out of the samples) for `seconds`; the rest of the process keeps running
+    interval_sec = interval_sec if interval_sec is not None else settings.profile_interval_ms / 1000.0
+    prof = SamplingProfiler(interval_sec, exclude = {threading.get_ident()}).start()
+    try:
+        time.sleep(seconds)
+    finally:
+        prof.stop()
+    return prof
+
+def write_collapsed(prof: SamplingProfiler, name: str, out_dir: str | None = None) -> str:
+    out_dir = out_dir or settings.profile_dir
+    os.makedirs(out_dir, exist_ok = True)
+    path = os.path.join(out_dir, f"{name}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+    with open(path, "w") as f:
+        f.write(prof.collapsed())
+    return path
+
+# one capture per process at a time; overlapping samplers would skew each other
+_busy = threading.Lock()
+
+def capture(name: str, seconds: float) -> tuple[SamplingProfiler, str] | None:
+    '''
+    profile for `seconds` (blocking the caller) and write the collapsed stacks to
+    PROFILE_DIR. Returns None when a capture is already running.
+    '''
+    if not _busy.acquire(blocking = False):
+        return None
+    try:
+        prof = profile_for(seconds)
+        path = write_collapsed(prof, name)
+        log.info(f"profile written: {path} ({prof.samples} samples over {seconds:.0f}s)")
+        return prof, path
+    finally:
+        _busy.release()
+
+def capture_in_background(name: str, seconds: float) -> bool:
+    # capture() on a helper thread; safe to call from a signal handler
+    if _busy.locked():
+        return False
+
+    def run():
+        try:
+            capture(name, seconds)
+        except Exception:
+            log.exception("profile capture failed")
+
+    threading.Thread(target = run, name = "profile-capture", daemon = True).start()
+    return True
+
+def install_signal_handler(name: str, seconds: float, signum: int | None = None) -> bool:
+    # `kill -USR2 <pid>` starts a capture; returns False where SIGUSR2 doesn't exist (Windows)
+    signum = signum if signum is not None else getattr(signal, "SIGUSR2", None)
+    if signum is None:
+        return False
+
+    def handler(sig, frame):
+        if not capture_in_background(name, seconds):
+            log.warning("profile already in progress, ignoring signal")
+
+    signal.signal(signum, handler)
+    return True
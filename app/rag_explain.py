@@ -4,40 +4,22 @@ from __future__ import annotations
 from typing import Tuple, List
 import numpy as np
 from sqlalchemy.orm import Session
-from sklearn.feature_extraction.text import HashingVectorizer
 
 from app.models import RagDoc
 from app.llm_client import get_llm_client
-
-# Local, no-download, fixed-dim embeddings
-# (HashingVectorizer is fast and doesn't need fit() / training.)
-_VECTOR_DIM = 768
-_vectorizer = HashingVectorizer(
-    n_features=_VECTOR_DIM,
-    alternate_sign=False,
-    norm="l2",
-    ngram_range=(1, 2),
-)
-
-def embed_text(text: str) -> list[float]:
-    v = _vectorizer.transform([text]).toarray().astype(np.float32)[0]
-    return v.tolist()
+from app.embeddings import embed_text, embed_text_sparse
+from app.rag_store import top_k_similar
+from app.config import settings
+from app.explain_cache import explanation_cache, situation_key
+from app.metrics import timed
 
 def cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
     denom = (np.linalg.norm(a) * np.linalg.norm(b)) + 1e-9
     return float(np.dot(a, b) / denom)
 
 def retrieve_top_k(db: Session, query: str, k: int = 5) -> Tuple[List[RagDoc], List[dict]]:
-    q_emb = np.array(embed_text(query), dtype=np.float32)
-
-    docs = db.query(RagDoc).all()
-    scored = []
-    for d in docs:
-        d_emb = np.array(d.embedding, dtype=np.float32)
-        scored.append((cosine_sim(q_emb, d_emb), d))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
-    top = [d for _, d in scored[:k]]
+    with timed("rag_retrieval"):
+        top = top_k_similar(db, embed_text_sparse(query), k=k)
 
     citations = []
     for d in top:
@@ -48,9 +30,17 @@ def retrieve_top_k(db: Session, query: str, k: int = 5) -> Tuple[List[RagDoc], L
         })
     return top, citations
 
-def explain_prediction(db: Session, match_prompt: str, probs: dict, k: int = 5) -> tuple[str, list]:
+def explain_prediction(db: Session, match_prompt: str, probs: dict, k: int = 5, situation: dict | None = None) -> tuple[str, list]:
+    # situation is the match state behind match_prompt; when given, the explanation cache is used
     top_docs, citations = retrieve_top_k(db, match_prompt, k=k)
 
+    cache_key = None
+    if situation is not None and settings.explain_cache_enabled:
+        cache_key = situation_key(situation, probs, [d.id for d in top_docs])
+        cached = explanation_cache.get(cache_key)
+        if cached is not None:
+            return cached, citations
+
     context_lines = []
     for i, d in enumerate(top_docs, start=1):
         context_lines.append(f"[{i}] {d.text}")
@@ -71,5 +61,8 @@ def explain_prediction(db: Session, match_prompt: str, probs: dict, k: int = 5)
     )
 
     llm = get_llm_client()
-    text = llm.chat(system=system, user=user, max_tokens=350, temperature=0.2)
+    with timed("llm_call"):
+        text = llm.chat(system=system, user=user, max_tokens=350, temperature=0.2)
+    if cache_key is not None:
+        explanation_cache.set(cache_key, text)
     return text, citations
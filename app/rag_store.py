@@ -1,21 +1,237 @@
 from __future__ import annotations 
+import threading
+import time
 import numpy as np 
+from scipy import sparse
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
+from app.config import settings
+from app.embeddings import VECTOR_DIM
 from app.models import RagDoc 
 
-def cosine_sum(a: np.ndarray, b:np.ndarray) -> float:
-    na = np.linalg.norm(a)
-    nb = np.linalg.norm(b)
-    if na == 0 or nb == 0:
-        return 0.0
-    return float(np.dot(a,b) / (na * nb))
-
-def top_k_similar(session: Session, query_emb = list[float], k: int = 5) -> list[RagDoc]:
-    docs = session.query(RagDoc).filter(RagDoc.embedding.isnot(None)).all()
-    q = np.array(query_emb, dtype = np.float32)
-    scored = []
-    for d in docs:
-        v = np.array(d.embedding, dtype = np.float32)
-        scored.append((cosine_sum(q,v), d))
-    scored.sort(key = lambda x:x[0], reverse = True)
-    return [d for _,d in scored[:k]]
\ No newline at end of file
+def _normalize_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis = 1, keepdims = True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+def _to_sparse_rows(embeddings: list, n_features: int) -> sparse.csr_matrix:
+    '''
+    embeddings are either (indices, values) pairs or dense lists (legacy rows);
+    returns l2-normalized float32 csr rows
+    '''
+    indptr = [0]
+    indices, data = [], []
+    for e in embeddings:
+        if isinstance(e, tuple):
+            idx, val = np.asarray(e[0], dtype = np.int32), np.asarray(e[1], dtype = np.float32)
+        else:
+            dense = np.asarray(e, dtype = np.float32)
+            idx = np.flatnonzero(dense).astype(np.int32)
+            val = dense[idx]
+        norm = np.linalg.norm(val)
+        if norm > 0:
+            val = val / norm
+        indices.append(idx)
+        data.append(val)
+        indptr.append(indptr[-1] + len(idx))
+    m = sparse.csr_matrix(
+        (np.concatenate(data) if data else np.empty(0, dtype = np.float32),
+         np.concatenate(indices) if indices else np.empty(0, dtype = np.int32),
+         np.asarray(indptr)),
+        shape = (len(embeddings), n_features),
+        dtype = np.float32,
+    )
+    m.sum_duplicates()
+    return m
+
+def _load_new_rows(session: Session, after_id: int) -> tuple[list[int], list]:
+    rows = (
+        session.query(RagDoc.id, RagDoc.embedding_idx, RagDoc.embedding_val, RagDoc.embedding)
+        .filter(RagDoc.id > after_id)
+        .filter(or_(RagDoc.embedding_idx.isnot(None), RagDoc.embedding.isnot(None)))
+        .order_by(RagDoc.id)
+        .all()
+    )
+    ids, embs = [], []
+    for r in rows:
+        ids.append(r.id)
+        if r.embedding_idx is not None:
+            embs.append((r.embedding_idx, r.embedding_val))
+        else:
+            embs.append(r.embedding)
+    return ids, embs
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind = "stable")]
+    return np.argsort(-scores, kind = "stable")
+
+class _ResidentIndex:
+    # shared bookkeeping for the in-memory indexes below; they provide ids and add(ids, embeddings)
+    def __init__(self, n_features: int = VECTOR_DIM):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.n_features = n_features
+        self.max_id = 0
+        self.last_refresh = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def refresh(self, session: Session) -> int:
+        ids, embs = _load_new_rows(session, self.max_id)
+        self.add(ids, embs)
+        self.last_refresh = time.time()
+        return len(ids)
+
+    def maybe_refresh(self, session: Session, max_age_sec: float) -> None:
+        if time.time() - self.last_refresh < max_age_sec:
+            return
+        # one refresher at a time; everyone else keeps searching the current snapshot
+        if not self._refresh_lock.acquire(blocking = False):
+            return
+        try:
+            self.refresh(session)
+        finally:
+            self._refresh_lock.release()
+
+class RagIndex(_ResidentIndex):
+    '''
+    resident copy of the rag_docs embeddings as one l2-normalized float32 matrix,
+    so a query is a single matrix-vector product instead of a table scan.
+    refresh() only pulls rows with an id above the highest one already loaded.
+    ids and matrix live in one (ids, matrix) tuple that add() replaces whole;
+    a search reads it once, so it never pairs a new matrix with old ids.
+    '''
+    def __init__(self, n_features: int = VECTOR_DIM):
+        super().__init__(n_features)
+        self._snapshot = (np.empty(0, dtype = np.int64), np.empty((0, n_features), dtype = np.float32))
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._snapshot[0]
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._snapshot[1]
+
+    def add(self, ids: list[int], embeddings: list) -> None:
+        if not ids:
+            return
+        new = _to_sparse_rows(embeddings, self.n_features).toarray()
+        with self._lock:
+            old_ids, old_matrix = self._snapshot
+            self._snapshot = (
+                np.concatenate([old_ids, np.asarray(ids, dtype = np.int64)]),
+                np.vstack([old_matrix, new]),
+            )
+            self.max_id = max(self.max_id, int(max(ids)))
+
+    def search(self, query_emb, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+        ids, matrix = self._snapshot
+        if len(ids) == 0 or k <= 0:
+            return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.float32)
+
+        q = _to_sparse_rows([query_emb], self.n_features).toarray()[0]
+        scores = matrix @ q
+        top = _top_k(scores, k)
+        return ids[top], scores[top]
+
+class SparseRagIndex(_ResidentIndex):
+    '''
+    inverted index over the hashed n-gram buckets. postings are kept as a CSC
+    matrix (docs x buckets), so scoring a query only touches the documents that
+    share at least one non-zero bucket with it. search_batch() scores many
+    queries with a single scipy sparse product. Like RagIndex, ids, docs and
+    postings are published together as one (ids, docs, postings) tuple.
+    '''
+    def __init__(self, n_features: int = VECTOR_DIM):
+        super().__init__(n_features)
+        docs = sparse.csr_matrix((0, n_features), dtype = np.float32)
+        self._snapshot = (np.empty(0, dtype = np.int64), docs, docs.tocsc())
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._snapshot[0]
+
+    @property
+    def docs(self) -> sparse.csr_matrix:
+        return self._snapshot[1]
+
+    @property
+    def postings(self) -> sparse.csc_matrix:
+        return self._snapshot[2]
+
+    def add(self, ids: list[int], embeddings: list) -> None:
+        if not ids:
+            return
+        new = _to_sparse_rows(embeddings, self.n_features)
+        with self._lock:
+            old_ids, old_docs, _ = self._snapshot
+            docs = sparse.vstack([old_docs, new], format = "csr")
+            postings = docs.tocsc()
+            postings.sort_indices()
+            self._snapshot = (np.concatenate([old_ids, np.asarray(ids, dtype = np.int64)]), docs, postings)
+            self.max_id = max(self.max_id, int(max(ids)))
+
+    def search(self, query_emb, k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+        ids, _, postings = self._snapshot
+        if len(ids) == 0 or k <= 0:
+            return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.float32)
+
+        q = _to_sparse_rows([query_emb], self.n_features)
+        rows, weights = [], []
+        for j, qv in zip(q.indices, q.data):
+            start, end = postings.indptr[j], postings.indptr[j + 1]
+            if start == end:
+                continue
+            rows.append(postings.indices[start:end])
+            weights.append(postings.data[start:end] * qv)
+        if not rows:
+            return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.float32)
+
+        cand, inv = np.unique(np.concatenate(rows), return_inverse = True)
+        scores = np.bincount(inv, weights = np.concatenate(weights)).astype(np.float32)
+        top = _top_k(scores, k)
+        return ids[cand[top]], scores[top]
+
+    def search_batch(self, queries: sparse.csr_matrix, k: int = 5) -> list[tuple[np.ndarray, np.ndarray]]:
+        # queries: (n_queries, n_features) csr, e.g. from embed_texts_sparse()
+        ids, docs, _ = self._snapshot
+        if len(ids) == 0 or k <= 0:
+            return [(np.empty(0, dtype = np.int64), np.empty(0, dtype = np.float32))] * queries.shape[0]
+
+        q = queries.astype(np.float32)
+        norms = np.sqrt(np.asarray(q.multiply(q).sum(axis = 1))).ravel()
+        norms[norms == 0] = 1.0
+        q = sparse.diags(1.0 / norms).dot(q).tocsr()
+
+        scores = (q @ docs.T).tocsr()
+        out = []
+        for i in range(scores.shape[0]):
+            start, end = scores.indptr[i], scores.indptr[i + 1]
+            cand, vals = scores.indices[start:end], scores.data[start:end]
+            top = _top_k(vals, k)
+            out.append((ids[cand[top]], vals[top]))
+        return out
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_rag_index(session: Session):
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SparseRagIndex() if settings.rag_index_backend == "sparse" else RagIndex()
+    _index.maybe_refresh(session, settings.rag_index_refresh_sec)
+    return _index
+
+def top_k_similar(session: Session, query_emb, k: int = 5) -> list[RagDoc]:
+    # query_emb is a dense list or an (indices, values) pair from embed_text_sparse()
+    ids, _ = get_rag_index(session).search(query_emb, k)
+    if len(ids) == 0:
+        return []
+    by_id = {d.id: d for d in session.query(RagDoc).filter(RagDoc.id.in_(ids.tolist()))}
+    return [by_id[i] for i in ids.tolist() if i in by_id]
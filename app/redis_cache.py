@@ -4,19 +4,182 @@ from app.config import settings
 
 r = redis.from_url(settings.redis_url, decode_responses = True)
 
+STATE_TTL_SEC = 60 * 60 * 6
+
+# match state lives in a hash; these fields come back as numbers, the rest as strings
+INT_FIELDS = {
+    "minute", "n_events",
+    "home_goals", "away_goals", "home_shots", "away_shots",
+    "home_corners", "away_corners", "home_fouls", "away_fouls",
+}
+FLOAT_FIELDS = {"home_xg", "away_xg"}
+MAX_FIELDS = {"minute"}  # deltas raise these to max(current, delta) instead of adding
+
+# applies one folded event delta to match_state:<id> atomically and returns the new hash.
+# ARGV = ttl, then (op, field, value) triples; op is i=HINCRBY, f=HINCRBYFLOAT, m=max, s=HSET.
+# a legacy JSON string value is converted to a hash first.
+_APPLY_DELTA_LUA = """
+local key = KEYS[1]
+if redis.call('TYPE', key).ok == 'string' then
+  local legacy = cjson.decode(redis.call('GET', key))
+  redis.call('DEL', key)
+  for f, v in pairs(legacy) do
+    if v ~= cjson.null then redis.call('HSET', key, f, tostring(v)) end
+  end
+end
+for i = 2, #ARGV, 3 do
+  local op, f, v = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+  if op == 'i' then
+    redis.call('HINCRBY', key, f, v)
+  elseif op == 'f' then
+    redis.call('HINCRBYFLOAT', key, f, v)
+  elseif op == 'm' then
+    local cur = tonumber(redis.call('HGET', key, f) or '0')
+    if tonumber(v) > cur then redis.call('HSET', key, f, v) end
+  else
+    redis.call('HSET', key, f, v)
+  end
+end
+redis.call('EXPIRE', key, ARGV[1])
+return redis.call('HGETALL', key)
+"""
+_apply_delta = r.register_script(_APPLY_DELTA_LUA)
+
 def key_match_state(match_id:str) -> str:
     return f"match_state:{match_id}"
 
+def _decode_state(h: dict) -> dict:
+    state = {}
+    for f, v in h.items():
+        if f in INT_FIELDS:
+            state[f] = int(float(v))
+        elif f in FLOAT_FIELDS:
+            state[f] = float(v)
+        else:
+            state[f] = v
+    return state
+
+def _encode_state(state: dict) -> dict:
+    return {f: v for f, v in state.items() if v is not None}
+
+def _delta_args(delta: dict, ttl_sec: int) -> list:
+    args = [ttl_sec]
+    for f, v in delta.items():
+        if v is None:
+            continue
+        if f in MAX_FIELDS:
+            op = "m"
+        elif f in INT_FIELDS:
+            op = "i"
+        elif f in FLOAT_FIELDS:
+            op = "f"
+        else:
+            op = "s"
+        args += [op, f, v]
+    return args
+
+def _pairs_to_dict(flat: list) -> dict:
+    return dict(zip(flat[::2], flat[1::2]))
+
+def merge_state_delta(state: dict, delta: dict) -> dict:
+    # in-process equivalent of the Lua script, for callers that own a match's state
+    for f, v in delta.items():
+        if v is None:
+            continue
+        if f in MAX_FIELDS:
+            state[f] = max(int(state.get(f, 0)), int(v))
+        elif f in INT_FIELDS:
+            state[f] = int(state.get(f, 0)) + int(v)
+        elif f in FLOAT_FIELDS:
+            state[f] = float(state.get(f, 0.0)) + float(v)
+        else:
+            state[f] = v
+    return state
+
 def get_match_state(match_id: str) -> dict: 
-    raw = r.get(key_match_state(match_id))
-    return json.loads(raw) if raw else {}
+    key = key_match_state(match_id)
+    try:
+        return _decode_state(r.hgetall(key))
+    except redis.ResponseError:
+        # written by an older consumer as one JSON blob
+        raw = r.get(key)
+        return json.loads(raw) if raw else {}
 
-def set_match_state(match_id:str, state:dict, ttl_sec:int = 60 * 60 * 6 ):
-    r.set(key_match_state(match_id), json.dumps(state), ex = ttl_sec)
+def set_match_state(match_id:str, state:dict, ttl_sec:int = STATE_TTL_SEC ):
+    set_match_states({match_id: state}, ttl_sec)
+
+def get_match_states(match_ids: list[str]) -> dict:
+    if not match_ids:
+        return {}
+    pipe = r.pipeline(transaction = False)
+    for m in match_ids:
+        pipe.hgetall(key_match_state(m))
+    out = {}
+    for m, res in zip(match_ids, pipe.execute(raise_on_error = False)):
+        out[m] = get_match_state(m) if isinstance(res, redis.ResponseError) else _decode_state(res)
+    return out
+
+def set_match_states(states: dict, ttl_sec:int = STATE_TTL_SEC ):
+    # full overwrite of each state; prefer apply_match_deltas for event updates
+    if not states:
+        return
+    pipe = r.pipeline(transaction = True)
+    for match_id, state in states.items():
+        key = key_match_state(match_id)
+        pipe.delete(key)
+        mapping = _encode_state(state)
+        if mapping:
+            pipe.hset(key, mapping = mapping)
+            pipe.expire(key, ttl_sec)
+    pipe.execute()
+
+def apply_match_delta(match_id: str, delta: dict, ttl_sec: int = STATE_TTL_SEC) -> dict:
+    '''
+    delta is the state produced by folding events onto an empty dict: counters are
+    added, "minute" is maxed, strings are overwritten. one atomic round trip.
+    '''
+    flat = _apply_delta(keys = [key_match_state(match_id)], args = _delta_args(delta, ttl_sec))
+    return _decode_state(_pairs_to_dict(flat))
+
+def apply_match_deltas(deltas: dict, ttl_sec: int = STATE_TTL_SEC) -> dict:
+    # apply_match_delta for many matches in one pipelined round trip
+    if not deltas:
+        return {}
+    pipe = r.pipeline(transaction = False)
+    for match_id, delta in deltas.items():
+        _apply_delta(keys = [key_match_state(match_id)], args = _delta_args(delta, ttl_sec), client = pipe)
+    return {
+        match_id: _decode_state(_pairs_to_dict(flat))
+        for match_id, flat in zip(deltas, pipe.execute())
+    }
+
+def key_match_pred(match_id:str) -> str:
+    return f"match_pred:{match_id}"
 
 def set_latest_prediction(match_id:str, pred:dict, ttl_sec:int = 60 * 60 * 6 ):
-    r.set(f"match_pred: {match_id}", json.dumps(pred), ex=ttl_sec)
+    r.set(key_match_pred(match_id), json.dumps(pred), ex=ttl_sec)
+
+# replaces match_pred:<id> only if the stored prediction has ts ARGV[2] (or there is none);
+# ARGV = payload, ts, ttl. returns 1 if written
+_SET_PRED_IF_TS_LUA = """
+local raw = redis.call('GET', KEYS[1])
+if raw and cjson.decode(raw).ts ~= ARGV[2] then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+_set_pred_if_ts = r.register_script(_SET_PRED_IF_TS_LUA)
+
+def set_latest_prediction_if_ts(match_id:str, pred:dict, ttl_sec:int = 60 * 60 * 6 ) -> bool:
+    # compare-and-set: a newer prediction stored since pred was made is left alone
+    return bool(_set_pred_if_ts(keys = [key_match_pred(match_id)], args = [json.dumps(pred), pred["ts"], ttl_sec]))
 
 def get_latest_prediction(match_id:str) -> dict: 
-    raw = r.get(f"match_pred:{match_id}")
-    return json.loads(raw) if raw else {}
\ No newline at end of file
+    raw = r.get(key_match_pred(match_id))
+    return json.loads(raw) if raw else {}
+
+def get_latest_predictions(match_ids: list[str]) -> dict[str, dict]:
+    # one MGET for the whole list; ids without a cached prediction are left out
+    if not match_ids:
+        return {}
+    raws = r.mget([key_match_pred(m) for m in match_ids])
+    return {m: json.loads(raw) for m, raw in zip(match_ids, raws) if raw}
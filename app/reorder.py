@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from datetime import datetime
+import heapq
+import itertools
+import time
+
+def event_time(ev: dict) -> float:
+    ts = ev.get("ts")
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    return datetime.fromisoformat(ts).timestamp() if ts else 0.0
+
+class ReorderBuffer:
+    '''
+    holds each event for up to window_sec after it arrives and releases events in
+    event-timestamp order. match and player events for the same match come from
+    different topics/partitions and can arrive slightly out of order; inside the
+    window they are put back in the order they happened. window_sec=0 releases
+    every event immediately (still sorted within one push batch).
+    items are (kind, event, partition) tuples.
+    '''
+    def __init__(self, window_sec: float = 0.05):
+        self.window_sec = window_sec
+        self._heap: list = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, kind: str, ev: dict, partition: int | None = None, now: float | None = None) -> None:
+        now = time.time() if now is None else now
+        heapq.heappush(self._heap, (event_time(ev), next(self._seq), now, kind, ev, partition))
+
+    def pop_ready(self, now: float | None = None) -> list[tuple[str, dict, int | None]]:
+        now = time.time() if now is None else now
+        out = []
+        while self._heap and self._heap[0][2] + self.window_sec <= now:
+            _, _, _, kind, ev, partition = heapq.heappop(self._heap)
+            out.append((kind, ev, partition))
+        return out
+
+    def drain(self) -> list[tuple[str, dict, int | None]]:
+        out = []
+        while self._heap:
+            _, _, _, kind, ev, partition = heapq.heappop(self._heap)
+            out.append((kind, ev, partition))
+        return out
+
+    def next_release_in(self, now: float | None = None) -> float | None:
+        # seconds until the oldest buffered event is due, None when empty
+        if not self._heap:
+            return None
+        now = time.time() if now is None else now
+        return max(0.0, self._heap[0][2] + self.window_sec - now)
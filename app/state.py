@@ -0,0 +1,67 @@
+'''
+folding events into match state. Shared by the live consumer
+(scripts/consumer_predictor.py) and the history backfill
+(scripts/backfill_predictions.py) so both compute identical features.
+
+Called with an empty dict, each function returns the event's delta, which
+redis_cache.merge_state_delta / the Lua script add onto the stored state.
+'''
+from __future__ import annotations
+
+def update_state_with_match_event(state: dict, ev: dict) -> dict:
+    minute = int(ev.get("minute", state.get("minute", 0)))
+    state["minute"] = max(state.get("minute", 0), minute)
+
+    et = ev["event_type"]
+    team_side = ev.get("team_side")  # "home" or "away"
+
+    if et == "goal":
+        if team_side == "home":
+            state["home_goals"] = int(state.get("home_goals", 0)) + 1
+        elif team_side == "away":
+            state["away_goals"] = int(state.get("away_goals", 0)) + 1
+
+    if et == "shot":
+        if team_side == "home":
+            state["home_shots"] = int(state.get("home_shots", 0)) + 1
+        elif team_side == "away":
+            state["away_shots"] = int(state.get("away_shots", 0)) + 1
+
+    if et == "corner":
+        if team_side == "home":
+            state["home_corners"] = int(state.get("home_corners", 0)) + 1
+        elif team_side == "away":
+            state["away_corners"] = int(state.get("away_corners", 0)) + 1
+
+    if et == "foul":
+        if team_side == "home":
+            state["home_fouls"] = int(state.get("home_fouls", 0)) + 1
+        elif team_side == "away":
+            state["away_fouls"] = int(state.get("away_fouls", 0)) + 1
+
+    payload = ev.get("payload") or {}
+    if "xg" in payload:
+        if team_side == "home":
+            state["home_xg"] = float(state.get("home_xg", 0.0)) + float(payload["xg"])
+        elif team_side == "away":
+            state["away_xg"] = float(state.get("away_xg", 0.0)) + float(payload["xg"])
+
+    state["n_events"] = int(state.get("n_events", 0)) + 1
+    return state
+
+def update_state_with_player_event(state: dict, ev: dict) -> dict:
+    minute = int(ev.get("minute", state.get("minute", 0)))
+    state["minute"] = max(state.get("minute", 0), minute)
+
+    team_side = ev.get("team_side")
+    stat = ev.get("stat_type")
+    val = float(ev.get("value", 0.0))
+
+    if stat == "xg":
+        if team_side == "home":
+            state["home_xg"] = float(state.get("home_xg", 0.0)) + val
+        elif team_side == "away":
+            state["away_xg"] = float(state.get("away_xg", 0.0)) + val
+
+    state["n_events"] = int(state.get("n_events", 0)) + 1
+    return state
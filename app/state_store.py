@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import time
+
+from app.redis_cache import apply_match_deltas, get_match_states, merge_state_delta, set_match_states
+
+class RedisStateStore:
+    '''
+    default store: Redis is the only copy of match state and each batch of deltas
+    is applied atomically server-side, so any number of consumers can share matches.
+    preview() is a read; the increments only happen in apply(), which the consumer
+    calls once the batch's DB transaction has committed (a failed or replayed
+    batch must not count its events twice).
+    '''
+    def preview(self, deltas: dict) -> dict:
+        # the states apply(deltas) would produce, without writing anything
+        current = get_match_states(list(deltas))
+        return {m: merge_state_delta(current[m], d) for m, d in deltas.items()}
+
+    def apply(self, deltas: dict, partitions: dict | None = None) -> dict:
+        return apply_match_deltas(deltas)
+
+    def maybe_flush(self) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def discard(self) -> None:
+        pass
+
+    def revoke(self, partitions: set[int]) -> None:
+        pass
+
+class LocalStateStore:
+    '''
+    per-process state for the matches on the partitions this worker owns. with
+    producers keying by match_id, a match lives on exactly one partition and so has
+    exactly one writer. states are loaded from Redis the first time a match is seen,
+    updated in memory, and written back in one pipeline every flush_interval_sec and
+    before a partition is revoked (so the next owner picks up where we left off).
+    '''
+    def __init__(self, flush_interval_sec: float = 1.0):
+        self.flush_interval_sec = flush_interval_sec
+        self.states: dict[str, dict] = {}
+        self.partition_of: dict[str, int] = {}
+        self.dirty: set[str] = set()
+        self.last_flush = time.time()
+
+    def _load(self, match_ids) -> None:
+        missing = [m for m in match_ids if m not in self.states]
+        if missing:
+            self.states.update(get_match_states(missing))
+
+    def preview(self, deltas: dict) -> dict:
+        self._load(deltas)
+        return {m: merge_state_delta(dict(self.states[m]), d) for m, d in deltas.items()}
+
+    def apply(self, deltas: dict, partitions: dict | None = None) -> dict:
+        self._load(deltas)
+
+        out = {}
+        for match_id, delta in deltas.items():
+            state = merge_state_delta(self.states[match_id], delta)
+            if partitions and match_id in partitions:
+                self.partition_of[match_id] = partitions[match_id]
+            self.dirty.add(match_id)
+            out[match_id] = state
+        return out
+
+    def maybe_flush(self) -> None:
+        if time.time() - self.last_flush >= self.flush_interval_sec:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.dirty:
+            set_match_states({m: self.states[m] for m in self.dirty})
+            self.dirty.clear()
+        self.last_flush = time.time()
+
+    def discard(self) -> None:
+        # forget everything not yet flushed; those matches reload from Redis when next seen
+        for m in self.dirty:
+            self.states.pop(m, None)
+            self.partition_of.pop(m, None)
+        self.dirty.clear()
+
+    def revoke(self, partitions: set[int]) -> None:
+        self.flush()
+        gone = [m for m, p in self.partition_of.items() if p in partitions]
+        for m in gone:
+            self.states.pop(m, None)
+            self.partition_of.pop(m, None)
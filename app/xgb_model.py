@@ -1,33 +1,187 @@
 from __future__ import annotations
+import json
 import joblib
 import numpy as np
+import xgboost as xgb
 from xgboost import XGBClassifier
 
 CLASS_NAMES = ["HOME_WIN", "DRAW", "AWAY_WIN"]
 
-def train_xgb(X: np.ndarray, y: np.ndarray) -> XGBClassifier:
-    model = XGBClassifier(
-        n_estimators=350,
-        max_depth=5,
-        learning_rate=0.05,
-        subsample=0.9,
-        colsample_bytree=0.9,
-        reg_lambda=1.0,
-        objective="multi:softprob",
-        num_class=3,
-        eval_metric="mlogloss",
-        tree_method="hist",
-        random_state=42,
-    )
+# hyperparameters of the served model; train_xgb and train_xgb_booster share them
+XGB_PARAMS = dict(
+    n_estimators=350,
+    max_depth=5,
+    learning_rate=0.05,
+    subsample=0.9,
+    colsample_bytree=0.9,
+    reg_lambda=1.0,
+    objective="multi:softprob",
+    num_class=3,
+    eval_metric="mlogloss",
+    tree_method="hist",
+    random_state=42,
+)
+
+def train_xgb(X: np.ndarray, y: np.ndarray, n_jobs: int | None = None) -> XGBClassifier:
+    model = XGBClassifier(**XGB_PARAMS, n_jobs=n_jobs)
     model.fit(X, y)
     return model
 
+def booster_params(params: dict | None = None, n_jobs: int | None = None) -> tuple[dict, int]:
+    # sklearn-style params -> (xgb.train params, num_boost_round)
+    p = dict(XGB_PARAMS if params is None else params)
+    rounds = p.pop("n_estimators")
+    p["eta"] = p.pop("learning_rate")
+    p["lambda"] = p.pop("reg_lambda")
+    p["seed"] = p.pop("random_state")
+    if n_jobs is not None:
+        p["nthread"] = n_jobs
+    return p, rounds
+
+def train_xgb_booster(dtrain: xgb.DMatrix, n_jobs: int | None = None, evals: list | None = None,
+                      params: dict | None = None, **train_kw) -> XGBClassifier:
+    '''
+    train on a prebuilt (Quantile)DMatrix, e.g. from datasets.ChunkIter, which
+    XGBClassifier.fit can't take, and wrap the result as an XGBClassifier so
+    save_model/load_model/FastPredictor treat it like any other model.
+    train_kw go to xgb.train (early_stopping_rounds, evals_result, ...).
+    '''
+    p, rounds = booster_params(params, n_jobs)
+    booster = xgb.train(p, dtrain, num_boost_round=rounds, evals=evals or (), verbose_eval=False, **train_kw)
+    best = booster.attr("best_iteration")
+    if best is not None:
+        # early stopped: drop the rounds past the best one, so FastPredictor (all trees) scores as validated
+        booster = booster[: int(best) + 1]
+    return booster_to_classifier(booster)
+
+def booster_to_classifier(booster: xgb.Booster) -> XGBClassifier:
+    model = XGBClassifier()
+    model.load_model(bytearray(booster.save_raw("ubj")))
+    return model
+
 def save_model(model: XGBClassifier, path: str) -> None:
     joblib.dump(model, path)
 
 def load_model(path: str) -> XGBClassifier:
     return joblib.load(path)
 
+def probs_to_dict(probs: np.ndarray) -> dict:
+    return {"HOME_WIN": float(probs[0]), "DRAW": float(probs[1]), "AWAY_WIN": float(probs[2])}
+
 def predict_proba(model: XGBClassifier, X_row: np.ndarray) -> dict:
     probs = model.predict_proba(X_row.reshape(1, -1))[0]
-    return {"HOME_WIN": float(probs[0]), "DRAW": float(probs[1]), "AWAY_WIN": float(probs[2])}
+    return probs_to_dict(probs)
+
+def predict_proba_batch(model: XGBClassifier, X: np.ndarray) -> list[dict]:
+    # one booster call for many rows (e.g. every match due a prediction in a consume batch)
+    if len(X) == 0:
+        return []
+    return [probs_to_dict(p) for p in model.predict_proba(X)]
+
+class _TreeWalker:
+    '''
+    the model's trees flattened into parallel NumPy arrays (one slot per node,
+    leaves point at themselves) so one row is scored by walking every tree at
+    once: depth x a few vectorized gathers instead of a call into the booster.
+    only multi:softprob gbtree models with scalar leaves are supported.
+    '''
+    def __init__(self, booster):
+        js = json.loads(booster.save_raw("json"))
+        learner = js["learner"]
+        if learner["objective"]["name"] != "multi:softprob":
+            raise ValueError("tree walk only supports multi:softprob")
+        gb = learner["gradient_booster"]["model"]
+
+        feat, thr, yes, no, default_left, leaf_val, depths = [], [], [], [], [], [], []
+        roots = []
+        offset = 0
+        for t in gb["trees"]:
+            if int(t["tree_param"].get("size_leaf_vector", "1")) > 1:
+                raise ValueError("vector-leaf trees are not supported")
+            left = np.asarray(t["left_children"], dtype=np.int64)
+            right = np.asarray(t["right_children"], dtype=np.int64)
+            cond = np.asarray(t["split_conditions"], dtype=np.float32)
+            n = len(left)
+            idx = np.arange(n)
+            leaf = left == -1
+
+            depth = np.zeros(n, dtype=np.int64)
+            for i in range(n):  # children always come after their parent
+                if not leaf[i]:
+                    depth[left[i]] = depth[right[i]] = depth[i] + 1
+
+            feat.append(np.where(leaf, 0, np.asarray(t["split_indices"], dtype=np.int64)))
+            thr.append(np.where(leaf, np.float32(np.inf), cond))
+            yes.append(np.where(leaf, idx, left) + offset)
+            no.append(np.where(leaf, idx, right) + offset)
+            default_left.append(np.where(leaf, True, np.asarray(t["default_left"], dtype=bool)))
+            leaf_val.append(np.where(leaf, cond, 0.0))
+            depths.append(depth.max())
+            roots.append(offset)
+            offset += n
+
+        self.feat = np.concatenate(feat)
+        self.thr = np.concatenate(thr).astype(np.float32)
+        self.yes = np.concatenate(yes)
+        self.no = np.concatenate(no)
+        self.default_left = np.concatenate(default_left)
+        self.leaf_val = np.concatenate(leaf_val).astype(np.float32)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.depth = int(max(depths))
+        self.tree_class = np.asarray(gb["tree_info"], dtype=np.int64)
+        self.num_class = int(learner["learner_model_param"]["num_class"])
+        self.base_margin = float(learner["learner_model_param"]["base_score"])
+
+    def predict(self, x: np.ndarray, n_trees: int) -> np.ndarray:
+        node = self.roots[:n_trees]
+        for _ in range(self.depth):
+            v = x[self.feat[node]]
+            go_left = np.where(np.isnan(v), self.default_left[node], v < self.thr[node])
+            node = np.where(go_left, self.yes[node], self.no[node])
+        margin = np.bincount(self.tree_class[:n_trees], weights=self.leaf_val[node], minlength=self.num_class)
+        margin += self.base_margin
+        e = np.exp(margin - margin.max())
+        return e / e.sum()
+
+class FastPredictor:
+    '''
+    low-overhead scorer for the serving path. single rows go through a NumPy walk
+    over the dumped trees (no call into the booster at all); batches use the
+    booster's inplace_predict, skipping the sklearn wrapper and DMatrix.
+    models the tree walk can't handle fall back to inplace_predict on a
+    preallocated one-row buffer. not thread-safe: one instance per thread.
+    '''
+    def __init__(self, model: XGBClassifier, nthread: int = 1):
+        self.booster = model.get_booster()
+        self.booster.set_param({"nthread": nthread})
+        try:
+            # match XGBClassifier.predict_proba when the model was early-stopped
+            self.iteration_range = (0, model.best_iteration + 1)
+        except AttributeError:
+            self.iteration_range = (0, 0)
+        self._buf = np.empty((1, self.booster.num_features()), dtype=np.float32)
+
+        try:
+            self._walker = _TreeWalker(self.booster)
+        except ValueError:
+            self._walker = None
+        n_rounds = self.iteration_range[1] or self.booster.num_boosted_rounds()
+        self._n_trees = n_rounds * (self._walker.num_class if self._walker else 1)
+
+    def predict_row(self, X_row: np.ndarray) -> dict:
+        self._buf[0] = X_row
+        if self._walker is not None:
+            return probs_to_dict(self._walker.predict(self._buf[0], self._n_trees))
+        probs = self.booster.inplace_predict(self._buf, iteration_range=self.iteration_range)
+        return probs_to_dict(probs[0])
+
+    def predict_batch(self, X: np.ndarray) -> list[dict]:
+        if len(X) == 0:
+            return []
+        return [probs_to_dict(p) for p in self.predict_batch_array(X)]
+
+    def predict_batch_array(self, X: np.ndarray) -> np.ndarray:
+        # (n, 3) class probabilities, for callers that don't need the dicts (backfill)
+        return self.booster.inplace_predict(
+            np.ascontiguousarray(X, dtype=np.float32), iteration_range=self.iteration_range
+        )
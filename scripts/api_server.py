@@ -1,42 +1,356 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import base64
+from contextlib import asynccontextmanager
+from datetime import datetime
+import hmac
+import json
+import threading
+import time
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
+from app.config import settings
 from app.db import SessionLocal
+from app.kafka_io import make_lag_consumer
+from app.live_stream import PredictionHub, PredictionStream, hub_listener
+from app.log import get_logger
+from app.metrics import render_latest, timed, update_group_lag
 from app.models import Prediction
-from app.redis_cache import get_latest_prediction
+from app.near_cache import NearCache
+from app.profiler import capture
+from app.redis_cache import get_latest_prediction, get_latest_predictions
 import uvicorn
 
-app = FastAPI()
+log = get_logger("api_server")
+
+# set up in lifespan() when LIVE_STREAM_ENABLED=1
+hub: PredictionHub | None = None
+stream: PredictionStream | None = None
+# only with the stream: without it nothing would replace an entry until its TTL ran out
+near_cache: NearCache | None = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global hub, stream, near_cache
+    if settings.live_stream_enabled:
+        hub = PredictionHub(settings.live_stream_queue_size)
+        stream = PredictionStream()
+        stream.add_listener(hub_listener(hub, asyncio.get_running_loop()))
+        if settings.near_cache_enabled:
+            near_cache = NearCache(
+                max_entries=settings.near_cache_max_entries,
+                max_bytes=int(settings.near_cache_max_mb * 1024 * 1024),
+                ttl_sec=settings.near_cache_ttl_sec,
+            )
+            stream.add_listener(near_cache.put_many)  # on the stream thread
+        stream.start()
+    try:
+        yield
+    finally:
+        if stream is not None:
+            stream.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+# upper bound on ids per /matches/latest request
+MAX_BATCH_IDS = 200
+
+# consumer group lag is read from the brokers at scrape time, at most every LAG_REFRESH_SEC
+LAG_REFRESH_SEC = 5.0
+_lag_lock = threading.Lock()
+_lag_consumer = None
+_lag_checked = 0.0
+
+def refresh_group_lag():
+    global _lag_consumer, _lag_checked
+    if not _lag_lock.acquire(blocking=False):
+        return  # another scrape is already refreshing
+    try:
+        if time.time() - _lag_checked < LAG_REFRESH_SEC:
+            return
+        _lag_checked = time.time()
+        if _lag_consumer is None:
+            _lag_consumer = make_lag_consumer()
+        update_group_lag(_lag_consumer, [settings.topic_match_events, settings.topic_player_events])
+    except Exception as e:
+        log.warning(f"consumer lag refresh failed: {e}")
+    finally:
+        _lag_lock.release()
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    out = {"ok": True}
+    if hub is not None:
+        out["live_stream"] = hub.stats()
+    if near_cache is not None:
+        out["near_cache"] = near_cache.stats()
+    return out
+
+@app.get("/metrics")
+def metrics():
+    refresh_group_lag()
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+def require_admin(token: str | None):
+    # no ADMIN_TOKEN configured = admin surface doesn't exist
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.post("/admin/profile")
+def admin_profile(
+    seconds: float = Query(10.0, gt=0, le=300),
+    x_admin_token: str | None = Header(default=None),
+):
+    '''
+    samples every thread of this process (event loop + request threadpool) for
+    `seconds` while it keeps serving, and returns the collapsed stacks. The file
+    is also kept under PROFILE_DIR.
+    '''
+    require_admin(x_admin_token)
+    result = capture("api", seconds)
+    if result is None:
+        raise HTTPException(status_code=409, detail="A profile is already being captured.")
+    prof, path = result
+    return Response(
+        content=prof.collapsed(),
+        media_type="text/plain",
+        headers={"X-Profile-Path": path, "X-Profile-Samples": str(prof.samples)},
+    )
+
+def prediction_payload(row: Prediction) -> dict:
+    # DB fallback (Redis expired or flushed): explanation_status and rag_citations only live in
+    # the published/cached payload, so they are left out here; explanation is null until it's ready
+    return {
+        "match_id": row.match_id,
+        "ts": row.ts.isoformat(),
+        "model_version": row.model_version,
+        "probs": {"HOME_WIN": row.p_home_win, "DRAW": row.p_draw, "AWAY_WIN": row.p_away_win},
+        "features": row.features,
+        "explanation": row.explanation
+    }
+
+def latest_from_db(db: Session, match_ids: list[str]) -> dict[str, dict]:
+    # newest row per match in one query (DISTINCT ON (match_id) on Postgres)
+    rows = (
+        db.query(Prediction)
+        .filter(Prediction.match_id.in_(match_ids))
+        .order_by(Prediction.match_id, Prediction.ts.desc(), Prediction.id.desc())
+        .distinct(Prediction.match_id)
+        .all()
+    )
+    return {row.match_id: prediction_payload(row) for row in rows}
+
+def parse_ids(ids: str) -> list[str]:
+    match_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not match_ids:
+        raise HTTPException(status_code=422, detail="ids is empty.")
+    if len(match_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_IDS} ids per request.")
+    return match_ids
+
+@app.get("/matches/latest")
+def latest_many(ids: str = Query(..., description="comma-separated match ids")):
+    match_ids = parse_ids(ids)
+
+    found = near_cache.get_many(match_ids) if near_cache is not None else {}
+
+    fetched = {}
+    missing = [m for m in match_ids if m not in found]
+    if missing:
+        with timed("api_redis_read", items=len(missing)):
+            fetched.update(get_latest_predictions(missing))
+        missing = [m for m in missing if m not in fetched]
+    if missing:
+        db: Session = SessionLocal()
+        try:
+            with timed("api_db_read", items=len(missing)):
+                fetched.update(latest_from_db(db, missing))
+        finally:
+            db.close()
+
+    found.update(fetched)
+    if near_cache is not None:
+        near_cache.put_many(list(fetched.values()))
+
+    return {
+        "predictions": {m: found[m] for m in match_ids if m in found},
+        "missing": [m for m in match_ids if m not in found],
+    }
 
 @app.get("/match/{match_id}/latest")
 def latest(match_id: str):
-    cached = get_latest_prediction(match_id)
+    if near_cache is not None:
+        cached = near_cache.get(match_id)
+        if cached is not None:
+            return cached
+
+    with timed("api_redis_read"):
+        cached = get_latest_prediction(match_id)
     if cached:
+        if near_cache is not None:
+            near_cache.put(cached)
         return cached
 
     db: Session = SessionLocal()
     try:
-        row = (
-            db.query(Prediction)
-            .filter(Prediction.match_id == match_id)
-            .order_by(Prediction.ts.desc())
-            .first()
-        )
+        with timed("api_db_read"):
+            row = (
+                db.query(Prediction)
+                .filter(Prediction.match_id == match_id)
+                .order_by(Prediction.ts.desc(), Prediction.id.desc())
+                .first()
+            )
         if not row:
             raise HTTPException(status_code=404, detail="No prediction found.")
-        return {
-            "match_id": row.match_id,
-            "ts": row.ts.isoformat(),
-            "model_version": row.model_version,
-            "probs": {"HOME_WIN": row.p_home_win, "DRAW": row.p_draw, "AWAY_WIN": row.p_away_win},
-            "features": row.features,
-            "explanation": row.explanation
-        }
+        out = prediction_payload(row)
+        if near_cache is not None:
+            near_cache.put(out)
+        return out
     finally:
         db.close()
 
+# history fields -> columns; features/explanation are the large ones, left out by default
+HISTORY_FIELDS = {
+    "model_version": (Prediction.model_version,),
+    "probs": (Prediction.p_home_win, Prediction.p_draw, Prediction.p_away_win),
+    "features": (Prediction.features,),
+    "explanation": (Prediction.explanation,),
+}
+HISTORY_DEFAULT_FIELDS = "model_version,probs"
+MAX_HISTORY_LIMIT = 1000
+
+def encode_cursor(ts: datetime, pred_id: int) -> str:
+    raw = json.dumps([ts.isoformat(), pred_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        ts, pred_id = json.loads(raw)
+        return datetime.fromisoformat(ts), int(pred_id)
+    except Exception:
+        raise HTTPException(status_code=422, detail="Invalid cursor.")
+
+@app.get("/match/{match_id}/history")
+def history(
+    match_id: str,
+    limit: int = Query(200, ge=1, le=MAX_HISTORY_LIMIT),
+    cursor: str | None = Query(None, description="next_cursor from the previous page"),
+    fields: str = Query(HISTORY_DEFAULT_FIELDS, description=f"comma-separated subset of {sorted(HISTORY_FIELDS)}"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+):
+    '''
+    prediction timeline of one match, newest first (order=asc for oldest first).
+    Keyset pagination on (ts, id): each page is an index range scan from the
+    cursor, so page N costs the same as page 1.
+    '''
+    wanted = [f for f in dict.fromkeys(x.strip() for x in fields.split(",")) if f]
+    unknown = [f for f in wanted if f not in HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {unknown}.")
+
+    cols = [Prediction.id, Prediction.ts] + [c for f in wanted for c in HISTORY_FIELDS[f]]
+    key = tuple_(Prediction.ts, Prediction.id)
+
+    db: Session = SessionLocal()
+    try:
+        q = db.query(*cols).filter(Prediction.match_id == match_id)
+        if cursor is not None:
+            after = tuple_(*decode_cursor(cursor))
+            q = q.filter(key < after if order == "desc" else key > after)
+        if order == "desc":
+            q = q.order_by(Prediction.ts.desc(), Prediction.id.desc())
+        else:
+            q = q.order_by(Prediction.ts.asc(), Prediction.id.asc())
+        with timed("api_db_read"):
+            rows = q.limit(limit + 1).all()
+    finally:
+        db.close()
+
+    items = []
+    for row in rows[:limit]:
+        item = {"ts": row.ts.isoformat()}
+        if "model_version" in wanted:
+            item["model_version"] = row.model_version
+        if "probs" in wanted:
+            item["probs"] = {"HOME_WIN": row.p_home_win, "DRAW": row.p_draw, "AWAY_WIN": row.p_away_win}
+        if "features" in wanted:
+            item["features"] = row.features
+        if "explanation" in wanted:
+            item["explanation"] = row.explanation
+        items.append(item)
+
+    last = rows[limit - 1] if len(rows) > limit else None
+    return {
+        "match_id": match_id,
+        "items": items,
+        "next_cursor": encode_cursor(last.ts, last.id) if last is not None else None,
+    }
+
+def require_stream() -> PredictionHub:
+    if hub is None:
+        raise HTTPException(status_code=503, detail="Live stream is disabled (LIVE_STREAM_ENABLED=0).")
+    return hub
+
+@app.get("/matches/stream")
+async def stream_sse(request: Request, ids: str = Query(..., description="comma-separated match ids")):
+    '''
+    Server-Sent Events: the current latest prediction of each match, then every
+    new one as it is published. Comment lines keep idle connections open.
+    '''
+    match_ids = parse_ids(ids)
+    h = require_stream()
+    sub = h.subscribe(match_ids)  # before the snapshot, so nothing published in between is missed
+    snapshot = await run_in_threadpool(get_latest_predictions, match_ids)
+
+    async def events():
+        try:
+            for pred in snapshot.values():
+                yield f"event: prediction\ndata: {json.dumps(pred)}\n\n"
+            while not await request.is_disconnected():
+                pred = await sub.get(timeout=settings.live_stream_heartbeat_sec)
+                if pred is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"event: prediction\ndata: {json.dumps(pred)}\n\n"
+        finally:
+            h.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/ws/matches")
+async def stream_ws(websocket: WebSocket, ids: str):
+    # same feed as /matches/stream: {"type": "prediction", "data": {...}} or {"type": "heartbeat"}
+    try:
+        match_ids = parse_ids(ids)
+        h = require_stream()
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    sub = h.subscribe(match_ids)
+    try:
+        for pred in (await run_in_threadpool(get_latest_predictions, match_ids)).values():
+            await websocket.send_json({"type": "prediction", "data": pred})
+        while True:
+            pred = await sub.get(timeout=settings.live_stream_heartbeat_sec)
+            if pred is None:
+                await websocket.send_json({"type": "heartbeat"})
+            else:
+                await websocket.send_json({"type": "prediction", "data": pred})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        h.unsubscribe(sub)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,161 @@
+"""
+Re-score match history with a (new) model, straight from Postgres instead of
+re-streaming every event through Kafka.
+
+Each worker process owns the matches with hashtext(match_id) % procs == worker.
+It streams that shard's match_events + player_events with a server-side cursor
+and, for each match, rebuilds the state at every PREDICT_EVERY_N_EVENTS-th
+event, as the per-event consumer does (app/history.py).
+Points are scored in large booster batches and written with COPY under
+--model-version. Each prediction's ts is the ts of the event that triggered it.
+
+    python -m scripts.backfill_predictions --model-version xgb_v2 --model-path xgb_v2.joblib --procs 8
+    python -m scripts.backfill_predictions --model-version xgb_v2 --match-id <id> --dry-run
+"""
+from __future__ import annotations
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from app.config import settings
+from app.features import row_from_matrix
+from app.log import get_logger
+
+log = get_logger("backfill_predictions")
+
+def shard_filter(args) -> tuple[str, dict]:
+    # WHERE clause over matches m selecting this worker's share; & 2147483647 keeps hashtext non-negative
+    where = ["(hashtext(m.id) & 2147483647) % :n_shards = :shard"]
+    params = {}
+    if args.match_id:
+        where.append("m.id = ANY(:match_ids)")
+        params["match_ids"] = list(args.match_id)
+    if args.since:
+        where.append("m.kickoff_ts >= :since")
+        params["since"] = args.since
+    if args.until:
+        where.append("m.kickoff_ts < :until")
+        params["until"] = args.until
+    return " AND ".join(where), params
+
+class ShardScorer:
+    # buffers prediction points across matches so the booster sees big batches
+    def __init__(self, predictor, writer, model_version: str, batch_rows: int):
+        self.predictor = predictor
+        self.writer = writer
+        self.model_version = model_version
+        self.batch_rows = batch_rows
+        self.keys: list[tuple[str, object]] = []
+        self.blocks: list[np.ndarray] = []
+        self.n = 0
+        self.scored = 0
+
+    def add(self, match_id: str, ts_list: list, X: np.ndarray):
+        self.keys.extend((match_id, ts) for ts in ts_list)
+        self.blocks.append(X)
+        self.n += len(X)
+        if self.n >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.n:
+            return
+        X = np.vstack(self.blocks)
+        probs = self.predictor.predict_batch_array(X)
+        if self.writer is not None:
+            rows = [
+                (mid, ts, self.model_version, float(p[0]), float(p[1]), float(p[2]),
+                 json.dumps(row_from_matrix(x)), None)
+                for (mid, ts), p, x in zip(self.keys, probs.tolist(), X.tolist())
+            ]
+            self.writer.add_many("predictions", rows, timeout = None)
+        self.scored += self.n
+        self.keys, self.blocks, self.n = [], [], 0
+
+def run_shard(shard: int, n_shards: int, args) -> dict:
+    # runs in a spawned worker: all clients are created here
+    from app.bulk_writer import WriteBehindWriter
+    from app.db import engine
+    from app.history import create_replay_matches, iter_match_events, snapshot_points
+    from app.xgb_model import FastPredictor, load_model
+
+    t0 = time.time()
+    where, params = shard_filter(args)
+    params.update({"n_shards": n_shards, "shard": shard})
+
+    predictor = FastPredictor(load_model(args.model_path), nthread = args.threads)
+    writer = None
+    if not args.dry_run:
+        writer = WriteBehindWriter(engine, flush_rows = args.write_rows, flush_interval_sec = 1.0,
+                                   max_rows = args.write_rows * 4).start()
+    scorer = ShardScorer(predictor, writer, args.model_version, args.batch_rows)
+
+    stats = {"shard": shard, "matches": 0, "events": 0, "predictions": 0, "deleted": 0}
+    with engine.connect() as conn:
+        create_replay_matches(conn, f"SELECT m.id, m.home_team, m.away_team, m.id AS seq_key FROM matches m WHERE {where}", params)
+
+        if args.replace and not args.dry_run:
+            stats["deleted"] = conn.execute(text(
+                "DELETE FROM predictions WHERE model_version = :v AND match_id IN (SELECT id FROM replay_matches)"
+            ), {"v": args.model_version}).rowcount
+        conn.commit()
+
+        for mid, events, ts_list in iter_match_events(conn, args.fetch_rows):
+            idx, X = snapshot_points(events, args.predict_every)
+            if len(idx):
+                scorer.add(mid, [ts_list[i] for i in idx], X)
+            stats["matches"] += 1
+            stats["events"] += len(events)
+
+    scorer.flush()
+    stats["predictions"] = scorer.scored
+    if writer is not None:
+        writer.close()
+        stats["rows_dropped"] = writer.rows_dropped
+    stats["sec"] = round(time.time() - t0, 1)
+    log.info(f"shard {shard}/{n_shards}: {stats}")
+    return stats
+
+def main():
+    ap = argparse.ArgumentParser(description="re-score stored match history with a model, in parallel shards")
+    ap.add_argument("--model-version", required=True, help="written to predictions.model_version")
+    ap.add_argument("--model-path", default="xgb_match_outcome.joblib")
+    ap.add_argument("--procs", type=int, default=mp.cpu_count(), help="shards / worker processes")
+    ap.add_argument("--threads", type=int, default=1, help="booster threads per worker")
+    ap.add_argument("--predict-every", type=int, default=settings.predict_every_n_events)
+    ap.add_argument("--match-id", action="append", help="only these matches (repeatable)")
+    ap.add_argument("--since", help="only matches with kickoff_ts >= this (ISO timestamp)")
+    ap.add_argument("--until", help="only matches with kickoff_ts < this")
+    ap.add_argument("--replace", action="store_true", help="delete existing predictions of --model-version first")
+    ap.add_argument("--dry-run", action="store_true", help="score but don't write")
+    ap.add_argument("--batch-rows", type=int, default=50_000, help="prediction points per booster call")
+    ap.add_argument("--fetch-rows", type=int, default=20_000, help="cursor fetch size")
+    ap.add_argument("--write-rows", type=int, default=20_000, help="rows per COPY")
+    args = ap.parse_args()
+
+    t0 = time.time()
+    n = max(1, args.procs)
+    if n == 1:
+        results = [run_shard(0, 1, args)]
+    else:
+        with ProcessPoolExecutor(n, mp_context=mp.get_context("spawn")) as ex:
+            results = list(ex.map(run_shard, range(n), [n] * n, [args] * n))
+
+    total = {k: sum(r[k] for r in results) for k in ("matches", "events", "predictions", "deleted")}
+    dropped = sum(r.get("rows_dropped", 0) for r in results)
+    elapsed = time.time() - t0
+    log.info(
+        f"backfill {args.model_version}: {total} in {elapsed:.1f}s "
+        f"({total['events'] / elapsed if elapsed else 0:.0f} events/sec)"
+    )
+    if dropped:
+        log.error(f"{dropped} prediction rows could not be written")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
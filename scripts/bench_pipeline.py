@@ -0,0 +1,436 @@
+"""
+End-to-end benchmark of the consumer_predictor code path with in-process
+stand-ins, so it runs on a laptop with no network:
+
+- Kafka    -> MemoryBroker (in-memory partitions, same message interface)
+- Redis    -> fakeredis (needs `pip install "fakeredis[lua]"` for the state script)
+- Postgres -> a temporary SQLite file
+- RAG      -> SparseRagIndex over synthetic docs held in memory
+- LLM      -> StubLLM sleeping --llm-latency-ms per call
+
+Events come from producer_simulator's generator (seeded), are produced either
+all up front (--eps 0, throughput mode) or paced by a producer thread, and are
+consumed with the real consume_into / ingest_ready / ingest_one_* functions.
+Reports events/sec and p50/p95/p99 per stage, and writes them as JSON tagged
+with the git revision so runs can be compared across commits. In throughput
+mode the e2e_* latencies include the time events sat in the preloaded backlog;
+use --eps for meaningful end-to-end numbers.
+
+    python -m scripts.bench_pipeline --events 20000 --matches 200 --out bench.json
+"""
+from __future__ import annotations
+import argparse
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+import uuid
+import zlib
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.config import settings
+from app.db import Base
+from app.models import Match, MatchEvent, PlayerEvent, Prediction
+from app.llm_client import LLMClient
+from app.embeddings import embed_texts_sparse, embed_text_sparse
+from app.rag_store import SparseRagIndex
+import app.explain_worker as explain_worker
+import app.rag_explain as rag_explain
+import app.redis_cache as redis_cache
+from app.explain_cache import explanation_cache
+from app.xgb_model import FastPredictor, load_model
+import scripts.consumer_predictor as cp
+from scripts.build_rag_store import synth_doc
+from scripts.producer_simulator import TokenBucket, kickoff_event, rand_match, random_event
+
+# ---------------------------------------------------------------- stage timing
+
+class Stages:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.samples[name].append(seconds)
+
+    @contextmanager
+    def time(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def wrap(self, name: str, fn):
+        def timed(*a, **kw):
+            with self.time(name):
+                return fn(*a, **kw)
+        return timed
+
+    def summary(self) -> dict:
+        out = {}
+        for name, xs in sorted(self.samples.items()):
+            ms = np.asarray(xs) * 1000.0
+            out[name] = {
+                "count": int(len(ms)),
+                "mean_ms": float(ms.mean()),
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+            }
+        return out
+
+stages = Stages()
+
+# ---------------------------------------------------------------- kafka stand-in
+
+class MemoryMessage:
+    def __init__(self, topic, partition, key, value, headers):
+        self._topic, self._partition, self._key, self._value, self._headers = topic, partition, key, value, headers
+
+    def topic(self): return self._topic
+    def partition(self): return self._partition
+    def key(self): return self._key
+    def value(self): return self._value
+    def headers(self): return self._headers
+    def error(self): return None
+
+class MemoryBroker:
+    def __init__(self, partitions: int = 3):
+        self.partitions = partitions
+        self.cond = threading.Condition()
+        self.logs: dict[tuple[str, int], list] = defaultdict(list)
+        self.produced = 0
+
+    def append(self, msg: MemoryMessage):
+        with self.cond:
+            self.logs[(msg.topic(), msg.partition())].append(msg)
+            self.produced += 1
+            self.cond.notify_all()
+
+class MemoryProducer:
+    def __init__(self, broker: MemoryBroker):
+        self.broker = broker
+
+    def produce(self, topic, value, key=None, headers=None):
+        if isinstance(key, str):
+            key = key.encode()
+        part = (zlib.crc32(key) if key is not None else random.getrandbits(16)) % self.broker.partitions
+        self.broker.append(MemoryMessage(topic, part, key, value, headers))
+
+    def poll(self, timeout=0):
+        return 0
+
+    def flush(self, timeout=None):
+        return 0
+
+class MemoryConsumer:
+    def __init__(self, broker: MemoryBroker, topics: list[str]):
+        self.broker = broker
+        self.topics = topics
+        self.offsets: dict[tuple[str, int], int] = defaultdict(int)
+
+    def _take(self, n: int) -> list:
+        out = []
+        # round-robin over partitions, like librdkafka's fetch queue
+        while len(out) < n:
+            progressed = False
+            for t in self.topics:
+                for p in range(self.broker.partitions):
+                    log = self.broker.logs[(t, p)]
+                    off = self.offsets[(t, p)]
+                    if off < len(log):
+                        out.append(log[off])
+                        self.offsets[(t, p)] = off + 1
+                        progressed = True
+                        if len(out) >= n:
+                            return out
+            if not progressed:
+                break
+        return out
+
+    def lag(self) -> int:
+        with self.broker.cond:
+            return sum(len(self.broker.logs[(t, p)]) - self.offsets[(t, p)]
+                       for t in self.topics for p in range(self.broker.partitions))
+
+    def consume(self, num_messages=1, timeout=-1):
+        deadline = time.time() + max(0.0, timeout)
+        with self.broker.cond:
+            while True:
+                msgs = self._take(num_messages)
+                if msgs or time.time() >= deadline:
+                    return msgs
+                self.broker.cond.wait(deadline - time.time())
+
+    def poll(self, timeout=None):
+        msgs = self.consume(1, timeout or 0)
+        return msgs[0] if msgs else None
+
+    def close(self):
+        pass
+
+# ---------------------------------------------------------------- other stand-ins
+
+class StubLLM(LLMClient):
+    def __init__(self, latency_sec: float):
+        self.latency_sec = latency_sec
+
+    def chat(self, system: str, user: str, max_tokens: int = 350, temperature: float = 0.2) -> str:
+        with stages.time("llm_call"):
+            time.sleep(self.latency_sec)
+        return "- stub explanation"
+
+def build_rag(n_docs: int, rng: random.Random):
+    random.seed(rng.random())  # synth_doc uses the module-level random
+    docs = {}
+    texts = []
+    for i in range(1, n_docs + 1):
+        text, meta = synth_doc()
+        docs[i] = SimpleNamespace(id=i, doc_type="historical_match", text=text, meta=meta)
+        texts.append(text)
+    embs = embed_texts_sparse(texts)
+    index = SparseRagIndex()
+    index.add(
+        list(docs),
+        [(embs.indices[embs.indptr[i]:embs.indptr[i + 1]], embs.data[embs.indptr[i]:embs.indptr[i + 1]])
+         for i in range(n_docs)],
+    )
+
+    def retrieve_top_k(db, query: str, k: int = 5):
+        with stages.time("rag_retrieval"):
+            ids, _ = index.search(embed_text_sparse(query), k)
+            top = [docs[i] for i in ids.tolist()]
+        return top, [{"doc_id": d.id, "doc_type": d.doc_type, "meta": d.meta} for d in top]
+
+    return retrieve_top_k
+
+def make_sqlite_sessionmaker(path: str):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"timeout": 30, "check_same_thread": False})
+    Base.metadata.create_all(
+        bind=engine,
+        tables=[Match.__table__, MatchEvent.__table__, PlayerEvent.__table__, Prediction.__table__],
+    )
+
+    class TimedSession(Session):
+        def commit(self):
+            with stages.time("db_commit"):
+                super().commit()
+
+    return sessionmaker(bind=engine, class_=TimedSession, autoflush=False, autocommit=False), engine
+
+def install_fakeredis():
+    import fakeredis
+    fr = fakeredis.FakeRedis(decode_responses=True)
+    redis_cache.r = fr
+    redis_cache._apply_delta = fr.register_script(redis_cache._APPLY_DELTA_LUA)
+    redis_cache._set_pred_if_ts = fr.register_script(redis_cache._SET_PRED_IF_TS_LUA)
+    explanation_cache.redis = fr
+    return fr
+
+# ---------------------------------------------------------------- event source
+
+def generate(args, producer: MemoryProducer, sent_at: dict):
+    rng = random.Random(args.seed)
+    match_ids, meta = [], {}
+    for _ in range(args.matches):
+        mid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        home, away = rand_match(rng)
+        match_ids.append(mid)
+        meta[mid] = {"home": home, "away": away}
+
+    n_events = defaultdict(int)
+    bucket = TokenBucket(args.eps)
+
+    def emit(topic, ev, mid):
+        bucket.take()
+        ev["_bench_id"] = len(sent_at)
+        sent_at[ev["_bench_id"]] = time.perf_counter()
+        cp.send_json(producer, topic, ev, key=mid)
+
+    for mid in match_ids:
+        emit(settings.topic_match_events, kickoff_event(mid, meta[mid]), mid)
+    for _ in range(args.events):
+        mid = rng.choice(match_ids)
+        topic, ev = random_event(rng, mid, meta[mid], n_events[mid] // 5)
+        n_events[mid] += 1
+        emit(topic, ev, mid)
+
+# ---------------------------------------------------------------- run
+
+def git_rev() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser(description="consumer_predictor benchmark with local stand-ins")
+    ap.add_argument("--events", type=int, default=20000)
+    ap.add_argument("--matches", type=int, default=200)
+    ap.add_argument("--eps", type=float, default=0.0, help="paced producer rate; 0 = produce everything up front")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--batch-size", type=int, default=settings.consumer_batch_size, help="1 = per-event path")
+    ap.add_argument("--max-wait-ms", type=int, default=settings.consumer_batch_max_wait_ms)
+    ap.add_argument("--reorder-window-ms", type=int, default=0)
+    ap.add_argument("--predict-every", type=int, default=settings.predict_every_n_events)
+    ap.add_argument("--codec", default=settings.kafka_codec)
+    ap.add_argument("--llm-latency-ms", type=float, default=800.0)
+    ap.add_argument("--explain", choices=["async", "sync", "off"], default="async")
+    ap.add_argument("--rag-docs", type=int, default=2000)
+    ap.add_argument("--out", default="bench_results.json")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    settings.kafka_codec = args.codec
+    settings.predict_every_n_events = args.predict_every
+    settings.event_writer = "orm"
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    SessionLocal, engine = make_sqlite_sessionmaker(os.path.join(tmpdir, "bench.db"))
+    cp.SessionLocal = SessionLocal
+    explain_worker.SessionLocal = SessionLocal
+    install_fakeredis()
+    rag_explain.retrieve_top_k = build_rag(args.rag_docs, rng)
+    llm = StubLLM(args.llm_latency_ms / 1000.0)
+    rag_explain.get_llm_client = lambda: llm
+
+    broker = MemoryBroker()
+    producer = MemoryProducer(broker)
+    consumer = MemoryConsumer(broker, list(cp.event_kinds()))
+    model = FastPredictor(load_model(cp.MODEL_PATH))
+
+    # stage instrumentation around the real code path
+    sent_at: dict[int, float] = {}
+    batch_sent: dict[str, float] = {}
+    pred_at: dict[tuple, float] = {}
+
+    cp.consume_messages = stages.wrap("kafka_consume_decode", cp.consume_messages)
+    cp.feature_row = stages.wrap("feature_build", cp.feature_row)
+    cp.state_store.apply = stages.wrap("redis_state", cp.state_store.apply)
+    cp.state_store.preview = stages.wrap("redis_state", cp.state_store.preview)
+    cp.apply_match_delta = stages.wrap("redis_state", cp.apply_match_delta)
+    model.predict_batch = stages.wrap("xgb_inference", model.predict_batch)
+    model.predict_row = stages.wrap("xgb_inference", model.predict_row)
+    rag_explain.explain_prediction = stages.wrap("explanation_total", rag_explain.explain_prediction)
+    explain_worker.explain_prediction = rag_explain.explain_prediction
+    cp.explain_prediction = rag_explain.explain_prediction
+
+    orig_publish = cp.publish_prediction
+    def publish_prediction(prod, out):
+        with stages.time("publish"):
+            orig_publish(prod, out)
+        now = time.perf_counter()
+        pred_at[(out["match_id"], out["ts"])] = now
+        if out["match_id"] in batch_sent:
+            stages.add("e2e_event_to_prediction", now - batch_sent[out["match_id"]])
+    cp.publish_prediction = publish_prediction
+
+    orig_send = explain_worker.send_json
+    def explained_send(prod, topic, out, **kw):
+        orig_send(prod, topic, out, **kw)
+        t = pred_at.get((out["match_id"], out["ts"]))
+        if t is not None:
+            stages.add("e2e_prediction_to_explanation", time.perf_counter() - t)
+    explain_worker.send_json = explained_send
+
+    def record_ingest(events):
+        now = time.perf_counter()
+        for _, ev in events:
+            t = sent_at.get(ev.get("_bench_id"))
+            if t is not None:
+                stages.add("e2e_event_ingested", now - t)
+
+    orig_ingest_batch = cp.ingest_batch
+    def ingest_batch(events, model, prod, partitions=None):
+        batch_sent.clear()
+        for _, ev in events:
+            t = sent_at.get(ev.get("_bench_id"))
+            if t is not None:
+                batch_sent[ev["match_id"]] = max(batch_sent.get(ev["match_id"], 0.0), t)
+        with stages.time("ingest_batch"):
+            orig_ingest_batch(events, model, prod, partitions)
+        record_ingest(events)
+    cp.ingest_batch = ingest_batch
+
+    if args.explain == "async":
+        cp.explainer = cp.ExplanationWorker(producer, settings.explain_workers, settings.explain_queue_size).start()
+    elif args.explain == "off":
+        cp.explain_prediction = lambda *a, **kw: (None, [])
+    cp.event_writer = None
+
+    gen = threading.Thread(target=generate, args=(args, producer, sent_at), daemon=True)
+    total = args.events + args.matches
+    t0 = time.perf_counter()
+    gen.start()
+    if args.eps <= 0:
+        gen.join()
+        t0 = time.perf_counter()  # throughput mode: time consumption only
+
+    reorder = cp.ReorderBuffer(args.reorder_window_ms / 1000.0)
+    kinds = cp.event_kinds()
+    processed = 0
+    while processed < total:
+        if not gen.is_alive() and not consumer.lag() and not len(reorder):
+            break  # generator died early; report what got through
+        if args.batch_size <= 1:
+            polled = cp.poll_message(consumer, timeout=0.05)
+            if polled:
+                topic, part, ev = polled
+                reorder.push(kinds[topic], ev, part)
+            for kind, ev, _ in reorder.pop_ready():
+                batch_sent[ev["match_id"]] = sent_at.get(ev["_bench_id"], 0.0)
+                with stages.time("ingest_event"):
+                    if kind == "match":
+                        cp.ingest_one_match_event(ev, model, producer)
+                    else:
+                        cp.ingest_one_player_event(ev, model, producer)
+                record_ingest([(kind, ev)])
+                processed += 1
+        else:
+            cp.consume_into(consumer, reorder, args.batch_size, args.max_wait_ms)
+            ready = reorder.pop_ready() if consumer.lag() or gen.is_alive() else reorder.drain()
+            processed += cp.ingest_ready(ready, model, producer)
+    elapsed = time.perf_counter() - t0
+
+    expl_wait = time.perf_counter()
+    if cp.explainer is not None:
+        cp.explainer.close(timeout=60.0)
+    expl_elapsed = time.perf_counter() - expl_wait
+
+    result = {
+        "git_rev": git_rev(),
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "events": processed,
+        "elapsed_sec": elapsed,
+        "throughput_eps": processed / elapsed if elapsed else 0.0,
+        "explanation_drain_sec": expl_elapsed,
+        "explanations": None if cp.explainer is None else {
+            "done": cp.explainer.done, "failed": cp.explainer.failed, "dropped": cp.explainer.dropped,
+        },
+        "explanation_cache": explanation_cache.stats(),
+        "stages": stages.summary(),
+    }
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{processed} events in {elapsed:.2f}s -> {result['throughput_eps']:.0f} events/sec")
+    print(f"{'stage':<32}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, s in result["stages"].items():
+        print(f"{name:<32}{s['count']:>8}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+    print(f"results written to {args.out}")
+    engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import time
+import numpy as np
+
+from app.features import FEATURE_COLUMNS, build_features_from_state, rows_to_matrix, to_model_row
+from app.xgb_model import FastPredictor, load_model, predict_proba
+
+MODEL_PATH = "xgb_match_outcome.joblib"
+
+def random_rows(n: int, rng: np.random.Generator) -> np.ndarray:
+    rows = []
+    for _ in range(n):
+        state = {
+            "minute": int(rng.integers(0, 96)),
+            "home_goals": int(rng.binomial(3, 0.25)),
+            "away_goals": int(rng.binomial(3, 0.25)),
+            "home_shots": int(rng.integers(0, 20)),
+            "away_shots": int(rng.integers(0, 20)),
+            "home_xg": float(rng.uniform(0, 3.5)),
+            "away_xg": float(rng.uniform(0, 3.5)),
+            "home_corners": int(rng.integers(0, 10)),
+            "away_corners": int(rng.integers(0, 10)),
+            "home_fouls": int(rng.integers(0, 15)),
+            "away_fouls": int(rng.integers(0, 15)),
+        }
+        rows.append(to_model_row(build_features_from_state(state)))
+    return rows_to_matrix(rows)
+
+def check_parity(model, fast: FastPredictor, X: np.ndarray, atol: float) -> float:
+    worst = 0.0
+    for x in X:
+        a = predict_proba(model, x)
+        b = fast.predict_row(x)
+        worst = max(worst, max(abs(a[c] - b[c]) for c in a))
+    batch = fast.predict_batch(X)
+    expected = model.predict_proba(X)
+    for got, exp in zip(batch, expected):
+        worst = max(worst, float(np.max(np.abs(np.array(list(got.values())) - exp))))
+    if worst > atol:
+        raise SystemExit(f"parity check failed: max abs diff {worst:.2e} > {atol:.0e}")
+    return worst
+
+def time_per_row(fn, X: np.ndarray, warmup: int = 200) -> np.ndarray:
+    for x in X[:warmup]:
+        fn(x)
+    out = np.empty(len(X), dtype=np.float64)
+    for i, x in enumerate(X):
+        t0 = time.perf_counter_ns()
+        fn(x)
+        out[i] = (time.perf_counter_ns() - t0) / 1000.0
+    return out
+
+def report(name: str, us: np.ndarray):
+    print(
+        f"{name:<28} p50={np.percentile(us, 50):8.1f}us  p99={np.percentile(us, 99):8.1f}us  "
+        f"mean={us.mean():8.1f}us"
+    )
+
+def main():
+    ap = argparse.ArgumentParser(description="parity check + per-row latency of the XGBoost serving paths")
+    ap.add_argument("--model", default=MODEL_PATH)
+    ap.add_argument("--rows", type=int, default=5000, help="rows to time per path")
+    ap.add_argument("--parity-rows", type=int, default=1000)
+    ap.add_argument("--atol", type=float, default=1e-6)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    model = load_model(args.model)
+    fast = FastPredictor(model)
+
+    worst = check_parity(model, fast, random_rows(args.parity_rows, rng), args.atol)
+    print(f"parity ok on {args.parity_rows} rows (max abs diff {worst:.2e}), {len(FEATURE_COLUMNS)} features")
+
+    X = random_rows(args.rows, rng)
+    base = time_per_row(lambda x: predict_proba(model, x), X)
+    quick = time_per_row(fast.predict_row, X)
+    report("XGBClassifier.predict_proba", base)
+    report("FastPredictor.predict_row", quick)
+    print(f"p50 speedup x{np.percentile(base, 50) / np.percentile(quick, 50):.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
+import argparse
 from sqlalchemy import text, create_engine
 from app.config import settings
 from app.db import engine, Base
 from app import models
+from app.partitions import PARTITIONED_TABLES, ensure_partitioned_tables, ensure_partitions, table_kind
 
 def admin_engine():
     url = (
@@ -21,9 +23,47 @@ def ensure_db():
             c.execute(text(f'CREATE DATABASE "{settings.pg_db}"'))
             print(f"Created database {settings.pg_db}")
 
+def ensure_columns():
+    # create_all() does not touch existing tables; add columns introduced since.
+    # runs before ensure_partitioned_tables(): ATTACH needs an old heap's columns to match the model's
+    with engine.begin() as c:
+        c.execute(text("ALTER TABLE rag_docs ADD COLUMN IF NOT EXISTS embedding_idx INTEGER[]"))
+        c.execute(text("ALTER TABLE rag_docs ADD COLUMN IF NOT EXISTS embedding_val FLOAT[]"))
+        c.execute(text("ALTER TABLE matches ADD COLUMN IF NOT EXISTS finished_at TIMESTAMPTZ"))
+        c.execute(text("ALTER TABLE IF EXISTS player_events ADD COLUMN IF NOT EXISTS minute INTEGER"))
+        c.execute(text("CREATE INDEX IF NOT EXISTS ix_matches_finished_at ON matches (finished_at)"))
+
+def ensure_indexes():
+    # indexes added since create_all() first ran; CONCURRENTLY so a live table keeps taking writes
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as c:
+        if table_kind(c, "predictions") == "partitioned":
+            return  # created with the partitioned table (CONCURRENTLY isn't allowed there)
+        c.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_predictions_match_ts_id "
+            "ON predictions (match_id, ts DESC, id DESC)"
+        ))
+        # superseded by the composite index (same leading column)
+        c.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_predictions_match_id"))
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--migrate-partitions", action="store_true",
+                    help="convert existing unpartitioned event/prediction tables (stop the consumers first)")
+    args = ap.parse_args()
+
     ensure_db()
-    Base.metadata.create_all(bind=engine)
+    # matches, rag_docs: plain tables. the event/prediction tables are created partitioned by day
+    Base.metadata.create_all(
+        bind=engine,
+        tables=[t for t in Base.metadata.sorted_tables if t.name not in PARTITIONED_TABLES],
+    )
+    ensure_columns()
+    left = ensure_partitioned_tables(engine, migrate=args.migrate_partitions)
+    for name in left:
+        print(f"{name} is an unpartitioned table from an older bootstrap; "
+              f"re-run with --migrate-partitions to convert it")
+    ensure_partitions(engine, days_ahead=settings.partition_days_ahead)
+    ensure_indexes()
     print("Tables created.")
 
 if __name__ == "__main__":
@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 
 from app.db import SessionLocal
 from app.models import RagDoc
-from app.rag_explain import embed_text
+from app.embeddings import embed_texts_sparse
 
 TEAMS = ["Real Madrid", "Barcelona", "Man City", "Arsenal", "Bayern", "PSG", "Inter", "Milan", "Atletico", "Dortmund"]
 
@@ -41,11 +41,19 @@ def main(n_docs: int = 200):
             print(f"RAG store already has {existing} docs. (Skipping)")
             return
 
+        synth = [synth_doc() for _ in range(n_docs)]
+        embs = embed_texts_sparse([text for text, _ in synth])
+
         docs = []
-        for _ in range(n_docs):
-            text, meta = synth_doc()
-            emb = embed_text(text)
-            docs.append(RagDoc(doc_type="historical_match", text=text, meta=meta, embedding=emb))
+        for i, (text, meta) in enumerate(synth):
+            start, end = embs.indptr[i], embs.indptr[i + 1]
+            docs.append(RagDoc(
+                doc_type="historical_match",
+                text=text,
+                meta=meta,
+                embedding_idx=embs.indices[start:end].tolist(),
+                embedding_val=embs.data[start:end].tolist(),
+            ))
 
         db.add_all(docs)
         db.commit()
@@ -1,23 +1,45 @@
 from __future__ import annotations
 from datetime import datetime, timezone
+import argparse
+import json
+import os
+import signal
+import threading
 import time
-import numpy as np
 from sqlalchemy.orm import Session
 
 from app.log import get_logger
 from app.config import settings
-from app.kafka_io import make_consumer, make_producer, poll_json, send_json
+from confluent_kafka import KafkaException
+from app.kafka_io import make_consumer, make_producer, poll_message, consume_messages, send_json
 from app.db import SessionLocal
 from app.models import Match, MatchEvent, PlayerEvent, Prediction
-from app.redis_cache import get_match_state, set_match_state, set_latest_prediction
-from app.features import build_features_from_state, to_model_row
-from app.xgb_model import load_model, predict_proba
+from app.redis_cache import apply_match_delta, set_latest_prediction
+from app.state import update_state_with_match_event, update_state_with_player_event
+from app.state_store import LocalStateStore, RedisStateStore
+from app.reorder import ReorderBuffer
+from app.features import build_features_from_state, to_model_row, rows_to_matrix
+from app.xgb_model import load_model, FastPredictor
 from app.rag_explain import explain_prediction
+from app.explain_worker import ExplainJob, ExplanationWorker
+from app.explain_cache import explanation_cache
+from app.bulk_writer import WriteBehindWriter
+from app.profiler import capture_in_background, install_signal_handler
+from app.metrics import EVENTS_CONSUMED, PREDICTIONS, start_metrics_server, timed, update_consumer_lag
 
 log = get_logger("consumer_predictor")
 MODEL_PATH = "xgb_match_outcome.joblib"
 MODEL_VERSION = "xgb_v1"
 
+# set in main() when EXPLAIN_ASYNC is on; None = explain inline
+explainer: ExplanationWorker | None = None
+# set in main() when EVENT_WRITER=copy; None = events are inserted through the ORM
+event_writer: WriteBehindWriter | None = None
+# partition workers swap in a LocalStateStore
+state_store: RedisStateStore | LocalStateStore = RedisStateStore()
+# checkpoint() gives up on the event COPY after this long
+CHECKPOINT_FLUSH_TIMEOUT_SEC = 30.0
+
 def utc_now():
     return datetime.now(timezone.utc)
 
@@ -28,63 +50,22 @@ def ensure_match_row(db: Session, match_id: str, home: str, away: str, comp: str
         db.add(m)
         db.commit()
 
-def update_state_with_match_event(state: dict, ev: dict) -> dict:
-    minute = int(ev.get("minute", state.get("minute", 0)))
-    state["minute"] = max(state.get("minute", 0), minute)
-
-    et = ev["event_type"]
-    team_side = ev.get("team_side")  # "home" or "away"
-
-    if et == "goal":
-        if team_side == "home":
-            state["home_goals"] = int(state.get("home_goals", 0)) + 1
-        elif team_side == "away":
-            state["away_goals"] = int(state.get("away_goals", 0)) + 1
-
-    if et == "shot":
-        if team_side == "home":
-            state["home_shots"] = int(state.get("home_shots", 0)) + 1
-        elif team_side == "away":
-            state["away_shots"] = int(state.get("away_shots", 0)) + 1
-
-    if et == "corner":
-        if team_side == "home":
-            state["home_corners"] = int(state.get("home_corners", 0)) + 1
-        elif team_side == "away":
-            state["away_corners"] = int(state.get("away_corners", 0)) + 1
-
-    if et == "foul":
-        if team_side == "home":
-            state["home_fouls"] = int(state.get("home_fouls", 0)) + 1
-        elif team_side == "away":
-            state["away_fouls"] = int(state.get("away_fouls", 0)) + 1
-
-    payload = ev.get("payload") or {}
-    if "xg" in payload:
-        if team_side == "home":
-            state["home_xg"] = float(state.get("home_xg", 0.0)) + float(payload["xg"])
-        elif team_side == "away":
-            state["away_xg"] = float(state.get("away_xg", 0.0)) + float(payload["xg"])
-
-    state["n_events"] = int(state.get("n_events", 0)) + 1
-    return state
-
-def update_state_with_player_event(state: dict, ev: dict) -> dict:
-    minute = int(ev.get("minute", state.get("minute", 0)))
-    state["minute"] = max(state.get("minute", 0), minute)
-
-    team_side = ev.get("team_side")
-    stat = ev.get("stat_type")
-    val = float(ev.get("value", 0.0))
-
-    if stat == "xg":
-        if team_side == "home":
-            state["home_xg"] = float(state.get("home_xg", 0.0)) + val
-        elif team_side == "away":
-            state["away_xg"] = float(state.get("away_xg", 0.0)) + val
-
-    state["n_events"] = int(state.get("n_events", 0)) + 1
-    return state
+def ensure_match_rows(db: Session, first_events: dict):
+    # batch variant of ensure_match_row: one SELECT for all ids, no commit
+    ids = list(first_events)
+    existing = {mid for (mid,) in db.query(Match.id).filter(Match.id.in_(ids))}
+    for mid in ids:
+        if mid in existing:
+            continue
+        ev = first_events[mid]
+        db.add(Match(
+            id=mid,
+            home_team=ev.get("home_team", "HOME"),
+            away_team=ev.get("away_team", "AWAY"),
+            competition=ev.get("competition", "UEFA"),
+            kickoff_ts=utc_now(),
+            status="live",
+        ))
 
 def make_match_prompt(home: str, away: str, state: dict) -> str:
     return (
@@ -96,23 +77,20 @@ def make_match_prompt(home: str, away: str, state: dict) -> str:
         f"Fouls {state.get('home_fouls', 0)}-{state.get('away_fouls', 0)}."
     )
 
-def maybe_predict(db: Session, match_id: str, home: str, away: str, state: dict, model, prod):
-    n = int(state.get("n_events", 0))
-    if n == 0 or (n % settings.predict_every_n_events != 0):
-        return
-
-    f = build_features_from_state(state)
-    row = to_model_row(f)
+def should_predict(prev_n: int, n: int) -> bool:
+    # true if folding events took n_events across a multiple of PREDICT_EVERY_N_EVENTS
+    every = settings.predict_every_n_events
+    return n > 0 and (n // every) > (prev_n // every)
 
-    cols = [
-        "minute","goal_diff","xg_diff","shot_diff","corner_diff","foul_diff",
-        "home_xg","away_xg","home_shots","away_shots","uncertainty"
-    ]
-    X = np.array([row[c] for c in cols], dtype=np.float32)
-    probs = predict_proba(model, X)
+def feature_row(state: dict) -> dict:
+    return to_model_row(build_features_from_state(state))
 
+def build_prediction(db: Session, match_id: str, home: str, away: str, state: dict, row: dict, probs: dict) -> tuple[Prediction, dict, str]:
     prompt = make_match_prompt(home, away, state)
-    explanation, citations = explain_prediction(db, prompt, probs, k=settings.rag_top_k)
+    if explainer is None:
+        explanation, citations = explain_prediction(db, prompt, probs, k=settings.rag_top_k, situation=state)
+    else:
+        explanation, citations = None, []
 
     pred_row = Prediction(
         match_id=match_id,
@@ -124,8 +102,6 @@ def maybe_predict(db: Session, match_id: str, home: str, away: str, state: dict,
         features=row,
         explanation=explanation
     )
-    db.add(pred_row)
-    db.commit()
 
     out = {
         "match_id": match_id,
@@ -134,11 +110,95 @@ def maybe_predict(db: Session, match_id: str, home: str, away: str, state: dict,
         "probs": probs,
         "features": row,
         "explanation": explanation,
+        "explanation_status": "ready" if explainer is None else "pending",
         "rag_citations": citations
     }
+    return pred_row, out, prompt
+
+def publish_prediction(prod, out: dict):
+    with timed("redis_pred_write"):
+        set_latest_prediction(out["match_id"], out)
+    with timed("kafka_publish"):
+        send_json(prod, settings.topic_predictions, out, key=out["match_id"])
+    PREDICTIONS.inc()
+
+def request_explanation(prediction_id: int, prompt: str, out: dict, state: dict):
+    if explainer is None:
+        return
+    if not explainer.submit(ExplainJob(prediction_id, prompt, out["probs"], out, dict(state))):
+        log.warning(f"explanation queue full, skipping match_id={out['match_id']}")
+
+def maybe_predict(db: Session, match_id: str, home: str, away: str, state: dict, model, prod):
+    n = int(state.get("n_events", 0))
+    if n == 0 or (n % settings.predict_every_n_events != 0):
+        return
+
+    with timed("feature_build"):
+        row = feature_row(state)
+    with timed("xgb_inference"):
+        probs = model.predict_row(rows_to_matrix([row])[0])
+
+    pred_row, out, prompt = build_prediction(db, match_id, home, away, state, row, probs)
+    with timed("db_insert"):
+        db.add(pred_row)
+        db.flush()  # assigns pred_row.id for the explanation update
+        pred_id = pred_row.id
+        db.commit()
+
+    publish_prediction(prod, out)
+    request_explanation(pred_id, prompt, out, state)
+
+def match_event_row(ev: dict) -> MatchEvent:
+    return MatchEvent(
+        match_id=ev["match_id"],
+        ts=datetime.fromisoformat(ev["ts"]),
+        minute=ev.get("minute"),
+        event_type=ev["event_type"],
+        team=ev.get("team"),
+        player=ev.get("player"),
+        payload=ev.get("payload") or {},
+    )
+
+def player_event_row(ev: dict) -> PlayerEvent:
+    return PlayerEvent(
+        match_id=ev["match_id"],
+        ts=datetime.fromisoformat(ev["ts"]),
+        minute=ev.get("minute"),
+        player=ev["player"],
+        team=ev.get("team"),
+        stat_type=ev["stat_type"],
+        value=float(ev.get("value", 0.0)),
+        payload=ev.get("payload") or {},
+    )
+
+def match_event_copy_row(ev: dict) -> tuple:
+    # same columns as match_event_row, in bulk_writer.COPY_COLUMNS order
+    return (
+        ev["match_id"], datetime.fromisoformat(ev["ts"]), ev.get("minute"), ev["event_type"],
+        ev.get("team"), ev.get("player"), json.dumps(ev.get("payload") or {}),
+    )
+
+def player_event_copy_row(ev: dict) -> tuple:
+    return (
+        ev["match_id"], datetime.fromisoformat(ev["ts"]), ev.get("minute"), ev["player"], ev.get("team"),
+        ev["stat_type"], float(ev.get("value", 0.0)), json.dumps(ev.get("payload") or {}),
+    )
 
-    set_latest_prediction(match_id, out)
-    send_json(prod, settings.topic_predictions, out)
+def stage_events(db: Session, events: list[tuple[str, dict]]):
+    # ORM mode: events join db's transaction. copy mode: nothing to do until commit
+    if event_writer is not None:
+        return
+    for kind, ev in events:
+        db.add(match_event_row(ev) if kind == "match" else player_event_row(ev))
+
+def write_behind_events(events: list[tuple[str, dict]]):
+    # call after the match rows are committed, the events reference them
+    if event_writer is None:
+        return
+    match_rows = [match_event_copy_row(ev) for kind, ev in events if kind == "match"]
+    player_rows = [player_event_copy_row(ev) for kind, ev in events if kind == "player"]
+    event_writer.add_many("match_events", match_rows)
+    event_writer.add_many("player_events", player_rows)
 
 def ingest_one_match_event(ev: dict, model, prod):
     db: Session = SessionLocal()
@@ -148,22 +208,16 @@ def ingest_one_match_event(ev: dict, model, prod):
         away = ev.get("away_team", "AWAY")
         ensure_match_row(db, match_id, home, away, ev.get("competition", "UEFA"))
 
-        db.add(MatchEvent(
-            match_id=match_id,
-            ts=datetime.fromisoformat(ev["ts"]),
-            minute=ev.get("minute"),
-            event_type=ev["event_type"],
-            team=ev.get("team"),
-            player=ev.get("player"),
-            payload=ev.get("payload") or {},
-        ))
-        db.commit()
+        with timed("db_insert"):
+            stage_events(db, [("match", ev)])
+            db.commit()
+        write_behind_events([("match", ev)])
 
-        state = get_match_state(match_id)
-        state = update_state_with_match_event(state, ev)
-        state["home_team"] = home
-        state["away_team"] = away
-        set_match_state(match_id, state)
+        delta = update_state_with_match_event({}, ev)
+        delta["home_team"] = home
+        delta["away_team"] = away
+        with timed("redis_state"):
+            state = apply_match_delta(match_id, delta)
 
         maybe_predict(db, match_id, home, away, state, model, prod)
     finally:
@@ -177,67 +231,303 @@ def ingest_one_player_event(ev: dict, model, prod):
         away = ev.get("away_team", "AWAY")
         ensure_match_row(db, match_id, home, away, ev.get("competition", "UEFA"))
 
-        db.add(PlayerEvent(
-            match_id=match_id,
-            ts=datetime.fromisoformat(ev["ts"]),
-            player=ev["player"],
-            team=ev.get("team"),
-            stat_type=ev["stat_type"],
-            value=float(ev.get("value", 0.0)),
-            payload=ev.get("payload") or {},
-        ))
-        db.commit()
+        with timed("db_insert"):
+            stage_events(db, [("player", ev)])
+            db.commit()
+        write_behind_events([("player", ev)])
 
-        state = get_match_state(match_id)
-        state = update_state_with_player_event(state, ev)
-        state["home_team"] = home
-        state["away_team"] = away
-        set_match_state(match_id, state)
+        delta = update_state_with_player_event({}, ev)
+        delta["home_team"] = home
+        delta["away_team"] = away
+        with timed("redis_state"):
+            state = apply_match_delta(match_id, delta)
 
         maybe_predict(db, match_id, home, away, state, model, prod)
     finally:
         db.close()
 
-def main():
-    model = load_model(MODEL_PATH)
-    prod = make_producer()
+def ingest_batch(events: list[tuple[str, dict]], model, prod, partitions: dict | None = None):
+    """
+    events is a list of ("match" | "player", event) in arrival order; partitions
+    optionally maps match_id -> Kafka partition for the partition-local state store.
+    Events are grouped by match and folded into one state delta per match; the
+    whole batch is written in one DB transaction, and only once that has committed
+    are the deltas applied to the state store (atomically, one pipelined round trip
+    for Redis). Predictions are made from the previewed states.
+    """
+    by_match: dict[str, list[tuple[str, dict]]] = {}
+    for kind, ev in events:
+        by_match.setdefault(ev["match_id"], []).append((kind, ev))
+
+    deltas = {}
+    for mid, group in by_match.items():
+        delta = {}
+        for kind, ev in group:
+            if kind == "match":
+                delta = update_state_with_match_event(delta, ev)
+            else:
+                delta = update_state_with_player_event(delta, ev)
+        last = group[-1][1]
+        delta["home_team"] = last.get("home_team", "HOME")
+        delta["away_team"] = last.get("away_team", "AWAY")
+        deltas[mid] = delta
+
+    with timed("redis_state", items=len(deltas)):
+        states = state_store.preview(deltas)
+    preds = []
+
+    db: Session = SessionLocal()
+    try:
+        ensure_match_rows(db, {mid: group[0][1] for mid, group in by_match.items()})
+        db.flush()  # match rows must exist before the events that reference them
+
+        stage_events(db, events)
+
+        to_predict = []
+        for mid, state in states.items():
+            n = int(state.get("n_events", 0))
+            if should_predict(n - deltas[mid]["n_events"], n):
+                to_predict.append((mid, state["home_team"], state["away_team"], state))
+
+        # score every match due a prediction in this batch with a single booster call
+        rows, all_probs = [], []
+        if to_predict:
+            with timed("feature_build", items=len(to_predict)):
+                rows = [feature_row(state) for _, _, _, state in to_predict]
+            with timed("xgb_inference", items=len(to_predict)):
+                all_probs = model.predict_batch(rows_to_matrix(rows))
+
+        pending = []
+        for (mid, home, away, state), row, probs in zip(to_predict, rows, all_probs):
+            pred_row, out, prompt = build_prediction(db, mid, home, away, state, row, probs)
+            db.add(pred_row)
+            pending.append((pred_row, prompt, out, state))
+
+        with timed("db_insert", items=len(events) + len(pending)):
+            db.flush()  # assigns prediction ids for the explanation updates
+            preds = [(pred_row.id, prompt, out, state) for pred_row, prompt, out, state in pending]
+            db.commit()
+    finally:
+        db.close()
 
-    c_match = make_consumer(settings.topic_match_events)
-    c_player = make_consumer(settings.topic_player_events)
+    with timed("redis_state", items=len(deltas)):
+        state_store.apply(deltas, partitions)
+    write_behind_events(events)
+    for pred_id, prompt, out, state in preds:
+        publish_prediction(prod, out)
+        request_explanation(pred_id, prompt, out, state)
 
-    log.info("Consumer started. Listening to match + player topics...")
+def event_kinds() -> dict:
+    return {settings.topic_match_events: "match", settings.topic_player_events: "player"}
 
+def run_single(c, model, prod, reorder: ReorderBuffer):
+    kinds = event_kinds()
     processed = 0
     last_log = time.time()
 
-    try:
-        while True:
-            loop_start = time.time()
+    while True:
+        loop_start = time.time()
 
-            # poll both topics
-            ev = poll_json(c_match, timeout=0.05)
-            if ev:
-                ingest_one_match_event(ev, model, prod)
-                processed += 1
+        # wait no longer than the next buffered event is due
+        wait = reorder.next_release_in()
+        polled = poll_message(c, timeout=0.05 if wait is None else min(0.05, wait))
+        if polled:
+            topic, part, ev = polled
+            reorder.push(kinds[topic], ev, part)
+            EVENTS_CONSUMED.labels(topic).inc()
 
-            ev = poll_json(c_player, timeout=0.05)
-            if ev:
+        for kind, ev, _ in reorder.pop_ready():
+            if kind == "match":
+                ingest_one_match_event(ev, model, prod)
+            else:
                 ingest_one_player_event(ev, model, prod)
-                processed += 1
+            processed += 1
+
+        if time.time() - last_log > 2.0:
+            log.info(f"processed_events={processed} loop_ms={(time.time()-loop_start)*1000:.1f}")
+            update_consumer_lag(c)
+            last_log = time.time()
+
+def consume_into(c, reorder: ReorderBuffer, batch_size: int, max_wait_ms: int) -> int:
+    kinds = event_kinds()
+    wait = reorder.next_release_in()
+    timeout = max_wait_ms / 1000.0 if wait is None else min(max_wait_ms / 1000.0, wait)
+    msgs = consume_messages(c, batch_size, timeout)
+    for topic, part, ev in msgs:
+        reorder.push(kinds[topic], ev, part)
+        EVENTS_CONSUMED.labels(topic).inc()
+    return len(msgs)
+
+def ingest_ready(ready: list, model, prod) -> int:
+    if ready:
+        ingest_batch(
+            [(kind, ev) for kind, ev, _ in ready], model, prod,
+            {ev["match_id"]: part for _, ev, part in ready if part is not None},
+        )
+    return len(ready)
+
+def checkpoint(c, reorder: ReorderBuffer, model, prod):
+    """
+    make everything consumed so far durable, then commit the offsets: ingest what
+    is still held for reordering (a few ms early), wait for the event COPY, write
+    the in-memory match states to Redis. Partition workers commit only here
+    (auto-commit off), so after a crash Kafka replays whatever was still in memory.
+    If the event COPY timed out or dropped rows, nothing is committed or written
+    to Redis: the unflushed states are discarded and the worker exits, so the
+    supervisor restarts it from the last committed offsets and the events replay.
+    """
+    ingest_ready(reorder.drain(), model, prod)
+    if event_writer is not None and not event_writer.flush(CHECKPOINT_FLUSH_TIMEOUT_SEC):
+        state_store.discard()
+        raise RuntimeError("event writes are not durable (timed out or dropped rows); not committing offsets")
+    state_store.flush()
+    try:
+        c.commit(asynchronous=False)
+    except KafkaException:
+        pass  # nothing consumed since the last commit
 
-            if time.time() - last_log > 2.0:
-                log.info(f"processed_events={processed} loop_ms={(time.time()-loop_start)*1000:.1f}")
-                last_log = time.time()
+def run_batched(c, model, prod, reorder: ReorderBuffer, batch_size: int, max_wait_ms: int,
+                checkpoint_sec: float | None = None):
+    # checkpoint_sec: commit offsets by hand this often (consumer made with auto_commit=False)
+    processed = 0
+    last_log = time.time()
+    last_checkpoint = time.time()
+
+    while True:
+        loop_start = time.time()
+
+        consume_into(c, reorder, batch_size, max_wait_ms)
+        n = ingest_ready(reorder.pop_ready(), model, prod)
+        processed += n
+        if checkpoint_sec is None:
+            state_store.maybe_flush()
+        elif time.time() - last_checkpoint >= checkpoint_sec:
+            checkpoint(c, reorder, model, prod)
+            last_checkpoint = time.time()
+
+        if time.time() - last_log > 2.0:
+            log.info(
+                f"processed_events={processed} batch={n} buffered={len(reorder)} "
+                f"loop_ms={(time.time()-loop_start)*1000:.1f} "
+                f"expl_cache_hit_rate={explanation_cache.stats()['hit_rate']:.2f}"
+            )
+            update_consumer_lag(c)
+            last_log = time.time()
+
+def start_services(prod):
+    global explainer, event_writer
+    if settings.explain_async:
+        explainer = ExplanationWorker(prod, settings.explain_workers, settings.explain_queue_size).start()
+    if settings.event_writer == "copy":
+        event_writer = WriteBehindWriter(
+            flush_rows=settings.write_behind_flush_rows,
+            flush_interval_sec=settings.write_behind_flush_ms / 1000.0,
+            max_rows=settings.write_behind_max_rows,
+        ).start()
+
+def stop_services(prod):
+    if explainer is not None:
+        explainer.close()
+    if event_writer is not None:
+        event_writer.close()
+    state_store.flush()
+    prod.flush(2.0)
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(0)
+
+def run_partition_worker(worker_id: int, batch_size: int, max_wait_ms: int):
+    """
+    One process of scripts/consumer_supervisor.py: a single consumer subscribed to
+    both event topics, keeping the state of the matches on its partitions in memory.
+    """
+    global state_store
+
+    # let the finally below run (and flush) when the supervisor terminates us
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    # before the slow startup below: SIGUSR2's default action would kill the worker
+    install_signal_handler(f"consumer-worker-{worker_id}", settings.profile_seconds)
+
+    wlog = get_logger(f"consumer_worker_{worker_id}")
+    state_store = LocalStateStore(settings.state_flush_ms / 1000.0)
+    reorder = ReorderBuffer(settings.reorder_window_ms / 1000.0)
+
+    model = FastPredictor(load_model(MODEL_PATH))
+    prod = make_producer()
+    start_services(prod)
+    # one listener per worker process: METRICS_PORT + worker_id
+    if start_metrics_server(settings.metrics_port + worker_id if settings.metrics_port > 0 else 0):
+        wlog.info(f"metrics on :{settings.metrics_port + worker_id}/metrics")
+
+    def on_assign(consumer, parts):
+        wlog.info(f"assigned {sorted((p.topic, p.partition) for p in parts)}")
+
+    def on_revoke(consumer, parts):
+        # everything from the revoked partitions must be durable before the next owner starts
+        checkpoint(consumer, reorder, model, prod)
+        state_store.revoke({p.partition for p in parts})
+        wlog.info(f"revoked {sorted((p.topic, p.partition) for p in parts)}")
+
+    # offsets are committed only by checkpoint(): auto-commit could commit events still
+    # in the reorder buffer or in state not yet flushed to Redis, and a crash would lose them
+    c = make_consumer(list(event_kinds()), on_assign=on_assign, on_revoke=on_revoke, auto_commit=False)
+    try:
+        run_batched(c, model, prod, reorder, max(batch_size, 2), max_wait_ms,
+                    checkpoint_sec=settings.state_flush_ms / 1000.0)
     finally:
         try:
-            c_match.close()
+            c.close()  # runs on_revoke
         except Exception:
             pass
+        stop_services(prod)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batch-size", type=int, default=settings.consumer_batch_size,
+                    help="max messages per consume() call; 1 = process one event at a time")
+    ap.add_argument("--max-wait-ms", type=int, default=settings.consumer_batch_max_wait_ms,
+                    help="max time to wait for a batch to fill")
+    ap.add_argument("--reorder-window-ms", type=int, default=settings.reorder_window_ms,
+                    help="hold events this long to restore per-match timestamp order; 0 disables")
+    ap.add_argument("--profile-seconds", type=float, default=settings.profile_seconds,
+                    help="length of each profile capture (kill -USR2 <pid> starts one)")
+    ap.add_argument("--profile-after", type=float, default=None,
+                    help="also capture one profile this many seconds after startup")
+    ap.add_argument("--metrics-port", type=int, default=settings.metrics_port,
+                    help="serve Prometheus metrics on this port; 0 disables")
+    args = ap.parse_args()
+
+    model = FastPredictor(load_model(MODEL_PATH))
+    prod = make_producer()
+    start_services(prod)
+    if start_metrics_server(args.metrics_port):
+        log.info(f"metrics on :{args.metrics_port}/metrics")
+    if install_signal_handler("consumer", args.profile_seconds):
+        log.info(f"kill -USR2 {os.getpid()} writes a {args.profile_seconds:.0f}s profile to {settings.profile_dir}/")
+    if args.profile_after is not None:
+        # after warm-up, so the window shows steady-state load rather than model loading
+        t = threading.Timer(args.profile_after, capture_in_background, ("consumer", args.profile_seconds))
+        t.daemon = True
+        t.start()
+
+    # one consumer for both topics: no idle-topic poll wait, one connection per process
+    c = make_consumer(list(event_kinds()))
+    reorder = ReorderBuffer(args.reorder_window_ms / 1000.0)
+
+    log.info(f"Consumer started (batch_size={args.batch_size}, max_wait_ms={args.max_wait_ms}, "
+             f"reorder_window_ms={args.reorder_window_ms}). Listening to match + player topics...")
+
+    try:
+        if args.batch_size <= 1:
+            run_single(c, model, prod, reorder)
+        else:
+            run_batched(c, model, prod, reorder, args.batch_size, args.max_wait_ms)
+    finally:
         try:
-            c_player.close()
+            c.close()
         except Exception:
             pass
-        prod.flush(2.0)
+        stop_services(prod)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import time
+
+from app.config import settings
+from app.log import get_logger
+
+log = get_logger("consumer_supervisor")
+
+def worker_main(worker_id: int, batch_size: int, max_wait_ms: int):
+    # imported in the child so each process builds its own Kafka/Redis/DB clients
+    from scripts.consumer_predictor import run_partition_worker
+    run_partition_worker(worker_id, batch_size, max_wait_ms)
+
+def spawn(ctx, worker_id: int, args) -> mp.Process:
+    p = ctx.Process(
+        target=worker_main,
+        args=(worker_id, args.batch_size, args.max_wait_ms),
+        name=f"consumer-worker-{worker_id}",
+    )
+    p.start()
+    log.info(f"started worker {worker_id} pid={p.pid}")
+    return p
+
+def main():
+    ap = argparse.ArgumentParser(description="run N partition-parallel consumer_predictor workers")
+    ap.add_argument("--workers", type=int, default=settings.consumer_workers,
+                    help="worker processes; more than the topic partition count leaves some idle")
+    ap.add_argument("--batch-size", type=int, default=settings.consumer_batch_size)
+    ap.add_argument("--max-wait-ms", type=int, default=settings.consumer_batch_max_wait_ms)
+    args = ap.parse_args()
+
+    ctx = mp.get_context("spawn")
+    workers = {i: spawn(ctx, i, args) for i in range(args.workers)}
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    if hasattr(signal, "SIGUSR2"):
+        def forward_profile(signum, frame):
+            # every worker writes its own collapsed-stack file
+            for p in workers.values():
+                if p.is_alive():
+                    os.kill(p.pid, signum)
+        signal.signal(signal.SIGUSR2, forward_profile)
+
+    try:
+        while not stopping:
+            for i, p in list(workers.items()):
+                if not p.is_alive():
+                    log.warning(f"worker {i} exited with code {p.exitcode}, restarting")
+                    workers[i] = spawn(ctx, i, args)
+            time.sleep(1.0)
+    finally:
+        log.info("stopping workers...")
+        for p in workers.values():
+            if p.is_alive():
+                p.terminate()  # SIGTERM -> worker flushes and leaves the group
+        for p in workers.values():
+            p.join(15.0)
+            if p.is_alive():
+                p.kill()
+
+if __name__ == "__main__":
+    main()
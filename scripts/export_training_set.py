@@ -0,0 +1,201 @@
+"""
+Export labeled training data from stored history, for scripts/train_xgb.py.
+
+For every finished match (final score set, finished_at stamped) the match's
+events are replayed from Postgres (app/history.py). A snapshot is taken every
+--every events, as the live consumer predicts, and labeled with the final
+outcome (0=HOME_WIN 1=DRAW 2=AWAY_WIN). Events stream through a server-side
+cursor and rows are written as Parquet chunks of about --chunk-rows (never
+splitting a match), so memory stays bounded by one chunk. match_id and ts are
+kept as extra columns.
+
+Runs are incremental: <out>/_export_state.json records the last exported match
+by (finished_at, id), and the next run only adds matches finished after it.
+Each run first stamps finished_at on matches that have a final score but no
+finished_at yet. --min-age-min keeps matches that just finished (late events,
+slow commits) for a later run. Every chunk also carries the state as of its
+last row in its Parquet metadata, so a crash between writing a chunk and
+saving the state file doesn't export those matches twice.
+
+    python -m scripts.export_training_set --out data/pg
+    python -m scripts.train_xgb --data-dir data/pg --no-generate
+    python -m scripts.export_training_set --out data/pg --full   # drop and re-export everything
+"""
+from __future__ import annotations
+import argparse
+from datetime import datetime, timedelta, timezone
+import glob
+import json
+import os
+import time
+
+import numpy as np
+import pyarrow as pa
+from sqlalchemy import text
+
+from app.config import settings
+from app.datasets import chunk_metadata, chunk_path, write_chunk
+from app.db import engine
+from app.history import create_replay_matches, iter_match_events, snapshot_points
+from app.log import get_logger
+
+log = get_logger("export_training_set")
+
+STATE_FILE = "_export_state.json"
+STATE_META_KEY = "export_state"
+
+# whatever writes the final score may not set finished_at; now() puts these after the current watermark
+STAMP_FINISHED_SQL = """
+UPDATE matches SET finished_at = now()
+WHERE finished_at IS NULL AND final_home_goals IS NOT NULL AND final_away_goals IS NOT NULL
+"""
+
+def outcome_label(home_goals: int, away_goals: int) -> int:
+    return 0 if home_goals > away_goals else 2 if home_goals < away_goals else 1
+
+def watermark(state: dict) -> tuple:
+    return (datetime.fromisoformat(state["finished_at"]), state["match_id"]) if state.get("finished_at") else ()
+
+def load_state(out_dir: str) -> dict:
+    path = os.path.join(out_dir, STATE_FILE)
+    state = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+    # the newest chunk is ahead of the state file if the last run died between the two writes
+    part = next_part(out_dir) - 1
+    if part >= 0:
+        meta = chunk_metadata(chunk_path(out_dir, part)).get(STATE_META_KEY)
+        if meta and watermark(json.loads(meta)) > watermark(state):
+            state = json.loads(meta)
+    return state
+
+def save_state(out_dir: str, state: dict) -> None:
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def next_part(out_dir: str) -> int:
+    parts = glob.glob(os.path.join(out_dir, "part-*.parquet"))
+    return max((int(os.path.basename(p)[5:10]) for p in parts), default=-1) + 1
+
+class ChunkBuffer:
+    # accumulates whole matches' snapshots; write() emits one Parquet chunk
+    def __init__(self):
+        self.X, self.y, self.match_ids, self.ts = [], [], [], []
+        self.n = 0
+
+    def add(self, match_id: str, label: int, ts_list: list, X: np.ndarray):
+        self.X.append(X)
+        self.y.append(np.full(len(X), label, dtype=np.int32))
+        self.match_ids.extend([match_id] * len(X))
+        self.ts.extend(ts_list)
+        self.n += len(X)
+
+    def write(self, path: str, state: dict) -> None:
+        write_chunk(path, np.vstack(self.X), np.concatenate(self.y), extra={
+            "match_id": pa.array(self.match_ids, type=pa.string()),
+            "ts": pa.array(self.ts, type=pa.timestamp("us", tz="UTC")),
+        }, metadata={STATE_META_KEY: json.dumps(state)})
+        self.__init__()
+
+def main():
+    ap = argparse.ArgumentParser(description="export labeled snapshots of finished matches to Parquet chunks")
+    ap.add_argument("--out", required=True, help="dataset directory (created if missing)")
+    ap.add_argument("--every", type=int, default=settings.predict_every_n_events, help="snapshot every N events")
+    ap.add_argument("--chunk-rows", type=int, default=1_000_000)
+    ap.add_argument("--fetch-rows", type=int, default=20_000, help="cursor fetch size")
+    ap.add_argument("--min-age-min", type=float, default=10.0, help="skip matches finished less than this long ago")
+    ap.add_argument("--full", action="store_true", help="delete the existing export in --out and start over")
+    args = ap.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    if args.full:
+        for p in glob.glob(os.path.join(args.out, "part-*.parquet")) + [os.path.join(args.out, STATE_FILE)]:
+            if os.path.exists(p):
+                os.remove(p)
+    state = load_state(args.out)
+    if state and state.get("every") != args.every:
+        raise SystemExit(f"{args.out} was exported with --every {state.get('every')}; use that or --full")
+    state.setdefault("every", args.every)
+    state.setdefault("matches", 0)
+    state.setdefault("rows", 0)
+
+    where = [
+        "m.finished_at IS NOT NULL",
+        "m.final_home_goals IS NOT NULL",
+        "m.final_away_goals IS NOT NULL",
+        "m.finished_at < :cutoff",
+    ]
+    params = {"cutoff": datetime.now(timezone.utc) - timedelta(minutes=args.min_age_min)}
+    if state.get("finished_at"):
+        where.append("(m.finished_at, m.id) > (:wm_ts, :wm_id)")
+        params.update(wm_ts=datetime.fromisoformat(state["finished_at"]), wm_id=state["match_id"])
+
+    with engine.begin() as conn:
+        stamped = conn.execute(text(STAMP_FINISHED_SQL)).rowcount
+    if stamped:
+        log.info(f"stamped finished_at on {stamped} finished matches")
+
+    t0 = time.time()
+    stats = {"matches": 0, "events": 0, "rows": 0, "parts": 0}
+    part = next_part(args.out)
+    buf = ChunkBuffer()
+    pending_matches = 0  # replayed but not yet covered by the saved watermark
+
+    def flush(upto: tuple[datetime, str]):
+        nonlocal part, pending_matches
+        # the watermark only moves past matches whose rows are on disk
+        rows = buf.n
+        state.update(finished_at=upto[0].isoformat(), match_id=upto[1],
+                     matches=state["matches"] + pending_matches, rows=state["rows"] + rows)
+        if rows:
+            buf.write(chunk_path(args.out, part), state)
+            stats["rows"] += rows
+            stats["parts"] += 1
+            part += 1
+        pending_matches = 0
+        save_state(args.out, state)
+
+    with engine.connect() as conn:
+        matches = create_replay_matches(
+            conn,
+            f"SELECT m.id, m.home_team, m.away_team, m.finished_at AS seq_key FROM matches m WHERE {' AND '.join(where)}",
+            params,
+        )
+        if not matches:
+            log.info(f"no matches finished since {state.get('finished_at') or 'the beginning'}")
+            return
+        info = {
+            mid: (finished_at, outcome_label(hg, ag))
+            for mid, finished_at, hg, ag in conn.execute(text(
+                "SELECT m.id, m.finished_at, m.final_home_goals, m.final_away_goals "
+                "FROM matches m JOIN replay_matches r ON r.id = m.id"
+            ))
+        }
+        conn.commit()
+        log.info(f"exporting {len(matches)} matches to {args.out}")
+
+        for mid, events, ts_list in iter_match_events(conn, args.fetch_rows):
+            finished_at, label = info[mid]
+            idx, X = snapshot_points(events, args.every)
+            if len(idx):
+                buf.add(mid, label, [ts_list[i] for i in idx], X)
+            stats["matches"] += 1
+            stats["events"] += len(events)
+            pending_matches += 1
+            if buf.n >= args.chunk_rows:
+                flush((finished_at, mid))
+
+    last = matches[-1][0]
+    flush((info[last][0], last))
+
+    elapsed = time.time() - t0
+    log.info(
+        f"export: {stats} in {elapsed:.1f}s ({stats['events'] / elapsed if elapsed else 0:.0f} events/sec); "
+        f"dataset now {state['matches']} matches, {state['rows']} rows"
+    )
+
+if __name__ == "__main__":
+    main()
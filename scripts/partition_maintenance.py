@@ -0,0 +1,57 @@
+"""
+Keeps the daily partitions of match_events / player_events / predictions in
+shape: creates the next PARTITION_DAYS_AHEAD days, thins old predictions
+partitions (PREDICTIONS_DOWNSAMPLE_AFTER_DAYS), and archives partitions older
+than RETENTION_DAYS to Parquet under ARCHIVE_DIR before dropping them.
+
+    python -m scripts.partition_maintenance              # once (cron, daily)
+    python -m scripts.partition_maintenance --every-min 60
+    python -m scripts.partition_maintenance --dry-run
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+
+from app.config import settings
+from app.db import engine
+from app.log import get_logger
+from app.partitions import apply_retention, ensure_partitions
+
+log = get_logger("partition_maintenance")
+
+def run_once(args) -> dict:
+    created = [] if args.dry_run else ensure_partitions(engine, days_ahead=args.days_ahead)
+    report = apply_retention(
+        engine,
+        retain_days=args.retention_days,
+        archive_dir=args.archive_dir or None,
+        downsample_after_days=args.downsample_after_days,
+        downsample_every_sec=args.downsample_sec,
+        dry_run=args.dry_run,
+    )
+    report["created"] = created
+    return report
+
+def main():
+    ap = argparse.ArgumentParser(description="create future partitions, archive + drop expired ones")
+    ap.add_argument("--days-ahead", type=int, default=settings.partition_days_ahead)
+    ap.add_argument("--retention-days", type=int, default=settings.retention_days, help="0 keeps everything")
+    ap.add_argument("--archive-dir", default=settings.archive_dir, help="empty string drops without exporting")
+    ap.add_argument("--downsample-after-days", type=int, default=settings.predictions_downsample_after_days,
+                    help="thin predictions partitions older than this; 0 disables")
+    ap.add_argument("--downsample-sec", type=int, default=settings.predictions_downsample_sec,
+                    help="keep the newest prediction per match per this many seconds")
+    ap.add_argument("--dry-run", action="store_true", help="only report what would be dropped/downsampled")
+    ap.add_argument("--every-min", type=float, default=0, help="repeat every N minutes instead of running once")
+    args = ap.parse_args()
+
+    while True:
+        report = run_once(args)
+        log.info(json.dumps(report))
+        if args.every_min <= 0:
+            return
+        time.sleep(args.every_min * 60)
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 from __future__ import annotations
 from datetime import datetime, timezone
 import argparse
+import heapq
+import json
+import multiprocessing as mp
 import random
 import time
 import uuid
@@ -17,106 +20,247 @@ PLAYERS = ["Striker A","Winger B","Mid C","Def D","GK E","Striker F","Winger G",
 def utc_now():
     return datetime.now(timezone.utc).isoformat()
 
-def rand_match():
-    home = random.choice(TEAMS)
-    away = random.choice([t for t in TEAMS if t != home])
+def rand_match(rng: random.Random = random):
+    home = rng.choice(TEAMS)
+    away = rng.choice([t for t in TEAMS if t != home])
     return home, away
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--eps", type=float, default=20.0, help="events per second (approx)")
-    ap.add_argument("--matches", type=int, default=3, help="concurrent matches to simulate")
-    args = ap.parse_args()
+class TokenBucket:
+    '''
+    paces sends to `rate` per second on average while allowing bursts of up to
+    `burst`, so the achieved rate doesn't drift with per-message overhead or
+    sleep granularity the way sleeping 1/eps per event does. rate <= 0 = unpaced.
+    '''
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate / 100.0)
+        self.tokens = self.burst
+        self.last = time.perf_counter()
 
-    prod = make_producer()
+    def take(self, n: float = 1.0):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.perf_counter()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            time.sleep((n - self.tokens) / self.rate)
 
-    match_ids = []
-    match_meta = {}
-    for _ in range(args.matches):
-        mid = str(uuid.uuid4())
-        home, away = rand_match()
-        match_ids.append(mid)
-        match_meta[mid] = {"home": home, "away": away}
+class Recorder:
+    # JSON lines of {"t": seconds since start, "topic", "key", "value"}
+    def __init__(self, path: str | None):
+        self.f = open(path, "w") if path else None
+        self.t0 = time.perf_counter()
+
+    def write(self, topic: str, key: str, value: dict):
+        if self.f:
+            self.f.write(json.dumps({"t": time.perf_counter() - self.t0, "topic": topic, "key": key, "value": value}))
+            self.f.write("\n")
 
-        kickoff = {
+    def close(self):
+        if self.f:
+            self.f.close()
+
+def produce(prod, topic: str, value: dict, key: str):
+    while True:
+        try:
+            send_json(prod, topic, value, key=key, poll=False)
+            return
+        except BufferError:
+            prod.poll(0.05)  # local queue full, let librdkafka drain it
+
+def kickoff_event(mid: str, meta: dict) -> dict:
+    return {
+        "match_id": mid,
+        "ts": utc_now(),
+        "minute": 0,
+        "event_type": "kickoff",
+        "team_side": None,
+        "team": None,
+        "player": None,
+        "payload": {},
+        "home_team": meta["home"],
+        "away_team": meta["away"],
+        "competition": "UEFA"
+    }
+
+def random_event(rng: random.Random, mid: str, meta: dict, minute: int) -> tuple[str, dict]:
+    home = meta["home"]
+    away = meta["away"]
+
+    r = rng.random()
+    if r < 0.55:
+        et = rng.choices(
+            ["shot","corner","foul","goal"],
+            weights=[0.55, 0.18, 0.20, 0.07],
+            k=1
+        )[0]
+        team_side = rng.choice(["home", "away"])
+        payload = {}
+        if et in ("shot","goal"):
+            payload["xg"] = round(rng.uniform(0.02, 0.35), 3)
+
+        return settings.topic_match_events, {
             "match_id": mid,
             "ts": utc_now(),
-            "minute": 0,
-            "event_type": "kickoff",
-            "team_side": None,
-            "team": None,
-            "player": None,
-            "payload": {},
+            "minute": minute,
+            "event_type": et,
+            "team_side": team_side,
+            "team": home if team_side == "home" else away,
+            "player": rng.choice(PLAYERS),
+            "payload": payload,
             "home_team": home,
             "away_team": away,
             "competition": "UEFA"
         }
-        send_json(prod, settings.topic_match_events, kickoff)
 
-    prod.flush(2.0)
-    log.info(f"Started simulator for {args.matches} matches at ~{args.eps} eps")
+    team_side = rng.choice(["home", "away"])
+    return settings.topic_player_events, {
+        "match_id": mid,
+        "ts": utc_now(),
+        "minute": minute,
+        "player": rng.choice(PLAYERS),
+        "team_side": team_side,
+        "team": home if team_side == "home" else away,
+        "stat_type": rng.choice(["xg","pass","tackle"]),
+        "value": round(rng.uniform(0.01, 0.25), 3),
+        "payload": {},
+        "home_team": home,
+        "away_team": away,
+        "competition": "UEFA"
+    }
 
-    minute = {mid: 0 for mid in match_ids}
-    last_minute_tick = time.time()
+def run_generator(worker: int, args, eps: float, n_matches: int, record_path: str | None):
+    '''
+    one generator process. with a seed, the sequence of matches and events is
+    reproducible (timestamps are wall clock); each match advances one minute
+    every --events-per-minute of its own events.
+    '''
+    seed = None if args.seed is None else args.seed + worker
+    rng = random.Random(seed)
+    prod = make_producer()
+    rec = Recorder(record_path)
+    bucket = TokenBucket(eps)
+
+    match_ids = []
+    match_meta = {}
+    for _ in range(n_matches):
+        mid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        home, away = rand_match(rng)
+        match_ids.append(mid)
+        match_meta[mid] = {"home": home, "away": away}
 
+        kickoff = kickoff_event(mid, match_meta[mid])
+        produce(prod, settings.topic_match_events, kickoff, mid)
+        rec.write(settings.topic_match_events, mid, kickoff)
+
+    prod.flush(10.0)
+    log.info(f"[{worker}] started {n_matches} matches at {eps:.0f} eps (seed={seed})")
+
+    n_events = {mid: 0 for mid in match_ids}
+    sent = 0
+    t_start = last_log = time.time()
     try:
-        while True:
-            if time.time() - last_minute_tick > 1.5:
-                for mid in match_ids:
-                    minute[mid] += 1
-                last_minute_tick = time.time()
-
-            mid = random.choice(match_ids)
-            home = match_meta[mid]["home"]
-            away = match_meta[mid]["away"]
-
-            r = random.random()
-            if r < 0.55:
-                et = random.choices(
-                    ["shot","corner","foul","goal"],
-                    weights=[0.55, 0.18, 0.20, 0.07],
-                    k=1
-                )[0]
-                team_side = random.choice(["home", "away"])
-                payload = {}
-                if et in ("shot","goal"):
-                    payload["xg"] = round(random.uniform(0.02, 0.35), 3)
-
-                ev = {
-                    "match_id": mid,
-                    "ts": utc_now(),
-                    "minute": minute[mid],
-                    "event_type": et,
-                    "team_side": team_side,
-                    "team": home if team_side == "home" else away,
-                    "player": random.choice(PLAYERS),
-                    "payload": payload,
-                    "home_team": home,
-                    "away_team": away,
-                    "competition": "UEFA"
-                }
-                send_json(prod, settings.topic_match_events, ev)
-            else:
-                team_side = random.choice(["home", "away"])
-                ev = {
-                    "match_id": mid,
-                    "ts": utc_now(),
-                    "minute": minute[mid],
-                    "player": random.choice(PLAYERS),
-                    "team_side": team_side,
-                    "team": home if team_side == "home" else away,
-                    "stat_type": random.choice(["xg","pass","tackle"]),
-                    "value": round(random.uniform(0.01, 0.25), 3),
-                    "payload": {},
-                    "home_team": home,
-                    "away_team": away,
-                    "competition": "UEFA"
-                }
-                send_json(prod, settings.topic_player_events, ev)
-
-            time.sleep(max(0.0, 1.0 / args.eps))
+        while args.max_events is None or sent < args.max_events:
+            if args.duration and time.time() - t_start >= args.duration:
+                break
+            bucket.take()
+
+            mid = rng.choice(match_ids)
+            topic, ev = random_event(rng, mid, match_meta[mid], n_events[mid] // args.events_per_minute)
+            n_events[mid] += 1
+            produce(prod, topic, ev, mid)
+            rec.write(topic, mid, ev)
+            sent += 1
+
+            if sent % 1000 == 0:
+                prod.poll(0)
+            if time.time() - last_log > 2.0:
+                log.info(f"[{worker}] sent={sent} rate={sent / (time.time() - t_start):.0f}/s")
+                last_log = time.time()
     finally:
-        prod.flush(2.0)
+        prod.flush(10.0)
+        rec.close()
+
+def read_records(paths: list[str]):
+    # merge several recordings (one per generator process) by their time offset
+    files = [open(p) for p in paths]
+    try:
+        streams = [(json.loads(line) for line in f) for f in files]
+        yield from heapq.merge(*streams, key=lambda rec: rec["t"])
+    finally:
+        for f in files:
+            f.close()
+
+def replay(args):
+    '''
+    push recorded streams back to Kafka. --speed 1 keeps the original pacing,
+    2 is twice as fast, 0 is as fast as the producer allows.
+    '''
+    prod = make_producer()
+    sent = 0
+    t0 = time.perf_counter()
+    last_log = time.time()
+    try:
+        for rec in read_records(args.replay):
+            if args.speed > 0:
+                delay = rec["t"] / args.speed - (time.perf_counter() - t0)
+                if delay > 0:
+                    time.sleep(delay)
+            value = rec["value"]
+            if args.restamp:
+                value["ts"] = utc_now()
+            produce(prod, rec["topic"], value, rec["key"])
+            sent += 1
+            if sent % 1000 == 0:
+                prod.poll(0)
+            if time.time() - last_log > 2.0:
+                log.info(f"replayed={sent} rate={sent / (time.perf_counter() - t0):.0f}/s")
+                last_log = time.time()
+    finally:
+        prod.flush(10.0)
+    log.info(f"replayed {sent} events in {time.perf_counter() - t0:.1f}s")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--eps", type=float, default=20.0, help="target events per second, total; 0 = unpaced")
+    ap.add_argument("--matches", type=int, default=3, help="concurrent matches to simulate")
+    ap.add_argument("--procs", type=int, default=1, help="generator processes; rate and matches are split between them")
+    ap.add_argument("--seed", type=int, default=None, help="fixed seed for a reproducible event sequence")
+    ap.add_argument("--events-per-minute", type=int, default=5, help="events of a match per simulated match minute")
+    ap.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    ap.add_argument("--max-events", type=int, default=None, help="stop after this many events per process")
+    ap.add_argument("--record", default=None, help="also write the generated stream to this file (.N per process)")
+    ap.add_argument("--replay", nargs="+", default=None, help="replay recorded file(s) instead of generating")
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier; 0 = as fast as possible")
+    ap.add_argument("--restamp", action="store_true", help="replace recorded ts with the current time on replay")
+    args = ap.parse_args()
+
+    if args.replay:
+        replay(args)
+        return
+
+    if args.procs <= 1:
+        run_generator(0, args, args.eps, args.matches, args.record)
+        return
+
+    ctx = mp.get_context("spawn")
+    procs = []
+    for i in range(args.procs):
+        n_matches = args.matches // args.procs + (1 if i < args.matches % args.procs else 0)
+        record_path = f"{args.record}.{i}" if args.record else None
+        p = ctx.Process(target=run_generator, args=(i, args, args.eps / args.procs, max(1, n_matches), record_path))
+        p.start()
+        procs.append(p)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.join(15.0)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,59 @@
+"""
+FastPredictor must score exactly like the booster it was built from. The tree
+walk in app/xgb_model.py reimplements XGBoost's prediction, so this fails as
+soon as the two drift (new XGBoost dump format, objective, early stopping...).
+
+    python -m scripts.test_xgb_parity
+    python -m pytest scripts/test_xgb_parity.py
+"""
+import os
+
+import numpy as np
+import xgboost as xgb
+
+from app.xgb_model import FastPredictor, load_model, train_xgb, train_xgb_booster
+from scripts.train_xgb import sample_snapshots
+
+MODEL_PATH = "xgb_match_outcome.joblib"
+ATOL = 1e-5
+
+def max_abs_diff(model, X: np.ndarray) -> float:
+    fast = FastPredictor(model)
+    expected = model.predict_proba(X)
+    rows = np.array([list(fast.predict_row(x).values()) for x in X])
+    batch = fast.predict_batch_array(X)
+    return float(max(np.abs(rows - expected).max(), np.abs(batch - expected).max()))
+
+def _data(n: int, seed: int):
+    return sample_snapshots(n, np.random.default_rng(seed))
+
+def test_parity_small_model():
+    X, y = _data(3000, 0)
+    model = train_xgb(X, y, n_jobs=1)
+    diff = max_abs_diff(model, _data(500, 1)[0])
+    assert diff < ATOL, f"max abs diff {diff:.2e}"
+
+def test_parity_early_stopped_booster():
+    # the train_xgb --data-dir / tune_xgb path: booster trained directly, trimmed to its best round
+    X, y = _data(3000, 2)
+    Xv, yv = _data(1000, 3)
+    dtrain = xgb.QuantileDMatrix(X, y)
+    dvalid = xgb.QuantileDMatrix(Xv, yv, ref=dtrain)
+    model = train_xgb_booster(dtrain, n_jobs=1, evals=[(dvalid, "valid")], early_stopping_rounds=5,
+                              params=dict(n_estimators=400, learning_rate=0.3, max_depth=6, reg_lambda=1.0,
+                                          random_state=0, objective="multi:softprob", num_class=3,
+                                          eval_metric="mlogloss", tree_method="hist"))
+    diff = max_abs_diff(model, Xv[:500])
+    assert diff < ATOL, f"max abs diff {diff:.2e}"
+
+def test_parity_shipped_model():
+    if not os.path.exists(MODEL_PATH):
+        return  # nothing shipped in this checkout
+    diff = max_abs_diff(load_model(MODEL_PATH), _data(1000, 4)[0])
+    assert diff < ATOL, f"max abs diff {diff:.2e}"
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"{name}: ok")
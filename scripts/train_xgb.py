@@ -1,73 +1,151 @@
+"""
+Trains the match outcome model on synthetic live snapshots.
+
+Snapshots are generated a whole column at a time, and turned into model inputs
+by app/features.py:features_from_state_arrays (the array form of the serving
+path's to_model_row).
+
+    python -m scripts.train_xgb                                   # 20k rows in memory, as before
+    python -m scripts.train_xgb --rows 20000000 --data-dir data/synth --n-jobs 16
+    python -m scripts.train_xgb --data-dir data/pg --no-generate --mode external
+
+With --data-dir the rows are written as Parquet chunks of --chunk-rows. Training
+then streams them into a QuantileDMatrix (--mode quantile) or XGBoost's
+external-memory DMatrix (--mode external, paged to disk), so neither
+generation nor training holds the raw float matrix in memory.
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+import time
+
 import numpy as np
-import pandas as pd
+import xgboost as xgb
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score
-from app.xgb_model import train_xgb, save_model
+from sklearn.metrics import accuracy_score, log_loss
+
+from app.datasets import ChunkIter, chunk_path, chunk_paths, chunk_rows, read_chunk, write_chunk
+from app.features import features_from_state_arrays
+from app.xgb_model import train_xgb, train_xgb_booster, save_model
 
 MODEL_PATH = "xgb_match_outcome.joblib"
 
-def sample_snapshot():
-    minute = np.random.randint(0, 91)
-    home_goals = np.random.binomial(3, 0.25)
-    away_goals = np.random.binomial(3, 0.25)
-    home_xg = np.random.uniform(0, 3.5)
-    away_xg = np.random.uniform(0, 3.5)
-    home_shots = np.random.randint(0, 20)
-    away_shots = np.random.randint(0, 20)
-    home_corners = np.random.randint(0, 10)
-    away_corners = np.random.randint(0, 10)
-    home_fouls = np.random.randint(0, 15)
-    away_fouls = np.random.randint(0, 15)
-
-    goal_diff = home_goals - away_goals
-    xg_diff = home_xg - away_xg
-    shot_diff = home_shots - away_shots
-
-    score = 1.8 * goal_diff + 0.9 * xg_diff + 0.15 * shot_diff + 0.1 * (home_corners - away_corners)
-    score += np.random.normal(0, 0.8)
-
-    if score > 0.8:
-        y = 0  # HOME_WIN
-    elif score < -0.8:
-        y = 2  # AWAY_WIN
-    else:
-        y = 1  # DRAW
-
-    row = {
-        "minute": minute,
-        "goal_diff": goal_diff,
-        "xg_diff": xg_diff,
-        "shot_diff": shot_diff,
-        "corner_diff": home_corners - away_corners,
-        "foul_diff": home_fouls - away_fouls,
-        "home_xg": home_xg,
-        "away_xg": away_xg,
-        "home_shots": home_shots,
-        "away_shots": away_shots,
-        "uncertainty": float(np.exp(-2.0 * (minute / 95.0))),
+def sample_snapshots(n: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    # n snapshots -> (features (n, 11) float32, labels (n,) int32); 0=HOME_WIN 1=DRAW 2=AWAY_WIN
+    s = {
+        "minute": rng.integers(0, 91, n),
+        "home_goals": rng.binomial(3, 0.25, n),
+        "away_goals": rng.binomial(3, 0.25, n),
+        "home_xg": rng.uniform(0, 3.5, n),
+        "away_xg": rng.uniform(0, 3.5, n),
+        "home_shots": rng.integers(0, 20, n),
+        "away_shots": rng.integers(0, 20, n),
+        "home_corners": rng.integers(0, 10, n),
+        "away_corners": rng.integers(0, 10, n),
+        "home_fouls": rng.integers(0, 15, n),
+        "away_fouls": rng.integers(0, 15, n),
     }
-    return row, y
 
-def main(n: int = 20000):
-    data, labels = [], []
-    for _ in range(n):
-        r, y = sample_snapshot()
-        data.append(r)
-        labels.append(y)
+    score = (
+        1.8 * (s["home_goals"] - s["away_goals"])
+        + 0.9 * (s["home_xg"] - s["away_xg"])
+        + 0.15 * (s["home_shots"] - s["away_shots"])
+        + 0.1 * (s["home_corners"] - s["away_corners"])
+        + rng.normal(0, 0.8, n)
+    )
+    y = np.where(score > 0.8, 0, np.where(score < -0.8, 2, 1)).astype(np.int32)
+    return features_from_state_arrays(s), y
+
+def generate_dataset(out_dir: str, rows: int, rows_per_chunk: int, seed: int, overwrite: bool = False) -> int:
+    # chunk i uses seed + i, so any chunk can be regenerated on its own
+    os.makedirs(out_dir, exist_ok=True)
+    # chunk_paths() reads every part in the directory, so leftovers of an older run would be trained on
+    old = glob.glob(os.path.join(out_dir, "part-*.parquet"))
+    if old and not overwrite:
+        raise SystemExit(f"{out_dir} already holds {len(old)} chunks; pass --overwrite to replace them "
+                         f"or --no-generate to train on them")
+    for p in old:
+        os.remove(p)
+    n_chunks = 0
+    for i, start in enumerate(range(0, rows, rows_per_chunk)):
+        X, y = sample_snapshots(min(rows_per_chunk, rows - start), np.random.default_rng(seed + i))
+        write_chunk(chunk_path(out_dir, i), X, y)
+        n_chunks += 1
+    return n_chunks
+
+def split_holdout(paths: list[str], holdout_frac: float) -> tuple[list[str], list[str]]:
+    # whole chunks: the last ceil(frac * chunks) are held out (at least one, if there are two)
+    n_hold = min(len(paths) - 1, max(1, int(np.ceil(len(paths) * holdout_frac)))) if len(paths) > 1 else 0
+    return paths[:len(paths) - n_hold], paths[len(paths) - n_hold:]
+
+def evaluate(model, paths: list[str]) -> tuple[float, float, int]:
+    correct, loss, n = 0, 0.0, 0
+    for p in paths:
+        X, y = read_chunk(p)
+        probs = model.predict_proba(X)
+        correct += int((probs.argmax(axis=1) == y).sum())
+        loss += log_loss(y, probs, labels=[0, 1, 2]) * len(y)
+        n += len(y)
+    return correct / n, loss / n, n
+
+def train_in_memory(args):
+    X, y = sample_snapshots(args.rows, np.random.default_rng(args.seed))
+    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=args.holdout, random_state=42, stratify=y)
+    model = train_xgb(Xtr, ytr, n_jobs=args.n_jobs)
+
+    acc = accuracy_score(yte, model.predict(Xte))
+    print(f"Trained XGBoost on {len(ytr)} rows. Holdout accuracy={acc:.3f} (synthetic).")
+    return model
+
+def train_from_chunks(args):
+    if not args.no_generate:
+        t0 = time.time()
+        n = generate_dataset(args.data_dir, args.rows, args.chunk_rows, args.seed, overwrite=args.overwrite)
+        print(f"Generated {args.rows} rows in {n} chunks under {args.data_dir} ({time.time() - t0:.1f}s)")
+
+    train_paths, holdout_paths = split_holdout(chunk_paths(args.data_dir), args.holdout)
+    t0 = time.time()
+    if args.mode == "external":
+        cache_dir = tempfile.mkdtemp(prefix="xgb_cache_", dir=args.cache_dir)
+        try:
+            dtrain = xgb.DMatrix(ChunkIter(train_paths, cache_prefix=os.path.join(cache_dir, "train")))
+            model = train_xgb_booster(dtrain, n_jobs=args.n_jobs)
+            del dtrain  # releases the cache pages before the directory goes
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    else:
+        dtrain = xgb.QuantileDMatrix(ChunkIter(train_paths), max_bin=256, nthread=args.n_jobs)
+        model = train_xgb_booster(dtrain, n_jobs=args.n_jobs)
+    print(f"Trained XGBoost ({args.mode}) on {chunk_rows(train_paths)} rows, "
+          f"{len(train_paths)} train chunks in {time.time() - t0:.1f}s")
 
-    df = pd.DataFrame(data)
-    X = df.values.astype(np.float32)
-    y = np.array(labels, dtype=np.int32)
+    if holdout_paths:
+        acc, loss, n = evaluate(model, holdout_paths)
+        print(f"Holdout ({n} rows): accuracy={acc:.3f} logloss={loss:.4f}")
+    return model
 
-    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-    model = train_xgb(Xtr, ytr)
+def main():
+    ap = argparse.ArgumentParser(description="train the match outcome model")
+    ap.add_argument("--rows", type=int, default=20000, help="synthetic rows to generate")
+    ap.add_argument("--data-dir", default=None, help="write/read Parquet chunks here instead of training in memory")
+    ap.add_argument("--no-generate", action="store_true", help="train on the chunks already in --data-dir")
+    ap.add_argument("--overwrite", action="store_true", help="delete the chunks already in --data-dir before generating")
+    ap.add_argument("--chunk-rows", type=int, default=1_000_000)
+    ap.add_argument("--mode", choices=["quantile", "external"], default="quantile",
+                    help="chunked training: in-memory QuantileDMatrix or disk-paged external memory")
+    ap.add_argument("--cache-dir", default=None, help="where --mode external pages its data")
+    ap.add_argument("--holdout", type=float, default=0.2, help="fraction held out (chunks, with --data-dir)")
+    ap.add_argument("--n-jobs", type=int, default=None, help="XGBoost threads (default: all cores)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=MODEL_PATH)
+    args = ap.parse_args()
 
-    pred = model.predict(Xte)
-    acc = accuracy_score(yte, pred)
-    print(f"Trained XGBoost. Holdout accuracy={acc:.3f} (synthetic).")
+    model = train_from_chunks(args) if args.data_dir else train_in_memory(args)
 
-    save_model(model, MODEL_PATH)
-    print(f"Saved model to {MODEL_PATH}")
+    save_model(model, args.out)
+    print(f"Saved model to {args.out}")
 
 if __name__ == "__main__":
     main()
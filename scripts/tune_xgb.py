@@ -0,0 +1,173 @@
+"""
+Random search over the match outcome model's XGBoost parameters.
+
+Trials run in a process pool, --procs at a time, each booster limited to
+--threads-per-trial threads (default: procs * threads = cores, so trials never
+oversubscribe). Every trial starts from app/xgb_model.XGB_PARAMS, overrides
+the sampled parameters, and trains up to --max-rounds with early stopping on
+the validation mlogloss. Each worker builds the train/validation QuantileDMatrix
+once and reuses it for all its trials.
+
+Data is either synthetic (--rows, same generator as train_xgb.py) or a chunk
+directory (--data-dir, from train_xgb.py --data-dir or export_training_set.py;
+the last --holdout of the chunks validate). Each worker holds its own copy, so
+for big datasets use fewer procs with more threads each.
+
+The leaderboard (--leaderboard, JSON, best mlogloss first) is rewritten after
+every trial; --out saves the best trial's model, ready to serve.
+
+    python -m scripts.tune_xgb --trials 64 --threads-per-trial 2
+    python -m scripts.tune_xgb --data-dir data/pg --trials 100 --out xgb_tuned.joblib
+"""
+from __future__ import annotations
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+
+from app.log import get_logger
+
+log = get_logger("tune_xgb")
+
+# name -> (kind, low, high); "log" samples log-uniformly
+SEARCH_SPACE = {
+    "max_depth": ("int", 3, 10),
+    "learning_rate": ("log", 0.01, 0.3),
+    "subsample": ("uniform", 0.5, 1.0),
+    "colsample_bytree": ("uniform", 0.5, 1.0),
+    "min_child_weight": ("log", 0.5, 20.0),
+    "reg_lambda": ("log", 0.01, 10.0),
+    "gamma": ("uniform", 0.0, 2.0),
+}
+
+def sample_params(rng: np.random.Generator) -> dict:
+    out = {}
+    for name, (kind, lo, hi) in SEARCH_SPACE.items():
+        if kind == "int":
+            out[name] = int(rng.integers(lo, hi + 1))
+        elif kind == "log":
+            out[name] = float(np.exp(rng.uniform(np.log(lo), np.log(hi))))
+        else:
+            out[name] = float(rng.uniform(lo, hi))
+    return out
+
+# per worker process, set by init_worker
+_DATA: dict = {}
+
+def init_worker(args):
+    import xgboost as xgb
+
+    if args.data_dir:
+        from app.datasets import ChunkIter, chunk_paths
+        from scripts.train_xgb import split_holdout
+
+        train_paths, valid_paths = split_holdout(chunk_paths(args.data_dir), args.holdout)
+        if not valid_paths:
+            raise SystemExit(f"{args.data_dir} needs at least two chunks to hold one out")
+        dtrain = xgb.QuantileDMatrix(ChunkIter(train_paths), nthread=args.threads_per_trial)
+        dvalid = xgb.QuantileDMatrix(ChunkIter(valid_paths), ref=dtrain, nthread=args.threads_per_trial)
+    else:
+        from sklearn.model_selection import train_test_split
+        from scripts.train_xgb import sample_snapshots
+
+        X, y = sample_snapshots(args.rows, np.random.default_rng(args.seed))
+        Xtr, Xva, ytr, yva = train_test_split(X, y, test_size=args.holdout, random_state=42, stratify=y)
+        dtrain = xgb.QuantileDMatrix(Xtr, ytr, nthread=args.threads_per_trial)
+        dvalid = xgb.QuantileDMatrix(Xva, yva, ref=dtrain, nthread=args.threads_per_trial)
+    _DATA.update(dtrain=dtrain, dvalid=dvalid, valid_y=dvalid.get_label().astype(np.int32))
+
+def run_trial(trial: int, params: dict, args) -> dict:
+    from app.xgb_model import XGB_PARAMS, train_xgb_booster
+
+    t0 = time.time()
+    evals_result: dict = {}
+    model = train_xgb_booster(
+        _DATA["dtrain"],
+        n_jobs=args.threads_per_trial,
+        evals=[(_DATA["dvalid"], "valid")],
+        params=dict(XGB_PARAMS, **params, n_estimators=args.max_rounds),
+        early_stopping_rounds=args.early_stopping,
+        evals_result=evals_result,
+    )
+    curve = evals_result["valid"]["mlogloss"]
+    best = int(np.argmin(curve))
+    pred = model.get_booster().predict(_DATA["dvalid"]).argmax(axis=1)
+    return {
+        "trial": trial,
+        "mlogloss": float(curve[best]),
+        "accuracy": float((pred == _DATA["valid_y"]).mean()),
+        "rounds": best + 1,
+        "sec": round(time.time() - t0, 1),
+        "params": params,
+        "model": bytes(model.get_booster().save_raw("ubj")) if args.out else None,
+    }
+
+def write_leaderboard(path: str, results: list[dict], meta: dict) -> None:
+    board = sorted(results, key=lambda r: r["mlogloss"])
+    doc = dict(meta, trials_done=len(board),
+               results=[{k: v for k, v in r.items() if k != "model"} for r in board])
+    with open(path + ".tmp", "w") as f:
+        json.dump(doc, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def main():
+    ap = argparse.ArgumentParser(description="parallel random search over XGBoost parameters")
+    ap.add_argument("--trials", type=int, default=32)
+    ap.add_argument("--threads-per-trial", type=int, default=2, help="booster threads per trial")
+    ap.add_argument("--procs", type=int, default=None, help="concurrent trials (default: cores // threads-per-trial)")
+    ap.add_argument("--rows", type=int, default=200_000, help="synthetic rows (without --data-dir)")
+    ap.add_argument("--data-dir", default=None, help="Parquet chunk directory to tune on")
+    ap.add_argument("--holdout", type=float, default=0.2, help="validation fraction (chunks, with --data-dir)")
+    ap.add_argument("--max-rounds", type=int, default=2000)
+    ap.add_argument("--early-stopping", type=int, default=50, help="rounds without mlogloss improvement")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--leaderboard", default="xgb_leaderboard.json")
+    ap.add_argument("--out", default=None, help="save the best trial's model here")
+    args = ap.parse_args()
+
+    procs = args.procs or max(1, (os.cpu_count() or 1) // args.threads_per_trial)
+    rng = np.random.default_rng(args.seed)
+    trials = [sample_params(rng) for _ in range(args.trials)]
+    meta = {
+        "data": args.data_dir or f"synthetic:{args.rows}:seed={args.seed}",
+        "procs": procs,
+        "threads_per_trial": args.threads_per_trial,
+        "max_rounds": args.max_rounds,
+        "early_stopping": args.early_stopping,
+    }
+    log.info(f"{args.trials} trials, {procs} at a time x {args.threads_per_trial} threads")
+
+    t0 = time.time()
+    results: list[dict] = []
+    best = None
+    with ProcessPoolExecutor(procs, mp_context=mp.get_context("spawn"),
+                             initializer=init_worker, initargs=(args,)) as ex:
+        futures = [ex.submit(run_trial, i, p, args) for i, p in enumerate(trials)]
+        for fut in as_completed(futures):
+            r = fut.result()
+            if best is None or r["mlogloss"] < best["mlogloss"]:
+                best = r
+            results.append({k: v for k, v in r.items() if k != "model"})
+            write_leaderboard(args.leaderboard, results, meta)
+            log.info(
+                f"trial {r['trial']}: mlogloss={r['mlogloss']:.4f} acc={r['accuracy']:.3f} "
+                f"rounds={r['rounds']} ({r['sec']}s); best so far {best['mlogloss']:.4f} (trial {best['trial']})"
+            )
+
+    log.info(f"{args.trials} trials in {time.time() - t0:.1f}s; best trial {best['trial']}: "
+             f"mlogloss={best['mlogloss']:.4f} {best['params']}")
+    if args.out:
+        import xgboost as xgb
+        from app.xgb_model import booster_to_classifier, save_model
+
+        booster = xgb.Booster()
+        booster.load_model(bytearray(best["model"]))
+        save_model(booster_to_classifier(booster), args.out)
+        log.info(f"saved best model to {args.out}")
+
+if __name__ == "__main__":
+    main()